@@ -0,0 +1,155 @@
+"""
+Synthetic corpora for benchmarks. Every generator is seeded, so a corpus is identical across runs.
+"""
+import os
+import random
+from typing import Callable, Dict, List
+
+# Mostly common words, plus identifiers and codes that keyword search should find exactly
+ENGLISH_WORDS = (
+    "the of and to in is for on with as by at from that this be are it or an was not have "
+    "index search query vector embedding chunk file directory cache server client request "
+    "response latency throughput memory disk network thread pool batch queue token model "
+    "config error retry timeout connection database storage manifest watcher filter result"
+).split()
+
+IDENTIFIERS = (
+    "get_user_name parseConfigFile HTTPServer ERR_CONN_RESET max_batch_tokens RAGStorage "
+    "search_rag_impl read_raw_file chunk_text E1042 0x7f3a ValueError asyncio.gather"
+).split()
+
+CJK_WORDS = (
+    "数据 索引 检索 向量 文件 目录 缓存 服务器 客户端 请求 响应 延迟 吞吐量 内存 磁盘 网络 线程 "
+    "批量 队列 模型 配置 错误 重试 超时 连接 数据库 存储 过滤 结果 中文 测试 性能 分块 关键词"
+).split()
+
+def _english_paragraph(rng: random.Random, words: int) -> str:
+    out = []
+    for i in range(words):
+        out.append(rng.choice(IDENTIFIERS) if rng.random() < 0.03 else rng.choice(ENGLISH_WORDS))
+    return " ".join(out).capitalize() + "."
+
+def _cjk_paragraph(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(CJK_WORDS) for _ in range(words)) + "。"
+
+def _document(rng: random.Random, size: int, cjk_ratio: float = 0.0) -> str:
+    """Markdown-ish text of about `size` characters."""
+    parts = []
+    length = 0
+    section = 0
+    while length < size:
+        if rng.random() < 0.1:
+            section += 1
+            part = f"## Section {section}"
+        elif rng.random() < cjk_ratio:
+            part = _cjk_paragraph(rng, rng.randint(10, 60))
+        else:
+            part = _english_paragraph(rng, rng.randint(20, 120))
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts) + "\n"
+
+def _write(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def small_files(root: str, scale: float = 1.0, seed: int = 1) -> List[str]:
+    """Many small Markdown and Python files spread over nested directories."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(max(1, int(2000 * scale))):
+        ext = ".md" if i % 3 else ".py"
+        path = os.path.join(root, f"pkg{i % 20}", f"mod{i % 7}", f"file{i}{ext}")
+        _write(path, _document(rng, rng.randint(500, 4000)))
+        paths.append(path)
+    return paths
+
+def huge_files(root: str, scale: float = 1.0, seed: int = 2) -> List[str]:
+    """A few files large enough to be streamed (above the default 16MB stream threshold at scale 1)."""
+    rng = random.Random(seed)
+    paths = []
+    target = int(24 * 1024 * 1024 * scale)
+    block = _document(rng, 64 * 1024)
+    for i in range(3):
+        path = os.path.join(root, f"huge{i}.txt")
+        os.makedirs(root, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            written = 0
+            n = 0
+            while written < target:
+                # Tag every paragraph so chunks stay unique and aren't served by the embedding cache
+                text = f"# Part {i}-{n}\n\n" + block.replace("\n\n", f" [{i}-{n}]\n\n")
+                f.write(text)
+                written += len(text)
+                n += 1
+        paths.append(path)
+    return paths
+
+def mixed_cjk(root: str, scale: float = 1.0, seed: int = 3) -> List[str]:
+    """Medium-sized documents mixing Chinese and English paragraphs."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(max(1, int(500 * scale))):
+        path = os.path.join(root, f"docs{i % 10}", f"doc{i}.md")
+        _write(path, _document(rng, rng.randint(2000, 20000), cjk_ratio=0.5))
+        paths.append(path)
+    return paths
+
+def source_repo(root: str, scale: float = 1.0, seed: int = 5) -> List[str]:
+    """
+    A project whose sources are a small part of the tree: installed dependencies, a build directory
+    listed in .gitignore, lockfiles, minified bundles and extensionless binaries.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for i in range(max(1, int(200 * scale))):
+        ext = ".md" if i % 4 == 0 else ".py"
+        path = os.path.join(root, "src", f"pkg{i % 10}", f"module{i}{ext}")
+        _write(path, _document(rng, rng.randint(500, 4000)))
+        paths.append(path)
+    # Dependencies: many small files in deep directories, which is what makes them slow to scan
+    for i in range(max(1, int(4000 * scale))):
+        path = os.path.join(root, "node_modules", f"dep{i % 200}", "lib", f"part{i % 5}", f"index{i}.ts")
+        _write(path, _document(rng, rng.randint(200, 2000)))
+        paths.append(path)
+    for i in range(max(1, int(400 * scale))):
+        path = os.path.join(root, "build", f"out{i % 20}", f"bundle{i}.txt")
+        _write(path, _document(rng, rng.randint(1000, 4000)))
+        paths.append(path)
+    _write(os.path.join(root, ".gitignore"), "build/\n*.log\n")
+    for name in ("package-lock.json", "poetry.lock"):
+        _write(os.path.join(root, name), _document(rng, 200000))
+        paths.append(os.path.join(root, name))
+    for i in range(max(1, int(100 * scale))):
+        path = os.path.join(root, "assets", f"blob{i}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(rng.randbytes(rng.randint(4096, 65536)))
+        paths.append(path)
+    return paths
+
+CORPORA: Dict[str, Callable[..., List[str]]] = {
+    "small_files": small_files,
+    "huge_files": huge_files,
+    "mixed_cjk": mixed_cjk,
+    "source_repo": source_repo,
+}
+
+def queries(seed: int = 4, count: int = 200) -> List[str]:
+    """Distinct search queries mixing plain words, identifiers and Chinese, so the query cache never hits."""
+    rng = random.Random(seed)
+    result = []
+    seen = set()
+    while len(result) < count:
+        kind = rng.random()
+        if kind < 0.4:
+            query = " ".join(rng.sample(ENGLISH_WORDS, rng.randint(2, 4)))
+        elif kind < 0.6:
+            query = rng.choice(IDENTIFIERS) + " " + rng.choice(ENGLISH_WORDS)
+        else:
+            query = "".join(rng.sample(CJK_WORDS, rng.randint(1, 3)))
+        if query not in seen:
+            seen.add(query)
+            result.append(query)
+    return result
@@ -0,0 +1,133 @@
+"""
+Deterministic OpenAI-compatible /embeddings server for benchmarks.
+
+Every text gets a unit vector seeded from its sha256, so repeated runs produce identical
+indexes, and the server adds a configurable latency to each request to stand in for a model.
+
+    python benchmarks/mock_embedding_server.py --port 18080 --dim 1024 --latency 0.05
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Annotated, List
+
+import numpy as np
+import typer
+
+def embed_text(text: str, dim: int) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+class MockEmbeddingServer:
+    """
+    Runs in a background thread; `url` is the base_url to put in the llm config.
+    Latency per request is `latency + latency_per_text * len(input)` seconds.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 256,
+                 latency: float = 0.0, latency_per_text: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-embeddings", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this, Nagle + delayed ACK add ~40ms per request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                out = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith("/embeddings"):
+                    self._send_json(404, {"error": "not found"})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                texts = body.get("input", [])
+                if isinstance(texts, str):
+                    texts = [texts]
+                with server._lock:
+                    server.requests += 1
+                    server.texts += len(texts)
+                delay = server.latency + server.latency_per_text * len(texts)
+                if delay > 0:
+                    time.sleep(delay)
+                self._send_json(200, {
+                    "object": "list",
+                    "model": body.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": embed_text(text, server.dim)}
+                        for i, text in enumerate(texts)
+                    ]
+                })
+
+            def do_GET(self):
+                # Request counters, handy when the server runs as a separate process
+                self._send_json(200, server.stats())
+
+        return Handler
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "texts": self.texts}
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.texts = 0
+
+    def start(self) -> "MockEmbeddingServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockEmbeddingServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main(
+    host: Annotated[str, typer.Option(help="Address to listen on")] = "127.0.0.1",
+    port: Annotated[int, typer.Option(help="Port to listen on")] = 18080,
+    dim: Annotated[int, typer.Option(help="Embedding dimensionality")] = 256,
+    latency: Annotated[float, typer.Option(help="Seconds added to every request")] = 0.0,
+    latency_per_text: Annotated[float, typer.Option(help="Seconds added per input text")] = 0.0,
+):
+    server = MockEmbeddingServer(host, port, dim, latency, latency_per_text)
+    print(f"Mock embedding server on {server.url} (dim={dim}, latency={latency}s + {latency_per_text}s/text)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,120 @@
+"""
+Recall, memory and latency of the vector store layouts on a benchmark corpus.
+
+    uv run python benchmarks/quantization.py --corpus mixed_cjk --scale 0.25 --dim 1024
+
+The corpus is chunked like the indexer does and embedded with the mock server's deterministic
+vectors (no server needed). Each query is a chunk vector plus noise, so it has a true nearest
+neighbour. Recall@k is measured against an exact float32 scan. Mock vectors are random, which makes
+neighbours harder to tell apart than real embeddings: read the numbers as a lower bound.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Annotated, Dict, List, Optional
+
+import chromadb
+import numpy as np
+import typer
+
+from corpora import CORPORA
+from mock_embedding_server import embed_text
+from rag_mcp.chunking import get_chunker
+from rag_mcp.config import ProcessingConfig
+from rag_mcp.vectors import QuantizedVectorStore
+
+def _chunks(corpus: str, scale: float, workdir: str) -> List[str]:
+    chunks = []
+    config = ProcessingConfig()
+    for path in CORPORA[corpus](os.path.join(workdir, "corpus"), scale):
+        with open(path, encoding='utf-8') as f:
+            chunks.extend(get_chunker(config, path).split(f.read()))
+    return chunks
+
+def _dir_mb(path: str, names: Optional[List[str]] = None) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if names is None or name in names:
+                # Allocated blocks, since the memory-mapped files are sparse
+                total += os.stat(os.path.join(root, name)).st_blocks * 512
+    return round(total / (1024 * 1024), 2)
+
+def _recall(found: List[List[str]], truth: List[List[str]]) -> float:
+    return round(float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])), 4)
+
+def _latency(seconds: List[float]) -> dict:
+    ms = np.array(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3)}
+
+def main(
+    corpus: Annotated[str, typer.Option(help=f"Corpus to use: {', '.join(CORPORA)}")] = "small_files",
+    scale: Annotated[float, typer.Option(help="Multiplier for corpus size")] = 0.25,
+    dim: Annotated[int, typer.Option(help="Embedding dimensionality")] = 1024,
+    queries: Annotated[int, typer.Option(help="Number of queries")] = 200,
+    k: Annotated[int, typer.Option(help="Results per query (the k of recall@k)")] = 10,
+    noise: Annotated[float, typer.Option(help="Norm of the noise added to a chunk vector to make a query")] = 0.5,
+    rerank_candidates: Annotated[int, typer.Option(help="Quantized candidates per result for the full-precision rerank")] = 4,
+    output: Annotated[Optional[str], typer.Option("--output", "-o", help="Also write the results as JSON")] = None,
+):
+    workdir = tempfile.mkdtemp(prefix="rag_mcp_quant_")
+    try:
+        start = time.perf_counter()
+        chunks = _chunks(corpus, scale, workdir)
+        vectors = np.array([embed_text(chunk, dim) for chunk in chunks], dtype=np.float32)
+        ids = [str(i) for i in range(len(chunks))]
+        print(f"{corpus}: {len(chunks)} chunks of dim {dim}, embedded in {time.perf_counter() - start:.1f}s")
+
+        rng = np.random.default_rng(0)
+        targets = rng.integers(0, len(chunks), size=queries)
+        query_vectors = vectors[targets] + rng.standard_normal((queries, dim)).astype(np.float32) * noise / np.sqrt(dim)
+        # Exact squared L2 neighbours
+        distances = (vectors ** 2).sum(axis=1)[None, :] - 2 * query_vectors @ vectors.T
+        truth = [[ids[i] for i in np.argsort(row)[:k]] for row in distances]
+
+        results: Dict[str, dict] = {}
+
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        collection = client.create_collection("bench")
+        for begin in range(0, len(ids), 5000):
+            collection.add(ids=ids[begin:begin + 5000], embeddings=vectors[begin:begin + 5000])
+        found, seconds = [], []
+        for q in query_vectors:
+            start = time.perf_counter()
+            found.append(collection.query(query_embeddings=[q], n_results=k, include=[])['ids'][0])
+            seconds.append(time.perf_counter() - start)
+        results["chroma_hnsw_float32"] = {"recall": _recall(found, truth), "disk_mb": _dir_mb(os.path.join(workdir, "chroma")), **_latency(seconds)}
+
+        for kind in ("float16", "int8"):
+            for keep_full in (False, True):
+                path = os.path.join(workdir, f"{kind}_{keep_full}")
+                store = QuantizedVectorStore(path, kind, keep_full=keep_full)
+                store.add(ids, vectors)
+                found, seconds = [], []
+                for q in query_vectors:
+                    start = time.perf_counter()
+                    found.append([doc_id for doc_id, _ in store.search(q, k, rerank_candidates=rerank_candidates)])
+                    seconds.append(time.perf_counter() - start)
+                store.close()
+                name = f"{kind}_rerank" if keep_full else kind
+                results[name] = {
+                    "recall": _recall(found, truth),
+                    "disk_mb": _dir_mb(path),
+                    # What a scan pages in; the float32 file is only read for rerank candidates
+                    "scanned_mb": _dir_mb(path, ["codes.bin", "scales.bin", "norms.bin"]),
+                    **_latency(seconds),
+                }
+
+        print(f"\n{'layout':<22}{'recall@' + str(k):>10}{'disk MB':>10}{'scan MB':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for name, r in results.items():
+            print(f"{name:<22}{r['recall']:>10}{r['disk_mb']:>10}{r.get('scanned_mb', '-'):>10}{r['p50_ms']:>10}{r['p95_ms']:>10}")
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump({"corpus": corpus, "chunks": len(chunks), "dim": dim, "k": k, "noise": noise, "results": results}, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,256 @@
+"""
+Indexing and search benchmarks against a local mock embedding server.
+
+    uv run python benchmarks/run.py --scale 0.25 --output results.json
+
+Each corpus runs in its own process, so peak RSS is measured per scenario. Results are written
+as JSON; compare two runs with
+`python benchmarks/run.py --compare old.json --compare new.json`.
+"""
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Annotated, Dict, List, Optional
+
+import httpx
+import numpy as np
+import typer
+import yaml
+
+from corpora import CORPORA, queries
+from mock_embedding_server import MockEmbeddingServer
+
+SEARCH_MODES = ["hybrid", "vector", "lexical"]
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _server_stats(url: str) -> dict:
+    return httpx.get(url.rsplit('/v1', 1)[0] + "/stats").json()
+
+def _latency_summary(latencies: List[float]) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "queries": len(latencies),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+def run_scenario(corpus: str, scale: float, workdir: str, server_url: str, query_count: int,
+                 modes: List[str], n_results: int, config_overrides: dict, batch_size: int = 0) -> dict:
+    """Generate one corpus, index it, re-index it unchanged, then time searches. Runs in a child process."""
+    corpus_dir = os.path.join(workdir, corpus)
+    start = time.perf_counter()
+    paths = CORPORA[corpus](corpus_dir, scale)
+    generate_seconds = time.perf_counter() - start
+    corpus_bytes = sum(os.path.getsize(path) for path in paths)
+
+    config_path = os.path.join(workdir, f"{corpus}.yaml")
+    config_data = {"llm": {"base_url": server_url}, "model": {"name": "mock-embedding"}}
+    for section, values in config_overrides.items():
+        config_data.setdefault(section, {}).update(values)
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config_data, f)
+    os.environ["RAG_MCP_CONFIG"] = config_path
+    os.environ["RAG_MCP_SERVE_DIR"] = corpus_dir
+
+    # Imported here so the child's RSS includes them and the parent stays light
+    from rag_mcp.config import load_config
+    from rag_mcp.indexer import Indexer
+    from rag_mcp import server
+
+    config = load_config(config_path)
+    before = _server_stats(server_url)
+    indexer = Indexer(corpus_dir, config)
+    start = time.perf_counter()
+    indexer.index()
+    index_seconds = time.perf_counter() - start
+    after = _server_stats(server_url)
+    chunks = indexer.storage.collection.count()
+
+    start = time.perf_counter()
+    Indexer(corpus_dir, config, storage=indexer.storage).index()
+    reindex_seconds = time.perf_counter() - start
+    reindex_requests = _server_stats(server_url)["requests"] - after["requests"]
+    indexer.storage.close()
+
+    search = {}
+    for mode in modes:
+        # A fresh query set per mode, so no mode benefits from another's query cache
+        latencies = []
+        for query in queries(seed=10 + SEARCH_MODES.index(mode), count=query_count):
+            start = time.perf_counter()
+            response = json.loads(server.search_rag_impl(query, None, n_results, mode))
+            latencies.append(time.perf_counter() - start)
+            if response["code"] != 200:
+                raise RuntimeError(f"{mode} search failed: {response['message']}")
+        search[mode] = _latency_summary(latencies)
+
+    # The same number of queries sent through search_rag_batch, latency per call
+    search_batch = {}
+    for mode in modes if batch_size > 0 else []:
+        latencies = []
+        batch_queries = queries(seed=20 + SEARCH_MODES.index(mode), count=query_count)
+        for begin in range(0, len(batch_queries), batch_size):
+            start = time.perf_counter()
+            response = json.loads(server.search_rag_batch_impl(batch_queries[begin:begin + batch_size], None, n_results, mode))
+            latencies.append(time.perf_counter() - start)
+            if response["code"] != 200:
+                raise RuntimeError(f"{mode} batch search failed: {response['message']}")
+        search_batch[mode] = dict(_latency_summary(latencies), batch_size=batch_size)
+
+    return {
+        "corpus": corpus,
+        "files": len(paths),
+        "corpus_mb": round(corpus_bytes / (1024 * 1024), 2),
+        "generate_seconds": round(generate_seconds, 3),
+        "index": {
+            "seconds": round(index_seconds, 3),
+            "files_per_s": round(len(paths) / index_seconds, 1),
+            "chunks": chunks,
+            "chunks_per_s": round(chunks / index_seconds, 1),
+            "mb_per_s": round(corpus_bytes / (1024 * 1024) / index_seconds, 2),
+            "embed_requests": after["requests"] - before["requests"],
+            "embedded_texts": after["texts"] - before["texts"],
+        },
+        "reindex_unchanged": {
+            "seconds": round(reindex_seconds, 3),
+            "embed_requests": reindex_requests,
+        },
+        "search": search,
+        "search_batch": search_batch,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _print_summary(result: dict):
+    index = result["index"]
+    print(f"\n== {result['corpus']}: {result['files']} files, {result['corpus_mb']} MB, {index['chunks']} chunks")
+    print(f"   index    {index['seconds']}s  {index['files_per_s']} files/s  {index['chunks_per_s']} chunks/s  "
+          f"{index['embed_requests']} embed requests")
+    print(f"   re-index {result['reindex_unchanged']['seconds']}s  {result['reindex_unchanged']['embed_requests']} embed requests")
+    for mode, latency in result["search"].items():
+        print(f"   search {mode:<8} p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms")
+    for mode, latency in result.get("search_batch", {}).items():
+        print(f"   batch of {latency['batch_size']} {mode:<8} p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms")
+    print(f"   peak RSS {result['peak_rss_mb']} MB")
+
+def compare(old_path: str, new_path: str):
+    """Print the relative change of the headline numbers between two result files."""
+    with open(old_path, encoding='utf-8') as f:
+        old = {r["corpus"]: r for r in json.load(f)["scenarios"]}
+    with open(new_path, encoding='utf-8') as f:
+        new = {r["corpus"]: r for r in json.load(f)["scenarios"]}
+
+    def change(a, b) -> str:
+        if not a or b is None:
+            return f"{a} -> {b}"
+        return f"{a} -> {b} ({(b - a) / a * 100:+.1f}%)"
+
+    for corpus in new:
+        if corpus not in old:
+            continue
+        o, n = old[corpus], new[corpus]
+        print(f"== {corpus}")
+        print(f"   index files/s  {change(o['index']['files_per_s'], n['index']['files_per_s'])}")
+        print(f"   index chunks/s {change(o['index']['chunks_per_s'], n['index']['chunks_per_s'])}")
+        for mode in n["search"]:
+            if mode in o["search"]:
+                print(f"   search {mode} p95 ms {change(o['search'][mode]['p95_ms'], n['search'][mode]['p95_ms'])}")
+        print(f"   peak RSS MB    {change(o['peak_rss_mb'], n['peak_rss_mb'])}")
+
+def main(
+    corpus: Annotated[Optional[List[str]], typer.Option("--corpus", "-c", help=f"Corpora to run: {', '.join(CORPORA)} (default: all)")] = None,
+    scale: Annotated[float, typer.Option(help="Multiplier for corpus size")] = 1.0,
+    queries_per_mode: Annotated[int, typer.Option("--queries", help="Search queries per mode")] = 200,
+    mode: Annotated[Optional[List[str]], typer.Option("--mode", "-m", help="Search modes to time (default: all)")] = None,
+    n_results: Annotated[int, typer.Option(help="n_results for every search")] = 5,
+    batch_size: Annotated[int, typer.Option(help="Also time the queries in search_rag_batch calls of this many, 0 to skip")] = 0,
+    dim: Annotated[int, typer.Option(help="Mock embedding dimensionality")] = 256,
+    latency: Annotated[float, typer.Option(help="Mock server latency per request (seconds)")] = 0.0,
+    latency_per_text: Annotated[float, typer.Option(help="Mock server latency per embedded text (seconds)")] = 0.0,
+    config: Annotated[Optional[str], typer.Option(help="YAML merged into the benchmark config, e.g. processing/llm settings")] = None,
+    output: Annotated[str, typer.Option("--output", "-o", help="Where to write the JSON results")] = "benchmark_results.json",
+    workdir: Annotated[Optional[str], typer.Option(help="Directory for generated corpora (default: a temp dir, removed afterwards)")] = None,
+    compare_with: Annotated[Optional[List[str]], typer.Option("--compare", help="Compare two result files instead of running: --compare old.json --compare new.json")] = None,
+):
+    if compare_with:
+        if len(compare_with) != 2:
+            raise typer.BadParameter("--compare takes exactly two result files")
+        compare(*compare_with)
+        return
+
+    corpora = corpus or list(CORPORA)
+    unknown = [c for c in corpora if c not in CORPORA]
+    if unknown:
+        raise typer.BadParameter(f"Unknown corpus: {', '.join(unknown)}")
+    modes = mode or SEARCH_MODES
+    config_overrides = {}
+    if config:
+        with open(config, encoding='utf-8') as f:
+            config_overrides = yaml.safe_load(f) or {}
+
+    base_dir = workdir or tempfile.mkdtemp(prefix="rag_mcp_bench_")
+    results: Dict[str, object] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {
+                "scale": scale, "queries": queries_per_mode, "n_results": n_results, "batch_size": batch_size, "dim": dim,
+                "latency": latency, "latency_per_text": latency_per_text, "config": config_overrides,
+            },
+        },
+        "scenarios": [],
+    }
+
+    try:
+        with MockEmbeddingServer(dim=dim, latency=latency, latency_per_text=latency_per_text) as mock:
+            # spawn gives every scenario a fresh interpreter, so peak RSS and caches don't carry over
+            context = multiprocessing.get_context("spawn")
+            for name in corpora:
+                scenario_dir = os.path.join(base_dir, name)
+                shutil.rmtree(scenario_dir, ignore_errors=True)
+                os.makedirs(scenario_dir)
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_scenario, (
+                        name, scale, scenario_dir, mock.url, queries_per_mode, modes, n_results, config_overrides, batch_size
+                    ))
+                results["scenarios"].append(result)
+                _print_summary(result)
+    finally:
+        if workdir is None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    typer.run(main)
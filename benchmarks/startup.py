@@ -0,0 +1,122 @@
+"""
+Startup cost of the CLI and time to the first tool response of a freshly spawned MCP server.
+
+    uv run python benchmarks/startup.py --runs 5
+
+MCP clients such as Claude Desktop start the server once per session, so import time and opening
+the index are paid on every launch. Each run spawns `mcp_rag_tool --dir <corpus> --serve` over stdio
+and times the handshake, tools/list and the first search_rag call from the moment of spawning.
+The corpus is indexed once beforehand, with HOME pointed at a temp dir so the real state is untouched.
+"""
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Annotated, Dict, List, Optional
+
+import typer
+import yaml
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from corpora import CORPORA
+from mock_embedding_server import MockEmbeddingServer
+
+def _timed_run(args: List[str], env: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def _import_seconds(module: str, env: Dict[str, str]) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+async def _session(corpus_dir: str, config_path: str, env: Dict[str, str], mode: str, think_time: float) -> Dict[str, float]:
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=["-m", "rag_mcp.main", "--dir", corpus_dir, "--serve", "--config", config_path],
+        env=env,
+    )
+    start = time.perf_counter()
+    timings = {}
+    with open(os.devnull, 'w') as devnull:
+        async with stdio_client(params, errlog=devnull) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                timings["initialize_s"] = time.perf_counter() - start
+                await session.list_tools()
+                timings["list_tools_s"] = time.perf_counter() - start
+                # A client usually takes a moment to send its first query; prewarm uses that time
+                await asyncio.sleep(think_time)
+                call_start = time.perf_counter()
+                result = await session.call_tool("search_rag", {"keyword": "index cache", "mode": mode})
+                timings["first_search_s"] = time.perf_counter() - start
+                timings["search_call_s"] = time.perf_counter() - call_start
+                if json.loads(result.content[0].text)["code"] != 200:
+                    raise RuntimeError(f"search_rag failed: {result.content[0].text}")
+    return timings
+
+def _summary(values: List[float]) -> dict:
+    return {"median_ms": round(statistics.median(values) * 1000, 1), "min_ms": round(min(values) * 1000, 1)}
+
+def main(
+    runs: Annotated[int, typer.Option(help="Repetitions of every measurement; medians are reported")] = 5,
+    scale: Annotated[float, typer.Option(help="Size of the small_files corpus served during the runs")] = 0.05,
+    mode: Annotated[str, typer.Option(help="Retrieval mode of the first search")] = "hybrid",
+    think_time: Annotated[float, typer.Option(help="Seconds between tools/list and the first search, as a client would wait")] = 0.0,
+    output: Annotated[Optional[str], typer.Option("--output", "-o", help="Also write the results as JSON")] = None,
+):
+    workdir = tempfile.mkdtemp(prefix="rag_mcp_startup_")
+    try:
+        env = dict(os.environ, HOME=os.path.join(workdir, "home"))
+        corpus_dir = os.path.join(workdir, "corpus")
+        CORPORA["small_files"](corpus_dir, scale)
+        results: Dict[str, dict] = {}
+
+        with MockEmbeddingServer() as mock:
+            config_paths = {}
+            for prewarm in (False, True):
+                config_paths[prewarm] = os.path.join(workdir, f"prewarm_{prewarm}.yaml")
+                with open(config_paths[prewarm], 'w', encoding='utf-8') as f:
+                    yaml.safe_dump({
+                        "llm": {"base_url": mock.url},
+                        "model": {"name": "mock-embedding"},
+                        "server": {"prewarm": prewarm},
+                    }, f)
+            _timed_run([sys.executable, "-m", "rag_mcp.main", "--dir", corpus_dir, "--config", config_paths[False]], env)
+
+            results["import_cli"] = _summary([_import_seconds("rag_mcp.cli", env) for _ in range(runs)])
+            results["import_server"] = _summary([_import_seconds("rag_mcp.server", env) for _ in range(runs)])
+            results["cli_version"] = _summary([
+                _timed_run([sys.executable, "-m", "rag_mcp.main", "--version"], env) for _ in range(runs)
+            ])
+
+            async def sessions(prewarm: bool) -> List[Dict[str, float]]:
+                return [await _session(corpus_dir, config_paths[prewarm], env, mode, think_time) for _ in range(runs)]
+
+            for prewarm in (False, True):
+                timings = asyncio.run(sessions(prewarm))
+                name = "mcp_prewarm" if prewarm else "mcp"
+                results[name] = {key: _summary([t[key] for t in timings]) for key in timings[0]}
+
+        print(f"\n{'measurement':<28}{'median ms':>12}{'min ms':>12}")
+        for name, result in results.items():
+            if "median_ms" in result:
+                print(f"{name:<28}{result['median_ms']:>12}{result['min_ms']:>12}")
+            else:
+                for key, r in result.items():
+                    print(f"{name + ' ' + key:<28}{r['median_ms']:>12}{r['min_ms']:>12}")
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump({"runs": runs, "mode": mode, "think_time": think_time, "results": results}, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    typer.run(main)
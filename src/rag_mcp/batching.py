@@ -0,0 +1,105 @@
+import threading
+from typing import List, Tuple
+from .config import ModelConfig
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """
+    Cheap token estimate without a tokenizer.
+    ASCII text averages `chars_per_token` characters per token, while CJK and other
+    non-ASCII characters are usually one token each.
+    """
+    if text.isascii():
+        return int(len(text) / chars_per_token) + 1
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    ascii_count = len(text) - non_ascii
+    return non_ascii + int(ascii_count / chars_per_token) + 1
+
+def _find_split_point(text: str, limit: int) -> int:
+    """Find a split point at or before `limit`, preferring newline then space boundaries."""
+    if limit >= len(text):
+        return len(text)
+    floor = limit // 2
+    for sep in ("\n\n", "\n", " "):
+        pos = text.rfind(sep, floor, limit)
+        if pos != -1:
+            return pos + len(sep)
+    return limit
+
+def split_oversized(chunks: List[str], max_tokens: int, chars_per_token: float = 4.0) -> List[str]:
+    """
+    Split every chunk whose estimated size exceeds `max_tokens`, so the embedding server
+    never has to truncate or reject it.
+    """
+    # No chunk of more than this many characters can fit, whatever its content
+    window = max(1, int(max_tokens * chars_per_token))
+    result = []
+    for chunk in chunks:
+        rest = chunk
+        while rest:
+            head = rest[:window]
+            tokens = estimate_tokens(head, chars_per_token)
+            if len(rest) <= window and tokens <= max_tokens:
+                result.append(rest)
+                break
+            # Scale the window down by how far over budget it is, with some headroom
+            limit = max(1, int(len(head) * min(1.0, max_tokens / tokens) * 0.95))
+            split_point = _find_split_point(rest, limit)
+            result.append(rest[:split_point])
+            rest = rest[split_point:]
+    return result
+
+class AdaptiveBatcher:
+    """
+    Packs texts into embedding requests bounded by a token budget and a maximum batch size.
+    Both limits shrink when the server reports a request as too large (413 / timeout)
+    and grow back gradually after consecutive successes.
+    """
+    GROW_AFTER = 8
+
+    def __init__(self, max_batch_tokens: int, max_batch_size: int, chars_per_token: float = 4.0, min_batch_tokens: int = 256):
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max(1, max_batch_size)
+        self.chars_per_token = chars_per_token
+        self.min_batch_tokens = min(min_batch_tokens, max_batch_tokens)
+        self.batch_tokens = max_batch_tokens
+        self.batch_size = self.max_batch_size
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, model: ModelConfig) -> "AdaptiveBatcher":
+        max_batch_tokens = model.max_batch_tokens or model.context_window * 8
+        return cls(max_batch_tokens, model.max_batch_size, model.chars_per_token, min_batch_tokens=model.context_window)
+
+    def pack(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Return contiguous (start, end) slices of texts, one per request."""
+        budget = self.batch_tokens
+        size = self.batch_size
+        bounds = []
+        start = 0
+        used = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text, self.chars_per_token)
+            if i > start and (used + tokens > budget or i - start >= size):
+                bounds.append((start, i))
+                start = i
+                used = 0
+            used += tokens
+        if start < len(texts):
+            bounds.append((start, len(texts)))
+        return bounds
+
+    def shrink(self):
+        with self._lock:
+            self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+            self.batch_size = max(1, self.batch_size // 2)
+            self._successes = 0
+
+    def record_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes < self.GROW_AFTER:
+                return
+            self.batch_tokens = min(self.max_batch_tokens, int(self.batch_tokens * 1.5))
+            self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.5) + 1)
+            self._successes = 0
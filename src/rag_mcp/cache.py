@@ -0,0 +1,206 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .logger import logger
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, sha256 of the text).
+    Vectors are stored as raw little-endian float32 blobs in SQLite, and the least recently
+    used entries are evicted once the total vector size exceeds `max_bytes`.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype='<f4')
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, Sequence[float]]]):
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, h, np.asarray(vector, dtype='<f4').tobytes(), now) for h, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._size += sum(len(row[2]) for row in rows)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Recount first, since INSERT OR REPLACE may have overwritten existing rows
+        self._size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if self._size <= self.max_bytes:
+            return
+        # Evict down to 90% of the budget, so we don't evict again on the next insert
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        cursor = self._conn.execute("SELECT model, hash, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        victims = []
+        for model, h, length in cursor:
+            if self._size - removed <= target:
+                break
+            victims.append((model, h))
+            removed += length
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", victims)
+        self._conn.commit()
+        self._size -= removed
+        logger.info(f"Evicted {len(victims)} entries from embedding cache {self.path}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SharedEmbeddingCache:
+    """
+    Embedding cache shared by storages indexed at the same time, so content they have in common is
+    embedded once. A storage claims the hashes it is about to embed; the others wait for those
+    vectors instead of requesting them too.
+    """
+    def __init__(self, cache: EmbeddingCache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], Future] = {}
+
+    def claim(self, model: str, hashes: Sequence[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, Future], List[str]]:
+        """
+        Split hashes into cached vectors, futures of vectors another storage is embedding, and hashes
+        the caller now has to embed and then publish, or release if that fails.
+        """
+        found = self.cache.get_many(model, hashes)
+        waiting: Dict[str, Future] = {}
+        claimed: List[str] = []
+        with self._lock:
+            for h in hashes:
+                if h in found:
+                    continue
+                future = self._pending.get((model, h))
+                if future is not None:
+                    waiting[h] = future
+                else:
+                    self._pending[(model, h)] = Future()
+                    claimed.append(h)
+        return found, waiting, claimed
+
+    def publish(self, model: str, items: Sequence[Tuple[str, np.ndarray]]):
+        try:
+            self.cache.put_many(model, items)
+        finally:
+            # Waiters get the vectors even if caching them failed
+            with self._lock:
+                futures = [(self._pending.pop((model, h), None), vector) for h, vector in items]
+            for future, vector in futures:
+                if future is not None:
+                    future.set_result(vector)
+
+    def release(self, model: str, hashes: Sequence[str], error: Exception):
+        with self._lock:
+            futures = [self._pending.pop((model, h), None) for h in hashes]
+        for future in futures:
+            if future is not None:
+                future.set_exception(error)
+
+    def close(self):
+        self.cache.close()
+
+def normalize_query(query: str) -> str:
+    """Normalize a query so trivially different spellings share one cache entry."""
+    return " ".join(unicodedata.normalize("NFKC", query).split())
+
+class QueryEmbeddingCache:
+    """
+    In-process LRU cache of query embeddings with a TTL, keyed by (model name, normalized query).
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Total time spent embedding on misses, used to estimate what the hits saved
+        self.miss_time = 0.0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: str, query: str, embedding: List[float], cost: float = 0.0):
+        key = (model, normalize_query(query))
+        with self._lock:
+            self.miss_time += cost
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            avg_miss = self.miss_time / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "saved_time": round(self.hits * avg_miss, 3)
+            }
@@ -0,0 +1,129 @@
+import os
+from typing import Iterable, Iterator, List, Sequence
+from .config import ProcessingConfig
+from .utils import chunk_text, iter_file_chunks
+
+# Plain-text boundaries, in order of preference
+TEXT_SEPARATORS = ("\n\n", "\n", " ")
+
+MARKDOWN_SEPARATORS = ("\n# ", "\n## ", "\n### ", "\n#### ", "\n```", "\n\n", "\n", " ")
+
+CODE_SEPARATORS = (
+    "\nclass ", "\ndef ", "\nasync def ", "\nfunction ", "\nexport ", "\nfunc ", "\nfn ", "\npub fn ",
+    "\n\n", "\n", " "
+)
+
+MARKDOWN_EXTS = {'.md', '.markdown', '.mdx', '.rst'}
+
+CODE_EXTS = {
+    '.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.rs', '.java', '.kt', '.c', '.h', '.cc', '.cpp', '.hpp',
+    '.cs', '.rb', '.php', '.swift', '.scala', '.lua'
+}
+
+class Chunker:
+    """
+    Splits text into chunks for embedding.
+    Subclasses implement `iter_chunks`, which consumes text in blocks so files can be streamed.
+    """
+    def split(self, text: str) -> List[str]:
+        return list(self.iter_chunks([text]))
+
+    def iter_file(self, file_path: str, block_size: int = 1 << 20) -> Iterator[str]:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            yield from self.iter_chunks(iter(lambda: f.read(block_size), ""))
+
+    def iter_chunks(self, blocks: Iterable[str]) -> Iterator[str]:
+        raise NotImplementedError
+
+class CountChunker(Chunker):
+    """Legacy strategy: split every file into `chunk_count` parts regardless of its size."""
+    def __init__(self, chunk_count: int):
+        self.chunk_count = chunk_count
+
+    def split(self, text: str) -> List[str]:
+        return chunk_text(text, self.chunk_count)
+
+    def iter_file(self, file_path: str, block_size: int = 1 << 20) -> Iterator[str]:
+        return iter_file_chunks(file_path, self.chunk_count, block_size)
+
+    def iter_chunks(self, blocks: Iterable[str]) -> Iterator[str]:
+        # Count-based splitting needs the whole text up front
+        return iter(self.split("".join(blocks)))
+
+class FixedSizeChunker(Chunker):
+    """
+    Chunks of at most `chunk_size` characters, consecutive chunks sharing about `chunk_overlap`
+    characters. Each chunk ends at the highest-priority separator found in its second half.
+    """
+    def __init__(self, chunk_size: int, chunk_overlap: int, separators: Sequence[str] = TEXT_SEPARATORS):
+        self.chunk_size = max(1, chunk_size)
+        # Every chunk advances by at least half its size, so overlap must stay below that
+        self.chunk_overlap = max(0, min(chunk_overlap, self.chunk_size // 2 - 1))
+        self.separators = separators
+
+    def iter_chunks(self, blocks: Iterable[str]) -> Iterator[str]:
+        buf = ""
+        # Start of the unconsumed text in buf, advanced instead of re-slicing buf per chunk
+        pos = 0
+        # Length of the already emitted overlap at buf[pos:]
+        carried = 0
+        for block in blocks:
+            buf = buf[pos:] + block
+            pos = 0
+            while len(buf) - pos > self.chunk_size:
+                cut = self._find_cut(buf, pos)
+                chunk = buf[pos:cut]
+                if chunk.strip():
+                    yield chunk
+                start = self._overlap_start(buf, cut)
+                carried = cut - start
+                pos = start
+        if len(buf) - pos > carried and buf[pos + carried:].strip():
+            yield buf[pos:]
+
+    def _find_cut(self, buf: str, pos: int) -> int:
+        min_end = pos + self.chunk_size // 2
+        max_end = pos + self.chunk_size
+        for sep in self.separators:
+            found = buf.rfind(sep, min_end, max_end)
+            if found != -1:
+                if sep.strip():
+                    # Structural separators (headings, definitions) start the next chunk
+                    return found + 1
+                return found + len(sep)
+        return max_end
+
+    def _overlap_start(self, buf: str, cut: int) -> int:
+        if self.chunk_overlap == 0:
+            return cut
+        start = cut - self.chunk_overlap
+        # Begin the overlap at a line or word boundary when there is one; not the one the chunk
+        # ends with, which would leave no overlap at all
+        for sep in ("\n", " "):
+            found = buf.find(sep, start, cut - 1)
+            if found != -1:
+                return found + 1
+        return start
+
+class StructureAwareChunker(FixedSizeChunker):
+    """Fixed-size chunks that prefer to break at Markdown headings or top-level code definitions."""
+    def __init__(self, chunk_size: int, chunk_overlap: int, file_path: str):
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext in MARKDOWN_EXTS:
+            separators = MARKDOWN_SEPARATORS
+        elif ext in CODE_EXTS:
+            separators = CODE_SEPARATORS
+        else:
+            separators = TEXT_SEPARATORS
+        super().__init__(chunk_size, chunk_overlap, separators)
+
+def get_chunker(config: ProcessingConfig, file_path: str) -> Chunker:
+    """Build the chunker selected by processing.chunk_strategy for a file."""
+    strategy = config.chunk_strategy
+    if strategy == "count":
+        return CountChunker(config.chunk_count)
+    if strategy == "fixed":
+        return FixedSizeChunker(config.chunk_size, config.chunk_overlap)
+    if strategy == "structure":
+        return StructureAwareChunker(config.chunk_size, config.chunk_overlap, file_path)
+    raise ValueError(f"Unknown chunk strategy: {strategy}")
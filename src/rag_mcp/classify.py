@@ -0,0 +1,230 @@
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .config import ProcessingConfig
+from .manifest import Manifest
+from .utils import extension_is_text, sniff_text
+
+from .logger import logger
+
+# Read from every directory of an indexed tree; .ragignore is read after .gitignore, so it can override it
+IGNORE_FILES = (".gitignore", ".ragignore")
+
+class IgnoreRule(NamedTuple):
+    """One compiled .gitignore line, relative to the directory `base` it was read in."""
+    base: str
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+    # Matched against the path relative to base; otherwise against the name alone, at any depth
+    anchored: bool
+
+def _translate_segment(segment: str) -> str:
+    out = []
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        if c == '*':
+            out.append('[^/]*')
+            # A run of stars within a segment is a single star
+            while i + 1 < len(segment) and segment[i + 1] == '*':
+                i += 1
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = segment.find(']', i + 2 if segment[i + 1:i + 2] in ('!', '^') else i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = segment[i + 1:end]
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < len(segment):
+            i += 1
+            out.append(re.escape(segment[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+def compile_pattern(line: str, base: str) -> Optional[IgnoreRule]:
+    """Compile one line of a .gitignore file, or return None for blank lines and comments."""
+    line = line.rstrip('\n\r')
+    # Trailing spaces are dropped unless escaped
+    stripped = line.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += ' '
+    line = stripped
+    if not line or line.startswith('#'):
+        return None
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    elif line.startswith('\\'):
+        # "\#" and "\!" are literal
+        line = line[1:] if line[1:2] in ('#', '!') else line
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    anchored = '/' in line
+    line = line.lstrip('/')
+
+    parts = line.split('/')
+    regex = []
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == '**':
+            # "**/" matches zero or more directories, a trailing "/**" everything inside
+            regex.append('.*' if last else '(?:.*/)?')
+            continue
+        regex.append(_translate_segment(part))
+        if not last:
+            regex.append('/')
+    return IgnoreRule(base, re.compile(''.join(regex) + r'\Z', re.DOTALL), negate, dir_only, anchored)
+
+def load_ignore_file(path: str, base: str) -> List[IgnoreRule]:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    except OSError as e:
+        logger.warning(f"Cannot read {path}: {e}")
+        return []
+    return [rule for rule in (compile_pattern(line, base) for line in lines) if rule is not None]
+
+Rules = Tuple[IgnoreRule, ...]
+
+class IgnoreMatcher:
+    """
+    .gitignore semantics for one indexed tree: processing.ignore_patterns apply from the root, then the
+    .gitignore and .ragignore of each directory on the way down, and the last matching rule wins.
+    A file inside an ignored directory is ignored whatever the rules say about it, as in git.
+    """
+    def __init__(self, root: str, patterns: List[str], use_gitignore: bool = True):
+        self.root = os.path.abspath(root)
+        self.ignore_files = IGNORE_FILES if use_gitignore else IGNORE_FILES[1:]
+        self.base_rules: Rules = tuple(rule for rule in (compile_pattern(p, self.root) for p in patterns) if rule is not None)
+        self._cache: Dict[str, Rules] = {}
+
+    def child_rules(self, directory: str, parent: Rules) -> Rules:
+        """Rules in effect inside directory, given those of its parent."""
+        own: List[IgnoreRule] = []
+        for name in self.ignore_files:
+            own += load_ignore_file(os.path.join(directory, name), directory)
+        # Directories without ignore files share their parent's tuple
+        return parent + tuple(own) if own else parent
+
+    def clear(self):
+        """Forget cached rules, after an ignore file changed."""
+        self._cache.clear()
+
+    def rules_for(self, directory: str) -> Rules:
+        """Rules in effect inside directory, which must be the root or below it."""
+        directory = directory.rstrip(os.sep) or os.sep
+        rules = self._cache.get(directory)
+        if rules is None:
+            if directory == self.root:
+                parent = self.base_rules
+            else:
+                parent = self.rules_for(os.path.dirname(directory))
+            rules = self._cache[directory] = self.child_rules(directory, parent)
+        return rules
+
+    @staticmethod
+    def match(path: str, is_dir: bool, rules: Rules) -> bool:
+        """Whether rules ignore path itself; its parent directories are not checked."""
+        name = os.path.basename(path)
+        for rule in reversed(rules):
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.anchored:
+                if not path.startswith(rule.base + os.sep):
+                    continue
+                target = path[len(rule.base) + 1:]
+                if os.sep != '/':
+                    target = target.replace(os.sep, '/')
+            else:
+                target = name
+            if rule.regex.match(target):
+                return not rule.negate
+        return False
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """Whether path or any directory between it and the root is ignored."""
+        path = os.path.abspath(path)
+        rel = os.path.relpath(path, self.root)
+        if rel == os.curdir or rel.startswith(os.pardir):
+            return False
+        current = self.root
+        parts = rel.split(os.sep)
+        for i, part in enumerate(parts):
+            rules = self.rules_for(current)
+            current = os.path.join(current, part)
+            if self.match(current, is_dir or i < len(parts) - 1, rules):
+                return True
+        return False
+
+class FileClassifier:
+    """
+    Decides which files under root get indexed: hidden and ignored paths never are, known extensions are
+    decided by name, and anything else by sniffing its first bytes. Sniffed decisions are cached in the
+    manifest by (size, mtime_ns), so a re-scan only reads files that changed.
+    """
+    def __init__(self, root: str, config: ProcessingConfig, manifest: Optional[Manifest] = None):
+        self.root = os.path.abspath(root)
+        self.ignore = IgnoreMatcher(self.root, config.ignore_patterns, config.use_gitignore)
+        self.manifest = manifest
+        self._cached: Dict[str, Tuple[int, int, bool]] = manifest.load_file_types(self.root) if manifest else {}
+        self._new: Dict[str, Tuple[int, int, bool]] = {}
+        self._seen: Set[str] = set()
+
+    def is_text(self, path: str, st: os.stat_result) -> bool:
+        decided = extension_is_text(path)
+        if decided is not None:
+            return decided
+        self._seen.add(path)
+        cached = self._cached.get(path)
+        if cached is not None and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        is_text = sniff_text(path)
+        self._new[path] = (st.st_size, st.st_mtime_ns, is_text)
+        return is_text
+
+    def walk(self, directory: str):
+        """Yield (path, stat) of every file to index under directory, never entering ignored directories."""
+        stack = [(directory, self.ignore.rules_for(directory))]
+        while stack:
+            current, parent_rules = stack.pop()
+            rules = parent_rules if current == directory else self.ignore.child_rules(current, parent_rules)
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.ignore.match(entry.path, True, rules):
+                                stack.append((entry.path, rules))
+                        elif entry.is_file() and not self.ignore.match(entry.path, False, rules):
+                            st = entry.stat()
+                            if self.is_text(entry.path, st):
+                                yield entry.path, st
+            except OSError as e:
+                logger.error(f"Error scanning {current}: {e}")
+
+    def save(self, complete: bool = False):
+        """
+        Write new decisions to the manifest. After a complete walk of the root, cached decisions for
+        files that were not seen (deleted, now ignored or renamed) are dropped too.
+        """
+        if self.manifest is None:
+            return
+        deleted = [path for path in self._cached if path not in self._seen] if complete else []
+        if self._new or deleted:
+            self.manifest.update_file_types(self._new, deleted=deleted)
+        self._cached.update(self._new)
+        self._new = {}
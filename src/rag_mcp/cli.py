@@ -1,23 +1,42 @@
 import typer
 import os
 import shutil
-from typing import Optional
+from typing import List, Optional
 from typing_extensions import Annotated
-from .config import load_config
-from .indexer import Indexer
+from .config import load_config, storage_path
 from .state import StateManager
-from .server import start_server
+from .metrics import metrics
+
+# Each command imports what it needs when it runs: chromadb, httpx and the MCP SDK take about a
+# second to import, which --version, --backup and MCP clients spawning the server shouldn't pay for
 
 app = typer.Typer(add_completion=False)
 
+def _print_summary(results: List[dict], err: bool = False):
+    """Print what indexing did in each directory, one row per directory."""
+    width = max(len("Directory"), *(len(r["dir"]) for r in results))
+    typer.echo(f"{'Directory':<{width}}  {'Scanned':>8}  {'Indexed':>8}  {'Chunks':>8}  {'Removed':>8}  {'Time':>8}", err=err)
+    for r in results:
+        if "error" in r:
+            typer.echo(f"{r['dir']:<{width}}  failed after {r['seconds']:.1f}s: {r['error']}", err=err)
+            continue
+        typer.echo(
+            f"{r['dir']:<{width}}  {r['files_scanned']:>8}  {r['files_indexed']:>8}  {r['chunks_embedded']:>8}  "
+            f"{r['files_removed']:>8}  {r['seconds']:>7.1f}s", err=err
+        )
+
 @app.command()
 def main(
-    dir_path: Annotated[Optional[str], typer.Option("--dir", "-d", help="Target directory path")] = None,
+    dir_paths: Annotated[Optional[List[str]], typer.Option("--dir", "-d", help="Target directory path; repeat to index several directories at once")] = None,
+    all_dirs: Annotated[bool, typer.Option("--all", "-a", help="Re-index every registered directory in one process")] = False,
     config_path: Annotated[str, typer.Option("--config", "-c", help="Config file path")] = "config.yaml",
     clean: Annotated[bool, typer.Option("--clean", "-cl", help="Clean RAG database")] = False,
     backup: Annotated[bool, typer.Option("--backup", "-b", help="Backup RAG database")] = False,
     backup_path: Annotated[Optional[str], typer.Option("--backup-path", "-bp", help="Backup storage path")] = None,
+    migrate: Annotated[bool, typer.Option("--migrate", help="Copy per-directory indexes (--dir, or every registered directory) into the central index")] = False,
     serve: Annotated[bool, typer.Option("--serve", "-s", help="Start MCP server after processing")] = False,
+    watch: Annotated[bool, typer.Option("--watch", "-w", help="Start MCP server and re-index changed files while serving")] = False,
+    metrics_path: Annotated[Optional[str], typer.Option("--metrics", "-m", help="Write stage timings on exit (JSON for *.json, Prometheus text otherwise)")] = None,
     version: Annotated[bool, typer.Option("--version", "-v", help="Show version")] = False,
 ):
     """
@@ -28,6 +47,17 @@ def main(
         print("RAG MCP Tool v0.1.0")
         return
 
+    # Watching only makes sense while serving
+    serve = serve or watch
+    dir_paths = dir_paths or []
+    dir_path = dir_paths[0] if dir_paths else None
+    if len(dir_paths) > 1 and (clean or backup or serve):
+        typer.echo("Error: --clean, --backup and --serve take a single --dir", err=True)
+        raise typer.Exit(code=1)
+
+    if metrics_path:
+        metrics.export_on_exit(os.path.abspath(metrics_path))
+
     # If clean or backup is requested, dir_path is required
     if clean:
         if not dir_path:
@@ -35,7 +65,21 @@ def main(
             raise typer.Exit(code=1)
         
         target_dir = os.path.abspath(dir_path)
-        rag_dir = os.path.join(target_dir, ".muxue_rag")
+        config = load_config(config_path)
+        rag_dir = storage_path(target_dir, config)
+        if config.storage.mode == "central":
+            if os.path.exists(rag_dir) and target_dir in StateManager.load_state():
+                confirm = typer.confirm(f"Are you sure you want to remove {target_dir} from {rag_dir}?")
+                if confirm:
+                    from .indexer import Indexer
+                    indexer = Indexer(target_dir, config)
+                    indexer.clean()
+                    indexer.storage.close()
+                    StateManager.remove_directory(target_dir)
+                    typer.echo("Removed directory from the central index.")
+            else:
+                typer.echo("Directory is not in the central index.")
+            return
         if os.path.exists(rag_dir):
             confirm = typer.confirm(f"Are you sure you want to delete {rag_dir}?")
             if confirm:
@@ -55,7 +99,8 @@ def main(
             raise typer.Exit(code=1)
             
         target_dir = os.path.abspath(dir_path)
-        rag_dir = os.path.join(target_dir, ".muxue_rag")
+        # In central mode this is the shared index of every directory
+        rag_dir = storage_path(target_dir, load_config(config_path))
         if os.path.exists(rag_dir):
             shutil.copytree(rag_dir, backup_path, dirs_exist_ok=True)
             typer.echo(f"Backup created at {backup_path}")
@@ -63,6 +108,59 @@ def main(
             typer.echo("No database found to backup.")
         return
 
+    if migrate:
+        from .migration import migrate_to_central
+        config = load_config(config_path)
+        if config.storage.mode != "central":
+            typer.echo("Error: set storage.mode to central in the config before migrating", err=True)
+            raise typer.Exit(code=1)
+        dirs = [os.path.abspath(d) for d in dir_paths] if dir_paths else StateManager.load_state()
+        for d in dirs:
+            if not os.path.isdir(os.path.join(d, ".muxue_rag")):
+                typer.echo(f"Skipped {d}: no .muxue_rag index")
+                continue
+            chunks = migrate_to_central(d, config)
+            StateManager.add_directory(d)
+            typer.echo(f"Migrated {chunks} chunks of {d}; {os.path.join(d, '.muxue_rag')} can now be deleted")
+        return
+
+    if all_dirs or len(dir_paths) > 1:
+        config = load_config(config_path)
+        given = [os.path.abspath(d) for d in dir_paths]
+        for d in given:
+            if not os.path.isdir(d):
+                typer.echo(f"Error: {d} is not a directory", err=True)
+                raise typer.Exit(code=1)
+            if config.storage.mode == "central":
+                # A file can only belong to one directory of the shared index
+                overlap = StateManager.find_overlap(d, given) or StateManager.find_overlap(d)
+                if overlap:
+                    typer.echo(f"Error: {d} overlaps directory {overlap}", err=True)
+                    raise typer.Exit(code=1)
+        dirs = list(dict.fromkeys(given + (StateManager.load_state() if all_dirs else [])))
+        # A registered directory that is gone (e.g. an unmounted drive) would otherwise lose its whole index
+        missing = [d for d in dirs if not os.path.isdir(d)]
+        for d in missing:
+            typer.echo(f"Skipped {d}: directory does not exist", err=True)
+        dirs = [d for d in dirs if d not in missing]
+        if not dirs:
+            typer.echo("No directories to index.", err=True)
+            raise typer.Exit(code=1)
+
+        from .multi_index import index_directories
+        results = index_directories(dirs, config)
+        for r in results:
+            if "error" not in r:
+                StateManager.add_directory(r["dir"])
+        # While serving, stdout belongs to the MCP protocol
+        _print_summary(results, err=serve)
+        if not serve:
+            if any("error" in r for r in results):
+                raise typer.Exit(code=1)
+            return
+        # Serve every registered directory
+        dir_path = None
+
     if dir_path:
         # Validate directory
         if not os.path.exists(dir_path):
@@ -75,6 +173,13 @@ def main(
         # If only indexing (no serve), perform indexing
         if not serve:
             config = load_config(config_path)
+            if config.storage.mode == "central":
+                # A file can only belong to one directory of the shared index
+                overlap = StateManager.find_overlap(dir_path)
+                if overlap:
+                    typer.echo(f"Error: {os.path.abspath(dir_path)} overlaps indexed directory {overlap}", err=True)
+                    raise typer.Exit(code=1)
+            from .indexer import Indexer
             indexer = Indexer(dir_path, config)
             indexer.index()
 
@@ -83,14 +188,19 @@ def main(
             return
 
     # Start Server
-    print("Starting MCP Server...")
+    # stdout carries the MCP protocol over stdio
+    typer.echo("Starting MCP Server...", err=True)
     if config_path != "config.yaml":
         os.environ["RAG_MCP_CONFIG"] = config_path
     
     # If we are serving a specific directory (passed via --dir and --serve)
     if dir_path and serve:
         os.environ["RAG_MCP_SERVE_DIR"] = os.path.abspath(dir_path)
-        
+
+    if watch:
+        os.environ["RAG_MCP_WATCH"] = "1"
+
+    from .server import start_server
     start_server()
 
 if __name__ == "__main__":
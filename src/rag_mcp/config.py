@@ -1,26 +1,94 @@
 import yaml
 import os
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
 
 class LLMConfig(BaseModel):
     service_type: str = Field(default="openai", description="Service type: openai, local, etc.")
     base_url: str = Field(default="http://localhost:1234/v1", description="LLM API Base URL")
     api_key: Optional[str] = Field(default=None, description="API Key")
     timeout: int = Field(default=60, description="Request timeout in seconds")
+    max_connections: int = Field(default=8, description="Maximum pooled HTTP connections to the embedding server")
+    max_concurrent_requests: int = Field(default=4, description="Maximum embedding batches in flight at once")
 
 class ModelConfig(BaseModel):
     name: str = Field(default="text-embedding-qwen3-embedding-4b", description="Model name")
     context_window: int = Field(default=4096, description="Context window size")
     temperature: float = Field(default=0.7, description="Generation temperature")
+    max_batch_tokens: Optional[int] = Field(default=None, description="Token budget per embedding request, defaults to 8 x context_window")
+    max_batch_size: int = Field(default=100, description="Maximum number of texts per embedding request")
+    chars_per_token: float = Field(default=4.0, description="Characters per token used to estimate ASCII text size")
+
+# Dependencies, generated files and lockfiles: rarely worth embedding and often most of a repository
+DEFAULT_IGNORE_PATTERNS = (
+    "node_modules/", "bower_components/", "__pycache__/", "venv/", "site-packages/",
+    "*.lock", "package-lock.json", "pnpm-lock.yaml", "*.min.js", "*.min.css", "*.map",
+)
 
 class ProcessingConfig(BaseModel):
-    chunk_count: int = Field(default=5, description="Number of chunks to split the file into")
+    chunk_strategy: Literal["structure", "fixed", "count"] = Field(default="structure", description="Chunking strategy: structure (Markdown/code aware), fixed or count")
+    chunk_size: int = Field(default=1500, description="Maximum chunk size in characters for the structure and fixed strategies")
+    chunk_overlap: int = Field(default=200, description="Characters shared by consecutive chunks for the structure and fixed strategies")
+    chunk_count: int = Field(default=5, description="Number of chunks to split the file into with the count strategy")
+    workers: int = Field(default=4, description="Number of threads reading and chunking files while indexing")
+    parallel_dirs: int = Field(default=4, description="Directories indexed at once by --all or several --dir options")
+    queue_size: int = Field(default=256, description="Capacity of the queues between indexing stages")
+    stream_threshold_mb: int = Field(default=16, description="Files larger than this are chunked by streaming instead of read whole")
+    use_gitignore: bool = Field(default=True, description="Skip files matched by .gitignore files; .ragignore files are always applied")
+    ignore_patterns: List[str] = Field(
+        default_factory=lambda: list(DEFAULT_IGNORE_PATTERNS),
+        description="Extra .gitignore-style patterns applied from the indexed directory, before its own ignore files"
+    )
+
+class CacheConfig(BaseModel):
+    embedding_cache: bool = Field(default=True, description="Cache chunk and search query embeddings by content hash in .muxue_rag")
+    embedding_cache_max_mb: int = Field(default=512, description="Maximum size of cached vectors in MB")
+    query_cache_size: int = Field(default=1024, description="Maximum number of query embeddings kept in memory")
+    query_cache_ttl: int = Field(default=600, description="Seconds a cached query embedding stays valid")
+
+class StorageConfig(BaseModel):
+    mode: Literal["local", "central"] = Field(default="local", description="local: a .muxue_rag index inside each directory; central: one index shared by all directories")
+    central_path: str = Field(default="~/.rag_mcp/index", description="Location of the shared index in central mode")
+    quantization: Literal["none", "float16", "int8"] = Field(default="none", description="none: float32 vectors in Chroma's HNSW index; float16/int8: compact memory-mapped vectors searched by a NumPy scan")
+    rerank: bool = Field(default=True, description="With quantization, keep float32 vectors on disk to rerank the best matches exactly")
+    rerank_candidates: int = Field(default=4, description="Quantized matches kept per requested result for the full-precision rerank")
+
+class SearchConfig(BaseModel):
+    n_results: int = Field(default=5, description="Default number of top matches returned by search_rag")
+    max_workers: int = Field(default=8, description="Number of directories searched concurrently")
+    dir_timeout: float = Field(default=10.0, description="Seconds to wait for all directory searches of a request together before answering without the unfinished ones; a directory whose search is still running after that is skipped by later searches until it finishes")
+    mode: Literal["hybrid", "vector", "lexical"] = Field(default="hybrid", description="Default retrieval: hybrid (BM25 + vector), vector or lexical (BM25 only, no embedding request)")
+    fusion_candidates: int = Field(default=20, description="Candidates taken from each ranking before fusing, de-duplicating and collapsing them")
+    rrf_k: int = Field(default=60, description="Reciprocal rank fusion constant, higher values flatten the weight of top ranks")
+    dedup: bool = Field(default=True, description="Drop chunks whose content (ignoring whitespace) repeats a better match")
+    max_per_file: int = Field(default=0, description="Maximum matches returned from one file, 0 for no limit")
+    context_chunks: int = Field(default=0, description="Neighbouring chunks returned before and after each match")
+    max_batch_queries: int = Field(default=20, description="Maximum queries in one search_rag_batch call")
+
+class ServerConfig(BaseModel):
+    max_read_bytes: int = Field(default=1024 * 1024, description="Maximum bytes returned by one read_raw_file call")
+    max_concurrent_requests: int = Field(default=16, description="Maximum tool calls processed at once; further calls wait")
+    prewarm: bool = Field(default=False, description="Open the indexes of the served directories in the background when the server starts, so the first search is fast")
+
+class WatchConfig(BaseModel):
+    backend: Literal["auto", "inotify", "polling"] = Field(default="auto", description="File change detection: inotify, polling, or auto (inotify with polling fallback)")
+    debounce: float = Field(default=2.0, description="Seconds a file must stay unchanged before it is re-indexed")
+    poll_interval: float = Field(default=10.0, description="Seconds between directory rescans with the polling backend")
+
+class MetricsConfig(BaseModel):
+    enabled: bool = Field(default=False, description="Aggregate per-stage timings, exposed by the get_metrics tool")
+    breakdown: bool = Field(default=False, description="Add per-stage timings of each search to stats.breakdown")
 
 class AppConfig(BaseModel):
     llm: LLMConfig = Field(default_factory=LLMConfig)
     model: ModelConfig = Field(default_factory=ModelConfig)
     processing: ProcessingConfig = Field(default_factory=ProcessingConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    storage: StorageConfig = Field(default_factory=StorageConfig)
+    search: SearchConfig = Field(default_factory=SearchConfig)
+    server: ServerConfig = Field(default_factory=ServerConfig)
+    watch: WatchConfig = Field(default_factory=WatchConfig)
+    metrics: MetricsConfig = Field(default_factory=MetricsConfig)
 
 def load_config(config_path: str) -> AppConfig:
     if not os.path.exists(config_path):
@@ -34,3 +102,9 @@ def load_config(config_path: str) -> AppConfig:
         return AppConfig()
         
     return AppConfig(**data)
+
+def storage_path(target_dir: str, config: AppConfig) -> str:
+    """Where the index of target_dir lives: its own .muxue_rag, or the shared index in central mode."""
+    if config.storage.mode == "central":
+        return os.path.abspath(os.path.expanduser(config.storage.central_path))
+    return os.path.join(target_dir, ".muxue_rag")
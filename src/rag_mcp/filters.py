@@ -0,0 +1,208 @@
+import fnmatch
+import os
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+from .manifest import Manifest
+
+_GLOB_CHARS = set("*?[")
+
+def parse_modified_after(value: Union[str, float, int, None]) -> Optional[float]:
+    """Accept a unix timestamp or an ISO 8601 date/datetime (local time unless it has an offset)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"modified_after must be a unix timestamp or ISO date, got {value!r}")
+
+def normalize_extension(ext: str) -> str:
+    """`py`, `.py` and `.PY` all mean `.py`, matching the file_ext metadata written by the indexer."""
+    ext = ext.strip().lower()
+    if ext and not ext.startswith('.'):
+        ext = '.' + ext
+    return ext
+
+class SearchFilters(NamedTuple):
+    """Restrictions on which files a search may return, shared by every searched directory."""
+    # A file or directory, absolute or relative to each searched directory
+    path_prefix: Optional[str] = None
+    extensions: Optional[List[str]] = None
+    # Unix timestamp
+    modified_after: Optional[float] = None
+    # Files, directories or glob patterns (matched against paths relative to the searched directory)
+    exclude: Optional[List[str]] = None
+
+    @classmethod
+    def from_args(cls, path_prefix: Optional[str] = None, extensions: Optional[List[str]] = None,
+                  modified_after: Union[str, float, None] = None, exclude: Optional[List[str]] = None) -> "SearchFilters":
+        """Build filters from tool arguments, raising ValueError for unparseable values."""
+        return cls(
+            path_prefix=path_prefix or None,
+            extensions=[normalize_extension(ext) for ext in extensions] if extensions else None,
+            modified_after=parse_modified_after(modified_after),
+            exclude=[pattern for pattern in exclude if pattern] if exclude else None
+        )
+
+    def is_empty(self) -> bool:
+        return not (self.path_prefix or self.extensions or self.modified_after is not None or self.exclude)
+
+# Chunk metadata layout version that added the dir_N fields written by directory_fields
+DIRECTORY_FIELDS_VERSION = 4
+
+# Longest file list sent in a where clause; SQLite refuses statements with more than 32766 variables
+MAX_WHERE_PATHS = 1000
+
+def _resolve(target_dir: str, path: str) -> str:
+    return os.path.normpath(os.path.join(target_dir, os.path.expanduser(path)))
+
+def _directory_key(directory: str, root_dir: str) -> Tuple[str, str]:
+    parts = os.path.relpath(directory, root_dir).split(os.sep)
+    return f"dir_{len(parts)}", "/".join(parts)
+
+def directory_fields(file_path: str, root_dir: str) -> Dict[str, str]:
+    """
+    Chunk metadata naming each directory between root_dir and the file, so that one equality on
+    a single field selects a whole subtree: a/b/c.txt gets dir_1 = "a" and dir_2 = "a/b".
+    """
+    directory = os.path.dirname(file_path)
+    if not directory.startswith(root_dir.rstrip(os.sep) + os.sep):
+        return {}
+    parts = os.path.relpath(directory, root_dir).split(os.sep)
+    return {f"dir_{depth}": "/".join(parts[:depth]) for depth in range(1, len(parts) + 1)}
+
+class DirectoryFilter:
+    """
+    SearchFilters resolved against one indexed directory.
+    Directories are matched through the dir_N chunk fields, and files by path. Glob exclusions are
+    expanded to file lists through the manifest, because Chroma can compare metadata values but
+    not match patterns. `where` restricts the nearest-neighbour query itself, and `accepts` applies
+    the same conditions to keyword search, and to vector results when `where` is not `complete`.
+    """
+    def __init__(self, filters: SearchFilters, target_dir: str, manifest: Manifest):
+        self.filters = filters
+        self.target_dir = os.path.abspath(target_dir)
+        self.manifest = manifest
+        # True when no file in this directory can match, so the search can be skipped
+        self.matches_nothing = False
+        # False when a file list was too long for `where`, which then lets more chunks through than accepts
+        self.complete = True
+        # The file or directory searched in
+        self.prefix: Optional[str] = None
+        self.excluded: Set[str] = set()
+        self.excluded_dirs: List[str] = []
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self.where = self._build_where()
+
+    def _build_where(self) -> Optional[dict]:
+        filters = self.filters
+        conditions = []
+        # Indexes written before the dir_N fields fall back to file lists until they are re-indexed
+        has_fields = int(self.manifest.get_meta("metadata_version") or 1) >= DIRECTORY_FIELDS_VERSION
+
+        if filters.path_prefix:
+            prefix = _resolve(self.target_dir, filters.path_prefix)
+            if prefix != self.target_dir:
+                if not prefix.startswith(self.target_dir + os.sep):
+                    self.matches_nothing = True
+                    return None
+                self.prefix = prefix
+                if self.manifest.get(prefix) is not None:
+                    conditions.append({"file_path": prefix})
+                elif has_fields:
+                    key, value = _directory_key(prefix, self.target_dir)
+                    conditions.append({key: value})
+                else:
+                    paths = self.manifest.paths(under=prefix)
+                    if not paths:
+                        self.matches_nothing = True
+                        return None
+                    conditions.append(self._paths_condition("$in", paths))
+
+        if filters.exclude:
+            self._resolve_excluded(filters.exclude)
+            if self.matches_nothing:
+                return None
+            if has_fields:
+                for directory in self.excluded_dirs:
+                    key, value = _directory_key(directory, self.target_dir)
+                    # Chunks without the key, e.g. of files at the top level, pass $ne
+                    conditions.append({key: {"$ne": value}})
+            else:
+                for directory in self.excluded_dirs:
+                    self.excluded.update(self.manifest.paths(under=directory))
+            if self.excluded:
+                conditions.append(self._paths_condition("$nin", sorted(self.excluded)))
+
+        if filters.extensions:
+            conditions.append({"file_ext": {"$in": list(filters.extensions)}})
+        if filters.modified_after is not None:
+            conditions.append({"mtime": {"$gte": filters.modified_after}})
+
+        conditions = [condition for condition in conditions if condition is not None]
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+
+    def _paths_condition(self, operator: str, paths: List[str]) -> Optional[dict]:
+        """A file_path condition, or None when there are too many paths and accepts has to check them."""
+        if len(paths) > MAX_WHERE_PATHS:
+            self.complete = False
+            return None
+        return {"file_path": {operator: paths}}
+
+    def _resolve_excluded(self, patterns: List[str]):
+        all_paths: Optional[List[str]] = None
+        for pattern in patterns:
+            if _GLOB_CHARS & set(pattern):
+                if all_paths is None:
+                    # A central index also holds other directories
+                    all_paths = self.manifest.paths(under=self.target_dir)
+                pattern = pattern.replace(os.sep, '/')
+                for path in all_paths:
+                    rel_path = os.path.relpath(path, self.target_dir).replace(os.sep, '/')
+                    if fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern):
+                        self.excluded.add(path)
+                continue
+            path = _resolve(self.target_dir, pattern)
+            if path == self.target_dir:
+                self.matches_nothing = True
+            elif not path.startswith(self.target_dir + os.sep):
+                continue
+            elif self.manifest.get(path) is not None:
+                self.excluded.add(path)
+            else:
+                self.excluded_dirs.append(path)
+
+    def accepts(self, file_path: str) -> bool:
+        """Whether chunks of file_path pass the filters; the same conditions as `where`."""
+        if self.matches_nothing:
+            return False
+        if self.prefix is not None and file_path != self.prefix and not file_path.startswith(self.prefix + os.sep):
+            return False
+        if file_path in self.excluded:
+            return False
+        if any(file_path.startswith(directory + os.sep) for directory in self.excluded_dirs):
+            return False
+        if self.filters.extensions and os.path.splitext(file_path)[1].lower() not in self.filters.extensions:
+            return False
+        if self.filters.modified_after is not None:
+            mtime = self._mtime(file_path)
+            if mtime is None or mtime < self.filters.modified_after:
+                return False
+        return True
+
+    def _mtime(self, file_path: str) -> Optional[float]:
+        if file_path not in self._mtimes:
+            record = self.manifest.get(file_path)
+            # Same value the indexer stores as chunk metadata
+            self._mtimes[file_path] = record.mtime_ns / 1e9 if record is not None and record.mtime_ns >= 0 else None
+        return self._mtimes[file_path]
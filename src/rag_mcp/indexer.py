@@ -1,122 +1,509 @@
+import hashlib
 import os
+import queue
+import threading
 import time
-import uuid
-from typing import List, Dict, Set
+from typing import List, Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
 from .config import AppConfig
 from .storage import RAGStorage
-from .utils import is_text_file, read_file_content, chunk_text
+from .classify import FileClassifier, IGNORE_FILES
+from .manifest import FileRecord
+from .chunking import get_chunker
+from .filters import directory_fields
+from .batching import split_oversized
+from .cache import content_hash
+from .metrics import metrics
 
 from .logger import logger
 
+# Version of the chunk metadata layout; older indexes are upgraded in place by Indexer.index()
+# 2: added file_ext
+# 3: added root_dir
+# 4: added dir_1 ... dir_N, see filters.directory_fields
+METADATA_VERSION = 4
+
+def chunk_id(file_path: str, chunk_index: int, chunk: str) -> str:
+    """
+    Deterministic chunk id, so re-indexing a file keeps the ids of chunks that did not change.
+    """
+    key = f"{file_path}\0{chunk_index}\0{content_hash(chunk)}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def upgrade_chunk_metadata(meta: Optional[dict], root_dir: str) -> Optional[dict]:
+    """
+    Fill in metadata fields added since a chunk was written, returning meta itself if nothing was missing.
+    root_dir is only set for chunks of files below it.
+    """
+    if not meta or 'file_path' not in meta:
+        return meta
+    missing = {}
+    if 'file_ext' not in meta:
+        missing['file_ext'] = os.path.splitext(meta['file_path'])[1].lower()
+    if 'root_dir' not in meta and meta['file_path'].startswith(root_dir.rstrip(os.sep) + os.sep):
+        missing['root_dir'] = root_dir
+    # A central index holds chunks of other directories too, relative to their own root
+    chunk_root = meta.get('root_dir', missing.get('root_dir'))
+    if chunk_root is not None:
+        for key, value in directory_fields(meta['file_path'], chunk_root).items():
+            if key not in meta:
+                missing[key] = value
+    return dict(meta, **missing) if missing else meta
+
+class _ChunkedFile(NamedTuple):
+    """A run of consecutive chunks from one file; large files arrive as several parts."""
+    file_path: str
+    chunks: List[str]
+    metadatas: List[dict]
+    ids: List[str]
+    last: bool
+    stat: os.stat_result
+    content_hash: str
+    # Content matches the manifest, only the stat changed
+    unchanged: bool = False
+
 class Indexer:
-    def __init__(self, target_dir: str, config: AppConfig):
+    def __init__(self, target_dir: str, config: AppConfig, storage: Optional[RAGStorage] = None):
         self.target_dir = os.path.abspath(target_dir)
         self.config = config
-        self.storage = RAGStorage(self.target_dir, config)
+        self.storage = storage or RAGStorage(self.target_dir, config)
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {"files_scanned": 0, "files_indexed": 0, "chunks_embedded": 0, "chunks_unchanged": 0, "files_removed": 0}
 
     def index(self):
+        """Index the whole directory; self.stats then counts what this run did."""
+        self.stats = self._empty_stats()
+        with metrics.span("index.total"):
+            self._index()
+
+    def _index(self):
         logger.info(f"Indexing directory: {self.target_dir}")
-        self.storage.initialize()
+        if not self.storage.client:
+            self.storage.initialize()
+        self.storage.convert_vectors()
         
-        # Get existing files in DB
-        existing_data = self.storage.collection.get(include=['metadatas'])
-        
-        existing_files: Dict[str, float] = {} # path -> mtime
-        file_ids: Dict[str, List[str]] = {} # path -> list of chunk ids
-        
-        if existing_data and existing_data['ids']:
-            for i, meta in enumerate(existing_data['metadatas']):
-                if meta and 'file_path' in meta:
-                    fpath = meta['file_path']
-                    fmtime = meta.get('mtime', 0)
-                    existing_files[fpath] = fmtime
-                    if fpath not in file_ids:
-                        file_ids[fpath] = []
-                    file_ids[fpath].append(existing_data['ids'][i])
-
-        # Walk directory
+        manifest = self.storage.manifest
+        if manifest.is_empty() and self.storage.collection.count() > 0:
+            manifest.bootstrap(self.storage.collection)
+        if self.storage.lexical.is_empty() and self.storage.collection.count() > 0:
+            self.storage.lexical.bootstrap(self.storage.collection)
+        self._upgrade_metadata()
+        records = self._records()
+        journal = self._journal()
+        classifier = FileClassifier(self.target_dir, self.config.processing, manifest)
+
         current_files: Set[str] = set()
-        files_to_process = []
-        
-        for root, dirs, files in os.walk(self.target_dir):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-                
-            for file in files:
-                file_path = os.path.join(root, file)
-                if not is_text_file(file_path):
-                    continue
-                    
-                current_files.add(file_path)
-                mtime = os.path.getmtime(file_path)
-                
-                # Check if needs update
-                # Use a small epsilon for float comparison
-                if file_path not in existing_files or abs(existing_files[file_path] - mtime) > 1e-6:
-                    files_to_process.append(file_path)
+        complete = self._run_pipeline(classifier.walk(self.target_dir), records, journal, current_files)
+        self.stats["files_scanned"] += len(current_files)
+        if not complete:
+            # current_files is incomplete, so deletions can't be trusted
+            classifier.save()
+            logger.info("Indexing incomplete, skipped removing deleted files.")
+            return
+        classifier.save(complete=True)
 
-        # Identify deleted files
+        # Identify deleted files, and unfinished ones an interrupted run left behind
         files_to_delete = []
-        for fpath in existing_files:
+        for fpath in set(records) | set(journal):
             if fpath not in current_files:
                 files_to_delete.append(fpath)
+        self._remove_files(files_to_delete, records, journal)
+                
+        logger.info("Indexing complete.")
+
+    def _journal(self) -> Dict[str, FileRecord]:
+        """Files of this directory that an interrupted run started writing, with the chunk ids it journaled."""
+        journal = self.storage.manifest.load_pending(self.target_dir)
+        if journal:
+            logger.info(f"Resuming interrupted indexing of {self.target_dir}: {len(journal)} files were unfinished")
+        return journal
+
+    def _records(self) -> Dict[str, FileRecord]:
+        """Manifest records of this directory; a central manifest also lists other directories."""
+        if self.storage.central:
+            return self.storage.manifest.records_under(self.target_dir)
+        return self.storage.manifest.load()
+
+    def index_paths(self, paths: Iterable[str]):
+        """
+        Re-index only the given files or directories, e.g. the ones reported by a filesystem watcher.
+        Paths that no longer exist are removed from the index along with everything under them.
+        A changed .gitignore or .ragignore can affect any file, so it re-indexes the whole directory.
+        """
+        paths = set(os.path.abspath(p) for p in paths)
+        if any(os.path.basename(path) in IGNORE_FILES for path in paths):
+            logger.info(f"Ignore rules changed in {self.target_dir}, re-indexing the whole directory")
+            self.index()
+            return
+        if not self.storage.client:
+            self.storage.initialize()
+        manifest = self.storage.manifest
+        classifier = FileClassifier(self.target_dir, self.config.processing, manifest)
+        # Unfinished files outside `paths` are left for the next full index run
+        journal = self._journal()
+
+        files: Dict[str, os.stat_result] = {}
+        records: Dict[str, FileRecord] = {}
+        for path in paths:
+            rel_path = os.path.relpath(path, self.target_dir)
+            if rel_path.startswith('..') or any(part.startswith('.') for part in rel_path.split(os.sep)):
+                continue
+            if classifier.ignore.ignored(path, os.path.isdir(path)):
+                # Nothing ignored is indexed, but a file may have been moved here from an indexed place
+                records.update(manifest.records_under(path))
+            elif os.path.isdir(path):
+                files.update(classifier.walk(path))
+                # Files under the directory that are no longer there get removed below
+                records.update(manifest.records_under(path))
+            elif os.path.isfile(path):
+                st = os.stat(path)
+                if classifier.is_text(path, st):
+                    files[path] = st
+                record = manifest.get(path)
+                if record is not None:
+                    records[path] = record
+            else:
+                # Deleted file, or a directory that was deleted or moved away
+                records.update(manifest.records_under(path))
+
+        current_files: Set[str] = set()
+        if files:
+            logger.info(f"Updating {len(files)} changed files in {self.target_dir}")
+            self._run_pipeline(iter(files.items()), records, journal, current_files)
+        classifier.save()
+        self._remove_files([fpath for fpath in records if fpath not in current_files], records, journal)
+
+    def _run_pipeline(self, files: Iterator[Tuple[str, os.stat_result]], records: Dict[str, FileRecord],
+                      journal: Dict[str, FileRecord], current_files: Set[str]) -> bool:
+        """
+        Index every file from `files` whose stat differs from its manifest record, adding each
+        path to current_files. Returns False if iterating `files` failed part way.
+        """
+        # Stages run concurrently: scanner -> reader/chunker pool -> embed/write (this thread),
+        # joined by bounded queues so memory stays flat however many files change
+        workers = max(1, self.config.processing.workers)
+        read_queue: "queue.Queue[Optional[Tuple[str, os.stat_result]]]" = queue.Queue(maxsize=self.config.processing.queue_size)
+        embed_queue: "queue.Queue[Optional[_ChunkedFile]]" = queue.Queue(maxsize=self.config.processing.queue_size)
+        scan_result = {"to_process": 0}
+
+        def scan():
+            try:
+                for file_path, st in files:
+                    current_files.add(file_path)
+                    # Check if needs update: same (size, mtime_ns, inode) means unchanged, without reading the file
+                    record = records.get(file_path)
+                    if record is None or not record.same_stat(st):
+                        scan_result["to_process"] += 1
+                        read_queue.put((file_path, st))
+            except Exception as e:
+                logger.error(f"Error scanning {self.target_dir}: {e}")
+                scan_result["error"] = e
+            finally:
+                for _ in range(workers):
+                    read_queue.put(None)
+
+        def read():
+            try:
+                while True:
+                    item = read_queue.get()
+                    if item is None:
+                        break
+                    file_path, st = item
+                    try:
+                        start = time.perf_counter()
+                        for part in self._iter_file_parts(file_path, st, records.get(file_path)):
+                            # Time spent reading and chunking, not waiting for the embed stage
+                            read_time = time.perf_counter() - start
+                            with metrics.span("index.queue_wait"):
+                                embed_queue.put(part)
+                            if metrics.enabled:
+                                metrics.observe("index.read_chunk", read_time)
+                            start = time.perf_counter()
+                    except Exception as e:
+                        logger.error(f"Error processing {file_path}: {e}")
+            finally:
+                embed_queue.put(None)
 
+        threads = [threading.Thread(target=scan, name="index-scan", daemon=True)]
+        threads += [threading.Thread(target=read, name=f"index-read-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        processed = self._write_chunks(embed_queue, workers, records, journal)
+        self.stats["files_indexed"] += processed
+
+        for thread in threads:
+            thread.join()
+        logger.info(f"Processed {processed}/{scan_result['to_process']} files")
+        return "error" not in scan_result
+
+    def _upgrade_metadata(self, batch_size: int = 1000):
+        """Add metadata fields introduced after an index was built to its existing chunks."""
+        manifest = self.storage.manifest
+        version = int(manifest.get_meta("metadata_version") or 1)
+        if version >= METADATA_VERSION:
+            return
+
+        collection = self.storage.collection
+        total = collection.count()
+        if total:
+            logger.info(f"Upgrading metadata of {total} chunks")
+        for offset in range(0, total, batch_size):
+            data = collection.get(include=['metadatas'], limit=batch_size, offset=offset)
+            ids, metadatas = [], []
+            for doc_id, meta in zip(data['ids'], data['metadatas']):
+                upgraded = upgrade_chunk_metadata(meta, self.target_dir)
+                if upgraded is not meta:
+                    ids.append(doc_id)
+                    metadatas.append(upgraded)
+            if ids:
+                self.storage.update_metadatas(metadatas, ids)
+        manifest.set_meta("metadata_version", str(METADATA_VERSION))
+
+    def _remove_files(self, files_to_delete: List[str], records: Dict[str, FileRecord], journal: Optional[Dict[str, FileRecord]] = None):
         # Delete removed files
+        self.stats["files_removed"] += len(files_to_delete)
         if files_to_delete:
             logger.info(f"Removing {len(files_to_delete)} deleted files from index...")
             all_ids_to_delete = []
             for fpath in files_to_delete:
-                if fpath in file_ids:
-                    all_ids_to_delete.extend(file_ids[fpath])
+                for source in (records, journal or {}):
+                    if fpath in source:
+                        all_ids_to_delete.extend(source[fpath].chunk_ids)
             if all_ids_to_delete:
-                self.storage.collection.delete(ids=all_ids_to_delete)
-
-        # Process new/modified files
-        # First, delete old chunks for modified files
-        ids_to_remove_for_update = []
-        for fpath in files_to_process:
-            if fpath in file_ids:
-                ids_to_remove_for_update.extend(file_ids[fpath])
-        
-        if ids_to_remove_for_update:
-             self.storage.collection.delete(ids=ids_to_remove_for_update)
+                self.storage.delete_documents(all_ids_to_delete)
+            self.storage.manifest.update({}, deleted=files_to_delete)
+
+    def _iter_file_parts(self, file_path: str, st: os.stat_result, record: Optional[FileRecord]) -> Iterator["_ChunkedFile"]:
+        """
+        Chunk a file into parts of at most max_batch_size chunks.
+        A file whose content hash matches its manifest record yields a single unchanged part instead.
+        Files above processing.stream_threshold_mb are streamed twice (once to count chunks,
+        once to emit them), so memory depends on chunk size rather than file size.
+        """
+        def limit(chunks: Iterable[str]) -> Iterator[str]:
+            # Keep every chunk within the model's context window
+            for chunk in chunks:
+                yield from split_oversized([chunk], self.config.model.context_window, self.config.model.chars_per_token)
 
-        logger.info(f"Processing {len(files_to_process)} files...")
+        chunker = get_chunker(self.config.processing, file_path)
+        if st.st_size <= self.config.processing.stream_threshold_mb * 1024 * 1024:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if record is not None and record.content_hash == digest:
+                yield _ChunkedFile(file_path, [], [], [], last=True, stat=st, content_hash=digest, unchanged=True)
+                return
+            # The sniff only checked the start: bytes that are not UTF-8 further on become U+FFFD, as in
+            # read_raw_file, rather than failing the file on every run
+            content = data.decode('utf-8', errors='replace')
+            chunks = list(limit(chunker.split(content))) if content else []
+            # An empty file still yields a part, so its old chunks are removed and it is recorded
+            yield self._make_part(file_path, st, digest, chunks, 0, len(chunks))
+            return
+
+        digest = file_hash(file_path)
+        if record is not None and record.content_hash == digest:
+            yield _ChunkedFile(file_path, [], [], [], last=True, stat=st, content_hash=digest, unchanged=True)
+            return
+
+        total_chunks = sum(1 for _ in limit(chunker.iter_file(file_path)))
+        part_size = self.config.model.max_batch_size
+        part: List[str] = []
+        offset = 0
+        for chunk in limit(chunker.iter_file(file_path)):
+            part.append(chunk)
+            if len(part) >= part_size:
+                yield self._make_part(file_path, st, digest, part, offset, total_chunks)
+                offset += len(part)
+                part = []
+        if part or offset == 0:
+            yield self._make_part(file_path, st, digest, part, offset, total_chunks)
+
+    def _make_part(self, file_path: str, st: os.stat_result, digest: str, chunks: List[str], offset: int, total_chunks: int) -> "_ChunkedFile":
+        file_name = os.path.basename(file_path)
+        file_ext = os.path.splitext(file_name)[1].lower()
+        dir_fields = directory_fields(file_path, self.target_dir)
         
-        for i, file_path in enumerate(files_to_process):
+        doc_ids = []
+        metadatas = []
+        for i, chunk in enumerate(chunks, start=offset):
+            doc_ids.append(chunk_id(file_path, i, chunk))
+            metadatas.append({
+                "file_path": file_path,
+                "file_name": file_name,
+                "file_ext": file_ext,
+                "root_dir": self.target_dir,
+                "mtime": st.st_mtime,
+                "chunk_index": i,
+                "total_chunks": total_chunks,
+                **dir_fields
+            })
+        return _ChunkedFile(
+            file_path, chunks, metadatas, doc_ids,
+            last=offset + len(chunks) >= total_chunks,
+            stat=st,
+            content_hash=digest
+        )
+
+    def _write_chunks(self, embed_queue: "queue.Queue[Optional[_ChunkedFile]]", producers: int,
+                      records: Dict[str, FileRecord], journal: Dict[str, FileRecord]) -> int:
+        """
+        Embed and write chunked files from embed_queue until every producer is done,
+        recording each completed file in the manifest in the same flush.
+        Chunks from several files are buffered so their embedding batches can be sent concurrently.
+
+        Every flush is a checkpoint. The ids about to be written are journaled first, so a chunk is
+        always listed by the manifest or the journal. A file's old chunks are deleted only once
+        its new ones are all written, and the manifest record replaces the journal entry in one
+        transaction. After an interruption, the chunks the journal lists for a file whose content
+        is unchanged are reused instead of embedded again. Chunks that no longer match are deleted.
+        """
+        flush_threshold = self.config.model.max_batch_size * max(1, self.config.llm.max_concurrent_requests)
+        pending: List[_ChunkedFile] = []
+        pending_count = 0
+        processed = 0
+        stats = {"embedded": 0, "unchanged": 0}
+        # Chunk ids written so far for files whose last part hasn't arrived yet
+        written_ids: Dict[str, List[str]] = {}
+        # Files with a part that failed to write; they stay out of the manifest so the next run retries them
+        failed: Set[str] = set()
+        # Journaled chunks of an interrupted run that are complete and match the file's current content
+        resumed_ids: Dict[str, Set[str]] = {}
+
+        def resumed(f: _ChunkedFile) -> Set[str]:
+            if f.file_path not in resumed_ids:
+                entry = journal.get(f.file_path)
+                if entry is not None and entry.content_hash == f.content_hash:
+                    resumed_ids[f.file_path] = self.storage.existing_ids(entry.chunk_ids)
+                    metrics.inc("index.chunks_resumed", len(resumed_ids[f.file_path]))
+                else:
+                    resumed_ids[f.file_path] = set()
+            return resumed_ids[f.file_path]
+
+        def flush():
+            if not pending:
+                return
+            with metrics.span("index.flush"):
+                _flush()
+
+        def _flush():
             try:
-                content = read_file_content(file_path)
-                if not content:
+                add_docs, add_metas, add_ids = [], [], []
+                update_metas, update_ids = [], []
+                intents: Dict[str, FileRecord] = {}
+                for f in pending:
+                    record = records.get(f.file_path)
+                    old_ids = set(record.chunk_ids) if record else set()
+                    old_ids |= resumed(f)
+                    if f.ids:
+                        # Earlier journaled ids are kept too: they're deleted once the file is complete
+                        entry = intents.get(f.file_path) or journal.get(f.file_path)
+                        ids = list(dict.fromkeys((entry.chunk_ids if entry else []) + written_ids.get(f.file_path, []) + f.ids))
+                        intents[f.file_path] = FileRecord(f.stat.st_size, f.stat.st_mtime_ns, f.stat.st_ino, f.content_hash, ids)
+                    for chunk, meta, doc_id in zip(f.chunks, f.metadatas, f.ids):
+                        if doc_id in old_ids:
+                            # Unchanged chunk: refresh mtime/total_chunks without re-embedding
+                            update_metas.append(meta)
+                            update_ids.append(doc_id)
+                        else:
+                            add_docs.append(chunk)
+                            add_metas.append(meta)
+                            add_ids.append(doc_id)
+
+                if add_docs:
+                    self.storage.manifest.set_pending(intents)
+                    journal.update(intents)
+                    self.storage.add_documents(add_docs, add_metas, add_ids)
+                if update_ids:
+                    self.storage.update_metadatas(update_metas, update_ids)
+                stats["embedded"] += len(add_ids)
+                stats["unchanged"] += len(update_ids)
+                metrics.inc("index.chunks_embedded", len(add_ids))
+                metrics.inc("index.chunks_unchanged", len(update_ids))
+            except Exception as e:
+                logger.error(f"Error embedding {len(pending)} files ({pending[0].file_path}, ...): {e}")
+                failed.update(f.file_path for f in pending)
+
+            # Only now drop chunks that no longer exist, so a file is never missing from the index
+            ids_to_remove = []
+            completed: Dict[str, FileRecord] = {}
+            for f in pending:
+                record = records.get(f.file_path)
+                entry = journal.get(f.file_path)
+                if f.unchanged:
+                    # Same content under a new stat: only the manifest needs updating
+                    completed[f.file_path] = FileRecord(f.stat.st_size, f.stat.st_mtime_ns, f.stat.st_ino, f.content_hash, record.chunk_ids)
+                    if entry is not None:
+                        kept = set(record.chunk_ids)
+                        ids_to_remove.extend(doc_id for doc_id in entry.chunk_ids if doc_id not in kept)
                     continue
-                    
-                chunks = chunk_text(content, self.config.processing.chunk_count)
-                
-                if not chunks:
+                chunk_ids = written_ids.setdefault(f.file_path, [])
+                chunk_ids.extend(f.ids)
+                if not f.last:
                     continue
-                    
-                mtime = os.path.getmtime(file_path)
-                file_name = os.path.basename(file_path)
-                
-                doc_ids = [str(uuid.uuid4()) for _ in chunks]
-                metadatas = []
-                for chunk in chunks:
-                    metadatas.append({
-                        "file_path": file_path,
-                        "file_name": file_name,
-                        "mtime": mtime,
-                        "chunk_index": chunks.index(chunk),
-                        "total_chunks": len(chunks)
-                    })
-                
-                self.storage.add_documents(chunks, metadatas, doc_ids)
-                
-                if (i + 1) % 10 == 0:
-                    logger.info(f"Processed {i + 1}/{len(files_to_process)} files")
-                    
+                del written_ids[f.file_path]
+                if f.file_path in failed:
+                    failed.discard(f.file_path)
+                    continue
+                kept = set(chunk_ids)
+                for old in (record, entry):
+                    if old is not None:
+                        ids_to_remove.extend(doc_id for doc_id in old.chunk_ids if doc_id not in kept)
+                completed[f.file_path] = FileRecord(f.stat.st_size, f.stat.st_mtime_ns, f.stat.st_ino, f.content_hash, chunk_ids)
+            try:
+                if ids_to_remove:
+                    self.storage.delete_documents(list(dict.fromkeys(ids_to_remove)))
+                self.storage.manifest.update(completed)
+                for path in completed:
+                    journal.pop(path, None)
+                    resumed_ids.pop(path, None)
             except Exception as e:
-                logger.error(f"Error processing {file_path}: {e}")
-                
-        logger.info("Indexing complete.")
+                logger.error(f"Error updating index for {len(completed)} files: {e}")
+            pending.clear()
+
+        finished = 0
+        while finished < producers:
+            chunked = embed_queue.get()
+            if chunked is None:
+                finished += 1
+                continue
+            pending.append(chunked)
+            pending_count += len(chunked.chunks)
+            if pending_count >= flush_threshold:
+                flush()
+                pending_count = 0
+            if chunked.last:
+                processed += 1
+                metrics.inc("index.files")
+                if processed % 10 == 0:
+                    logger.info(f"Processed {processed} files")
+
+        flush()
+        self.stats["chunks_embedded"] += stats["embedded"]
+        self.stats["chunks_unchanged"] += stats["unchanged"]
+        if processed:
+            logger.info(f"Wrote {stats['embedded']} new chunks, kept {stats['unchanged']} unchanged chunks")
+        return processed
 
     def clean(self):
-        self.storage.clear()
+        if not self.storage.central:
+            self.storage.clear()
+            return
+        # Other directories share the index, so only this one's chunks go
+        if not self.storage.client:
+            self.storage.initialize()
+        records = self._records()
+        journal = self.storage.manifest.load_pending(self.target_dir)
+        self._remove_files(list(set(records) | set(journal)), records, journal)
+        manifest = self.storage.manifest
+        manifest.update_file_types({}, deleted=list(manifest.load_file_types(self.target_dir)))
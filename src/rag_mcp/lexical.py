@@ -0,0 +1,235 @@
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from .logger import logger
+
+# BM25 parameters, the usual defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Terms in more than this share of chunks (common CJK characters, "the") only add to the score
+# of chunks found by the query's rarer terms
+COMMON_TERM_RATIO = 0.5
+
+# Tokens longer than this (hashes, base64 blobs) are never searched for and only bloat the index
+MAX_TOKEN_LENGTH = 64
+
+# Kana, CJK ideographs and Hangul
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# A run of CJK characters, or a word of any other script (excluding CJK, so "abc中文" is two tokens)
+_TOKEN_RE = re.compile(f"[{_CJK_RANGES}]+|[^\\W{_CJK_RANGES}]+")
+_CJK_RE = re.compile(f"[{_CJK_RANGES}]")
+# Parts of an identifier: HTTPServer -> HTTP, Server; get_user2 -> get, user, 2
+_SUBWORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into search terms.
+    Words are lowercased and identifiers also yield their parts (snake_case, camelCase), so both
+    `getUserName` and `user name` match. CJK text has no word boundaries, so runs of CJK
+    characters yield every character and every pair of adjacent characters.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        word = match.group()
+        if _CJK_RE.match(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            continue
+        if len(word) > MAX_TOKEN_LENGTH:
+            continue
+        tokens.append(word.lower())
+        parts = _SUBWORD_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+class LexicalHit(NamedTuple):
+    doc_id: str
+    score: float
+    # Number of distinct query terms found in the chunk
+    matched_terms: int
+
+class LexicalIndex:
+    """
+    On-disk inverted index over chunk text with BM25 scoring.
+    Lives next to the Chroma database and is kept in step with it by RAGStorage, so keyword
+    queries can be answered without embedding them.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+        if columns and "file_path" not in columns:
+            # Written before search filters existed; dropped here and rebuilt by the next index run
+            self._conn.executescript("DROP TABLE docs; DROP TABLE postings; DROP TABLE stats;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                length INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id)")
+        # Corpus totals for BM25, kept up to date on every write instead of counted per query
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO stats VALUES ('doc_count', 0), ('total_length', 0)")
+        self._conn.commit()
+
+    def add(self, ids: List[str], documents: List[str], file_paths: List[str]):
+        """Index chunks, replacing any existing chunk with the same id."""
+        rows = []
+        postings = []
+        for doc_id, doc, file_path in zip(ids, documents, file_paths):
+            counts = Counter(tokenize(doc))
+            rows.append((doc_id, file_path, sum(counts.values())))
+            postings.extend((term, doc_id, tf) for term, tf in counts.items())
+        with self._lock, self._conn:
+            self._delete(ids)
+            self._conn.executemany("INSERT INTO docs (id, file_path, length) VALUES (?, ?, ?)", rows)
+            self._conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings)
+            self._add_stats(len(rows), sum(row[2] for row in rows))
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._delete(list(ids))
+
+    def _delete(self, ids: List[str]):
+        removed = 0
+        removed_length = 0
+        for doc_id in ids:
+            row = self._conn.execute("SELECT length FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+            removed += 1
+            removed_length += row[0]
+        if removed:
+            self._add_stats(-removed, -removed_length)
+
+    def _add_stats(self, doc_count: int, total_length: int):
+        self._conn.executemany(
+            "UPDATE stats SET value = value + ? WHERE key = ?",
+            [(doc_count, "doc_count"), (total_length, "total_length")]
+        )
+
+    def existing(self, ids: List[str], batch_size: int = 500) -> Set[str]:
+        """The ids among `ids` that are indexed."""
+        found: Set[str] = set()
+        with self._lock:
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                placeholders = ",".join("?" * len(batch))
+                found.update(row[0] for row in self._conn.execute(f"SELECT id FROM docs WHERE id IN ({placeholders})", batch))
+        return found
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone() is None
+
+    def search(self, query: str, n_results: int, path_filter: Optional[Callable[[str], bool]] = None) -> List[LexicalHit]:
+        """
+        Return the n_results chunks with the highest BM25 score for query, best first.
+        Chunks of files rejected by path_filter are skipped before ranking.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT key, value FROM stats").fetchall())
+            doc_count = stats["doc_count"]
+            if doc_count == 0:
+                return []
+            avg_length = stats["total_length"] / doc_count
+
+            placeholders = ",".join("?" * len(terms))
+            weights = []
+            rare_postings = common_postings = 0
+            for term, df in self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", list(terms)
+            ):
+                # IDF is over the whole corpus, so filtering doesn't change how terms are weighted
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                rare = df <= doc_count * COMMON_TERM_RATIO
+                weights.append((term, idf, rare))
+                if rare:
+                    rare_postings += df
+                else:
+                    common_postings += df
+            if not weights:
+                return []
+            if not rare_postings:
+                weights = [(term, idf, True) for term, idf, _ in weights]
+            common_terms = sum(1 for _, _, rare in weights if not rare)
+
+            # Only chunks containing one of the rarer terms are ranked, scored on all terms.  Scoring
+            # and ranking run inside SQLite; when the candidates are few, common terms are looked up
+            # per candidate instead of scanning all of their postings
+            values = ",".join(["(?, ?, ?)"] * len(weights))
+            score = "SUM(w.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?)))"
+            if rare_postings * common_terms < common_postings:
+                sql = f"""
+                    WITH weights(term, idf, rare) AS (VALUES {values}),
+                    candidates AS (SELECT DISTINCT p.doc_id FROM weights w JOIN postings p ON p.term = w.term WHERE w.rare)
+                    SELECT c.doc_id, d.file_path, COUNT(*), {score} AS score
+                    FROM candidates c CROSS JOIN weights w
+                    JOIN postings p ON p.term = w.term AND p.doc_id = c.doc_id
+                    JOIN docs d ON d.id = c.doc_id
+                    GROUP BY c.doc_id ORDER BY score DESC, c.doc_id"""
+            else:
+                sql = f"""
+                    WITH weights(term, idf, rare) AS (VALUES {values})
+                    SELECT p.doc_id, d.file_path, COUNT(*), {score} AS score
+                    FROM weights w JOIN postings p ON p.term = w.term JOIN docs d ON d.id = p.doc_id
+                    GROUP BY p.doc_id HAVING MAX(w.rare) ORDER BY score DESC, p.doc_id"""
+            params = [value for weight in weights for value in weight] + [BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, avg_length]
+            if path_filter is None:
+                sql += " LIMIT ?"
+                params.append(n_results)
+            rows = self._conn.execute(sql, params)
+            # With a filter the ranked rows are streamed until enough of them pass
+            hits: List[LexicalHit] = []
+            accepted: Dict[str, bool] = {}
+            for doc_id, file_path, matched, score in rows:
+                if len(hits) == n_results:
+                    break
+                if path_filter is not None:
+                    if file_path not in accepted:
+                        accepted[file_path] = path_filter(file_path)
+                    if not accepted[file_path]:
+                        continue
+                hits.append(LexicalHit(doc_id, score, matched))
+        return hits
+
+    def bootstrap(self, collection, batch_size: int = 1000):
+        """Build the index of a collection created before lexical indexes existed."""
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            data = collection.get(include=['documents', 'metadatas'], limit=batch_size, offset=offset)
+            self.add(
+                data['ids'],
+                [doc or "" for doc in data['documents']],
+                [(meta or {}).get('file_path', "") for meta in data['metadatas']]
+            )
+        logger.info(f"Built keyword index for {total} chunks from existing index")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .logger import logger
+
+class FileRecord(NamedTuple):
+    """What the index knows about one file."""
+    size: int
+    mtime_ns: int
+    inode: int
+    content_hash: Optional[str]
+    chunk_ids: List[str]
+
+    def same_stat(self, st: os.stat_result) -> bool:
+        return self.size == st.st_size and self.mtime_ns == st.st_mtime_ns and self.inode == st.st_ino
+
+def _under(path: str) -> Tuple[str, tuple]:
+    """WHERE clause matching `path` and every path below it."""
+    prefix = path.rstrip(os.sep) + os.sep
+    # Every path starting with prefix sorts in [prefix, prefix with its last char incremented)
+    upper = prefix[:-1] + chr(ord(os.sep) + 1)
+    return "WHERE path = ? OR (path >= ? AND path < ?)", (path, prefix, upper)
+
+class Manifest:
+    """
+    On-disk record of every indexed file: size, mtime, inode, content hash and chunk ids.
+    Lets a re-index detect changes from a stat() alone instead of scanning the collection.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT,
+                chunk_ids TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Journal of files being indexed: the chunk ids written, or about to be written, before the
+        # file is complete. Rows are removed in the transaction that records the finished file
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT,
+                chunk_ids TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Whether files of unknown type were found to be text when they had this size and mtime
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_types (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                is_text INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Index-wide settings, e.g. the version of the chunk metadata layout
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def _select(self, where: str = "", params: tuple = (), table: str = "files") -> Dict[str, FileRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path, size, mtime_ns, inode, content_hash, chunk_ids FROM {table} {where}", params
+            ).fetchall()
+        return {
+            path: FileRecord(size, mtime_ns, inode, content_hash, chunk_ids.split())
+            for path, size, mtime_ns, inode, content_hash, chunk_ids in rows
+        }
+
+    def load(self) -> Dict[str, FileRecord]:
+        return self._select()
+
+    def get(self, path: str) -> Optional[FileRecord]:
+        return self._select("WHERE path = ?", (path,)).get(path)
+
+    def records_under(self, path: str) -> Dict[str, FileRecord]:
+        """Records for `path` itself and, if it is a directory, every file below it."""
+        return self._select(*_under(path))
+
+    def paths(self, under: Optional[str] = None) -> List[str]:
+        """Every recorded path, or only those at or below `under`."""
+        where, params = _under(under) if under else ("", ())
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT path FROM files {where}", params)]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_empty(self) -> bool:
+        """True if no file was ever recorded or journaled, e.g. for an index built before manifests existed."""
+        with self._lock:
+            return (
+                self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+                and self._conn.execute("SELECT 1 FROM pending LIMIT 1").fetchone() is None
+            )
+
+    def update(self, records: Dict[str, FileRecord], deleted: Iterable[str] = ()):
+        """Write records and remove deleted paths in one transaction, closing their journal entries."""
+        deleted = [(path,) for path in deleted]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, content_hash, chunk_ids) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (path, r.size, r.mtime_ns, r.inode, r.content_hash, " ".join(r.chunk_ids))
+                    for path, r in records.items()
+                ]
+            )
+            self._conn.executemany("DELETE FROM files WHERE path = ?", deleted)
+            self._conn.executemany("DELETE FROM pending WHERE path = ?", [(path,) for path in records])
+            self._conn.executemany("DELETE FROM pending WHERE path = ?", deleted)
+
+    def load_pending(self, under: str) -> Dict[str, FileRecord]:
+        """Journal entries at or below `under`: files an earlier run started but did not finish."""
+        return self._select(*_under(under), table="pending")
+
+    def set_pending(self, records: Dict[str, FileRecord]):
+        """Journal the chunk ids of unfinished files; must be durable before those chunks are written."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pending (path, size, mtime_ns, inode, content_hash, chunk_ids) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (path, r.size, r.mtime_ns, r.inode, r.content_hash, " ".join(r.chunk_ids))
+                    for path, r in records.items()
+                ]
+            )
+
+    def load_file_types(self, under: str) -> Dict[str, Tuple[int, int, bool]]:
+        """Cached (size, mtime_ns, is_text) of files at or below `under`."""
+        where, params = _under(under)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT path, size, mtime_ns, is_text FROM file_types {where}", params).fetchall()
+        return {path: (size, mtime_ns, bool(is_text)) for path, size, mtime_ns, is_text in rows}
+
+    def update_file_types(self, entries: Dict[str, Tuple[int, int, bool]], deleted: Iterable[str] = ()):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO file_types (path, size, mtime_ns, is_text) VALUES (?, ?, ?, ?)",
+                [(path, size, mtime_ns, int(is_text)) for path, (size, mtime_ns, is_text) in entries.items()]
+            )
+            self._conn.executemany("DELETE FROM file_types WHERE path = ?", [(path,) for path in deleted])
+
+    def bootstrap(self, collection):
+        """
+        Build the manifest of an index created before manifests existed, from chunk metadata.
+        Files whose mtime still matches are recorded with their current stat, so they are not re-embedded.
+        """
+        existing_data = collection.get(include=['metadatas'])
+        mtimes: Dict[str, float] = {}
+        file_ids: Dict[str, List[str]] = {}
+        for doc_id, meta in zip(existing_data['ids'], existing_data['metadatas']):
+            if meta and 'file_path' in meta:
+                mtimes[meta['file_path']] = meta.get('mtime', 0)
+                file_ids.setdefault(meta['file_path'], []).append(doc_id)
+
+        records = {}
+        for path, ids in file_ids.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is not None and abs(st.st_mtime - mtimes[path]) <= 1e-6:
+                records[path] = FileRecord(st.st_size, st.st_mtime_ns, st.st_ino, None, ids)
+            else:
+                # Unknown state: an impossible stat forces the file to be re-indexed
+                records[path] = FileRecord(-1, -1, -1, None, ids)
+        self.update(records)
+        logger.info(f"Built manifest for {len(records)} files from existing index")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
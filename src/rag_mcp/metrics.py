@@ -0,0 +1,206 @@
+import atexit
+import bisect
+import contextvars
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Upper bounds in seconds, from sub-millisecond cache hits to minute-long index flushes
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram, cumulative like Prometheus."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Trace:
+    """Timings of one request, collected from every thread that runs in its context."""
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    def breakdown(self) -> Dict[str, dict]:
+        result: Dict[str, dict] = {}
+        # list.append is atomic, so worker threads can record without a lock
+        for name, seconds in list(self.spans):
+            entry = result.setdefault(name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += seconds * 1000
+        for entry in result.values():
+            entry["ms"] = round(entry["ms"], 3)
+        return result
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("rag_mcp_trace", default=None)
+
+class _NullSpan:
+    """Shared no-op span returned while nothing is being measured."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("metrics", "name", "trace", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, trace: Optional[Trace]):
+        self.metrics = metrics
+        self.name = name
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if self.trace is not None:
+            self.trace.spans.append((self.name, elapsed))
+        if self.metrics.enabled:
+            self.metrics.observe(self.name, elapsed)
+        return False
+
+class _TraceScope:
+    def __init__(self):
+        self.trace = Trace()
+        self._token = None
+
+    def __enter__(self) -> Trace:
+        self._token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self._token)
+        return False
+
+class Metrics:
+    """
+    Process-wide stage timings and counters.
+    Disabled by default: `span` then returns a shared no-op unless a request trace is active,
+    so instrumented code pays one attribute check and one context variable lookup.
+    """
+    def __init__(self):
+        self.enabled = False
+        # Set by export_on_exit; keeps metrics on whatever the config says
+        self.export_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._started = time.time()
+
+    def configure(self, enabled: bool):
+        self.enabled = enabled or self.export_path is not None
+
+    def export_on_exit(self, path: str):
+        """Enable metrics and write them to path when the process exits."""
+        self.export_path = path
+        self.enabled = True
+        atexit.register(self.dump, path)
+
+    def span(self, name: str):
+        """Time a stage: `with metrics.span("search.embed_query"): ...`."""
+        trace = _current_trace.get()
+        if not self.enabled and trace is None:
+            return _NULL_SPAN
+        return _Span(self, name, trace)
+
+    def trace(self) -> _TraceScope:
+        """Collect the spans of one request, including those in threads started with its context."""
+        return _TraceScope()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._started = time.time()
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                "since": self._started,
+                "stages": {
+                    name: {
+                        "count": h.count,
+                        "sum_seconds": round(h.sum, 6),
+                        "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else None,
+                        # Bucket upper bounds, so these are upper estimates
+                        "p50_ms": _ms(h.quantile(0.5)),
+                        "p95_ms": _ms(h.quantile(0.95)),
+                        "p99_ms": _ms(h.quantile(0.99)),
+                    }
+                    for name, h in sorted(self._histograms.items())
+                },
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP rag_mcp_stage_seconds Time spent in each indexing and search stage.",
+            "# TYPE rag_mcp_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'rag_mcp_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_mcp_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'rag_mcp_stage_seconds_sum{{stage="{name}"}} {h.sum:.6f}')
+                lines.append(f'rag_mcp_stage_seconds_count{{stage="{name}"}} {h.count}')
+            for name, value in sorted(self._counters.items()):
+                metric = "rag_mcp_" + name.replace(".", "_") + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Write all metrics to path, as JSON for *.json and Prometheus text otherwise."""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith(".json"):
+                json.dump(self.to_json(), f, indent=2, ensure_ascii=False)
+            else:
+                f.write(self.to_prometheus())
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    # Beyond the last bucket there is no upper bound to report
+    if seconds is None or seconds == float("inf"):
+        return None
+    return round(seconds * 1000, 3)
+
+metrics = Metrics()
@@ -0,0 +1,46 @@
+import os
+from .config import AppConfig
+from .storage import RAGStorage
+from .indexer import Indexer, METADATA_VERSION, upgrade_chunk_metadata
+
+from .logger import logger
+
+def _with_mode(config: AppConfig, mode: str) -> AppConfig:
+    return config.model_copy(update={"storage": config.storage.model_copy(update={"mode": mode})})
+
+def migrate_to_central(target_dir: str, config: AppConfig, batch_size: int = 500) -> int:
+    """
+    Copy the .muxue_rag index of target_dir into the central index, embeddings included, so no
+    chunk is embedded again. Chunks the central index already held for target_dir are replaced.
+    The local index is left in place. Returns the number of chunks copied.
+    """
+    target_dir = os.path.abspath(target_dir)
+    source = RAGStorage(target_dir, _with_mode(config, "local"))
+    if not os.path.isdir(source.db_path):
+        raise FileNotFoundError(f"No index found at {source.db_path}")
+    dest = RAGStorage(target_dir, _with_mode(config, "central"))
+    source.initialize()
+    dest.initialize()
+    try:
+        total = source.collection.count()
+        if source.manifest.is_empty() and total > 0:
+            source.manifest.bootstrap(source.collection)
+        # Drop what an earlier migration or central indexing run left for this directory
+        Indexer(target_dir, dest.config, storage=dest).clean()
+
+        copied = 0
+        for ids, documents, metadatas, embeddings in source.iter_chunks(batch_size):
+            metadatas = [
+                # Chunks of a directory that was moved keep their old paths, so set root_dir regardless
+                dict(upgrade_chunk_metadata(meta, target_dir) or {}, root_dir=target_dir)
+                for meta in metadatas
+            ]
+            dest.add_documents(documents, metadatas, ids, embeddings=embeddings)
+            copied += len(ids)
+            logger.info(f"Copied {copied}/{total} chunks of {target_dir}")
+        dest.manifest.update(source.manifest.load())
+        dest.manifest.set_meta("metadata_version", str(METADATA_VERSION))
+    finally:
+        source.close()
+        dest.close()
+    return copied
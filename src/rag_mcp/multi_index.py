@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from .config import AppConfig
+from .cache import EmbeddingCache, SharedEmbeddingCache
+from .storage import RAGStorage, RemoteEmbeddingFunction
+from .indexer import Indexer
+
+from .logger import logger
+
+def index_directories(dirs: List[str], config: AppConfig) -> List[dict]:
+    """
+    Index several directories in one process, processing.parallel_dirs at a time.
+    They share one embedding client, so llm.max_concurrent_requests bounds the requests in flight
+    across all of them, and one embedding cache for the run, so content repeated in several
+    directories is only embedded once. Directories of the central index share its storage and
+    are indexed one after another.
+    Returns a summary of each directory, in the order of dirs.
+    """
+    dirs = [os.path.abspath(d) for d in dirs]
+    embedding_fn = RemoteEmbeddingFunction(config)
+    central = config.storage.mode == "central"
+    shared_dir: Optional[str] = None
+    shared_cache: Optional[SharedEmbeddingCache] = None
+    central_storage: Optional[RAGStorage] = None
+    if central:
+        # Its own embedding cache is already shared by every directory
+        central_storage = RAGStorage(dirs[0], config, embedding_fn=embedding_fn)
+    elif config.cache.embedding_cache and len(dirs) > 1:
+        shared_dir = tempfile.mkdtemp(prefix="rag_mcp_index_")
+        shared_cache = SharedEmbeddingCache(EmbeddingCache(
+            os.path.join(shared_dir, "embedding_cache.sqlite3"),
+            config.cache.embedding_cache_max_mb * 1024 * 1024
+        ))
+
+    def run(d: str) -> dict:
+        start = time.perf_counter()
+        summary = {"dir": d}
+        storage = central_storage or RAGStorage(d, config, embedding_fn=embedding_fn, shared_cache=shared_cache)
+        try:
+            indexer = Indexer(d, config, storage=storage)
+            indexer.index()
+            summary.update(indexer.stats)
+        except Exception as e:
+            # One broken directory must not stop the others
+            logger.error(f"Error indexing {d}: {e}")
+            summary["error"] = str(e)
+        finally:
+            if storage is not central_storage:
+                storage.close()
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    workers = 1 if central else max(1, min(config.processing.parallel_dirs, len(dirs)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="index-dir") as executor:
+            return list(executor.map(run, dirs))
+    finally:
+        if central_storage is not None:
+            central_storage.close()
+        embedding_fn.close()
+        if shared_cache is not None:
+            shared_cache.close()
+            shutil.rmtree(shared_dir, ignore_errors=True)
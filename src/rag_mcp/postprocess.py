@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+from .cache import content_hash
+from .metrics import metrics
+
+def normalized_hash(content: str) -> str:
+    """Content hash that ignores whitespace, so re-wrapped or re-indented copies count as duplicates."""
+    return content_hash(" ".join(content.split()))
+
+def select_matches(matches: List[dict], n_results: int, dedup: bool = True, max_per_file: int = 0,
+                   seen: Optional[Set[str]] = None) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Keep the best n_results of matches (sorted best first), skipping chunks whose content repeats
+    a better match and, with max_per_file, files that already have that many matches.
+    seen holds the content hashes already returned, and is updated; pass the same set to
+    de-duplicate across several selections. Returns the kept matches and how many were dropped for each reason.
+    """
+    kept: List[dict] = []
+    if seen is None:
+        seen = set()
+    per_file: Dict[str, int] = {}
+    dropped = {"duplicates": 0, "collapsed": 0}
+    for match in matches:
+        if len(kept) >= n_results:
+            break
+        if max_per_file > 0 and per_file.get(match['file_path'], 0) >= max_per_file:
+            dropped["collapsed"] += 1
+            continue
+        if dedup:
+            digest = normalized_hash(match['content'])
+            if digest in seen:
+                dropped["duplicates"] += 1
+                continue
+            # Only returned content hides its copies; a collapsed chunk must not
+            seen.add(digest)
+        if max_per_file > 0:
+            per_file[match['file_path']] = per_file.get(match['file_path'], 0) + 1
+        kept.append(match)
+    return kept, dropped
+
+def attach_context(collection, matches: List[dict], context_chunks: int):
+    """
+    Set match["context"] to the up to context_chunks chunks before and after each match, from its
+    file's chunk_index/total_chunks metadata. All neighbours come from one collection.get.
+    Neighbours that are themselves among the matches are left out.
+    """
+    wanted: Dict[str, Set[int]] = {}
+    hits: Set[Tuple[str, int]] = set()
+    for match in matches:
+        index = match.get('chunk_index')
+        if index is None:
+            continue
+        hits.add((match['file_path'], index))
+        total = match.get('total_chunks') or index + 1
+        neighbours = wanted.setdefault(match['file_path'], set())
+        neighbours.update(range(max(0, index - context_chunks), min(total, index + context_chunks + 1)))
+    clauses = []
+    for file_path, indexes in wanted.items():
+        indexes = sorted(i for i in indexes if (file_path, i) not in hits)
+        if indexes:
+            clauses.append({"$and": [{"file_path": file_path}, {"chunk_index": {"$in": indexes}}]})
+    if not clauses:
+        return
+
+    with metrics.span("search.fetch_context"):
+        data = collection.get(where=clauses[0] if len(clauses) == 1 else {"$or": clauses}, include=['documents', 'metadatas'])
+    chunks: Dict[Tuple[str, int], str] = {
+        (meta['file_path'], meta['chunk_index']): doc
+        for doc, meta in zip(data['documents'], data['metadatas'])
+        if meta and 'chunk_index' in meta
+    }
+    for match in matches:
+        index = match.get('chunk_index')
+        if index is None:
+            continue
+        before = [chunks[(match['file_path'], i)] for i in range(index - context_chunks, index) if (match['file_path'], i) in chunks]
+        after = [chunks[(match['file_path'], i)] for i in range(index + 1, index + context_chunks + 1) if (match['file_path'], i) in chunks]
+        match['context'] = {"before": before, "after": after}
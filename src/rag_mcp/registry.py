@@ -0,0 +1,323 @@
+import asyncio
+import importlib
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple
+from .config import AppConfig, load_config, storage_path
+from .cache import EmbeddingCache, QueryEmbeddingCache, content_hash, normalize_query
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    # Imported on first use instead: chromadb and httpx take most of the server's startup time
+    from .storage import RAGStorage, RemoteEmbeddingFunction
+
+from .logger import logger
+
+# (device, inode of the index directory, inode of chroma.sqlite3)
+DbSignature = Tuple[int, int, int]
+
+def _file_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _db_signature(db_path: str) -> Optional[DbSignature]:
+    """
+    Identify a database on disk, so a deleted or rebuilt index can be told apart from the one we opened.
+    """
+    try:
+        dir_stat = os.stat(db_path)
+    except OSError:
+        return None
+    try:
+        sqlite_ino = os.stat(os.path.join(db_path, "chroma.sqlite3")).st_ino
+    except OSError:
+        sqlite_ino = 0
+    return (dir_stat.st_dev, dir_stat.st_ino, sqlite_ino)
+
+class StorageRegistry:
+    """
+    Process-wide holder of the loaded config and one open RAGStorage per index database:
+    one per indexed directory, or a single shared one in central mode.
+    A storage or embedding client that is replaced (config reload, rebuilt database) while searches
+    or the watcher still use it is retired, and closed when the last of them releases it.
+    """
+    def __init__(self, config_path: str):
+        self.config_path = config_path
+        # Held only briefly: opening a storage, which can take seconds, happens outside it
+        self._lock = threading.RLock()
+        # The config and the mtime of the file it was loaded from, replaced together
+        self._loaded: Optional[Tuple[AppConfig, Optional[int]]] = None
+        # Keyed by database path
+        self._storages: Dict[str, Tuple["RAGStorage", DbSignature]] = {}
+        # Held while a database is opened, so only other users of the same database wait for it
+        self._opening: Dict[str, threading.Lock] = {}
+        self._query_embedding_fn: Optional["RemoteEmbeddingFunction"] = None
+        self._query_cache: Optional[QueryEmbeddingCache] = None
+        # Users of each leased storage or embedding client, by id
+        self._users: Dict[int, int] = {}
+        self._retired: Dict[int, object] = {}
+
+    def get_config(self) -> AppConfig:
+        """Return the cached config, reloading it only when the file's mtime changes."""
+        mtime = _file_mtime(self.config_path)
+        # Every tool call starts here, on the event loop: an unchanged config needs no lock
+        loaded = self._loaded
+        if loaded is not None and loaded[1] == mtime:
+            return loaded[0]
+        with self._lock:
+            if self._loaded is None or mtime != self._loaded[1]:
+                if self._loaded is not None:
+                    logger.info(f"Config {self.config_path} changed, reloading")
+                    # Storages hold the old embedding settings
+                    self._close_all()
+                config = load_config(self.config_path)
+                metrics.configure(config.metrics.enabled)
+                self._query_cache = QueryEmbeddingCache(
+                    config.cache.query_cache_size,
+                    config.cache.query_cache_ttl
+                )
+                self._loaded = (config, mtime)
+            return self._loaded[0]
+
+    def _acquire_query_embedding(self) -> Tuple["RemoteEmbeddingFunction", QueryEmbeddingCache]:
+        """The query embedding client and cache, leased until _release(client)."""
+        config = self.get_config()
+        # The first import loads chromadb; other threads must not wait for it on the lock
+        from .storage import RemoteEmbeddingFunction
+        with self._lock:
+            if self._query_embedding_fn is None:
+                self._query_embedding_fn = RemoteEmbeddingFunction(config)
+            self._acquire(self._query_embedding_fn)
+            return self._query_embedding_fn, self._query_cache
+
+    def embed_query(self, query: str, dirs: Sequence[str] = ()) -> Tuple[List[float], bool]:
+        """
+        Embed a search query once for all directories, through the query caches.
+        Returns the embedding and whether it came from a cache.
+        """
+        embeddings, hits = self.embed_queries([query], dirs)
+        return embeddings[0], hits[0]
+
+    async def embed_query_async(self, query: str, dirs: Sequence[str] = ()) -> Tuple[List[float], bool]:
+        """embed_query for the async tools: the request is awaited instead of blocking the event loop."""
+        embeddings, hits = await self.embed_queries_async([query], dirs)
+        return embeddings[0], hits[0]
+
+    def embed_queries(self, queries: List[str], dirs: Sequence[str] = ()) -> Tuple[List[List[float]], List[bool]]:
+        """
+        Embed several search queries with one request for those in neither the in-process query cache
+        nor the persistent embedding cache of the first of dirs, the directories being searched.
+        Returns the embeddings in the order of queries and whether each came from a cache.
+        """
+        embedding_fn, query_cache = self._acquire_query_embedding()
+        try:
+            cached, missing = self._lookup_queries(embedding_fn, query_cache, queries)
+            if not missing:
+                return cached, [True] * len(queries)
+            stored = self._load_queries(embedding_fn, dirs, missing)
+            to_embed = [query for query in missing if query not in stored]
+            start_time = time.time()
+            embedded = embedding_fn(to_embed) if to_embed else []
+            elapsed = time.time() - start_time
+            self._save_queries(embedding_fn, dirs, to_embed, embedded)
+            return self._fill_queries(embedding_fn, query_cache, queries, cached, stored, to_embed, embedded, elapsed)
+        finally:
+            self._release(embedding_fn)
+
+    async def embed_queries_async(self, queries: List[str], dirs: Sequence[str] = ()) -> Tuple[List[List[float]], List[bool]]:
+        """embed_queries for the async tools."""
+        # The first call imports chromadb and httpx, which must not block the event loop
+        await asyncio.to_thread(importlib.import_module, ".storage", __package__)
+        embedding_fn, query_cache = self._acquire_query_embedding()
+        try:
+            cached, missing = self._lookup_queries(embedding_fn, query_cache, queries)
+            if not missing:
+                return cached, [True] * len(queries)
+            # May open the index, and reads SQLite
+            stored = await asyncio.to_thread(self._load_queries, embedding_fn, dirs, missing)
+            to_embed = [query for query in missing if query not in stored]
+            start_time = time.time()
+            embedded = await embedding_fn.embed_async(to_embed) if to_embed else []
+            elapsed = time.time() - start_time
+            await asyncio.to_thread(self._save_queries, embedding_fn, dirs, to_embed, embedded)
+            return self._fill_queries(embedding_fn, query_cache, queries, cached, stored, to_embed, embedded, elapsed)
+        finally:
+            self._release(embedding_fn)
+
+    @staticmethod
+    def _lookup_queries(embedding_fn, query_cache, queries: List[str]):
+        cached = [query_cache.get(embedding_fn.model, query) for query in queries]
+        # A query repeated within the batch is embedded once
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, cached) if embedding is None))
+        return cached, missing
+
+    @contextmanager
+    def _query_store(self, dirs: Sequence[str]) -> Iterator[Optional["EmbeddingCache"]]:
+        """The persistent embedding cache of the first searched directory's index, if it has one."""
+        with self.use_storage(dirs[0]) if dirs else nullcontext() as storage:
+            yield storage.embedding_cache if storage is not None else None
+
+    def _load_queries(self, embedding_fn, dirs: Sequence[str], queries: List[str]) -> Dict[str, List[float]]:
+        hashes = {query: content_hash(normalize_query(query)) for query in queries}
+        try:
+            with self._query_store(dirs) as store:
+                if store is None:
+                    return {}
+                found = store.get_many(embedding_fn.model, list(hashes.values()))
+        except Exception as e:
+            # The search reports a broken index itself; the query can still be embedded
+            logger.warning(f"Could not read cached query embeddings: {e}")
+            return {}
+        return {query: found[h].tolist() for query, h in hashes.items() if h in found}
+
+    def _save_queries(self, embedding_fn, dirs: Sequence[str], queries: List[str], embeddings: List[List[float]]):
+        if not queries:
+            return
+        try:
+            with self._query_store(dirs) as store:
+                if store is not None:
+                    store.put_many(embedding_fn.model, [
+                        (content_hash(normalize_query(query)), embedding) for query, embedding in zip(queries, embeddings)
+                    ])
+        except Exception as e:
+            logger.warning(f"Could not cache query embeddings: {e}")
+
+    @staticmethod
+    def _fill_queries(embedding_fn, query_cache, queries, cached, stored, embedded_queries, embedded, elapsed) -> Tuple[List[List[float]], List[bool]]:
+        found = dict(stored)
+        for query, embedding in zip(embedded_queries, embedded):
+            found[query] = embedding
+            query_cache.put(embedding_fn.model, query, embedding, elapsed / len(embedded_queries))
+        for query, embedding in stored.items():
+            query_cache.put(embedding_fn.model, query, embedding)
+        embeddings = [embedding if embedding is not None else found[query] for query, embedding in zip(queries, cached)]
+        return embeddings, [embedding is not None or query in stored for query, embedding in zip(queries, cached)]
+
+    def query_cache_stats(self) -> dict:
+        self.get_config()
+        with self._lock:
+            return self._query_cache.stats()
+
+    def get_storage(self, target_dir: str) -> Optional["RAGStorage"]:
+        """
+        Return an open storage for target_dir, or None if it has no index database.
+        In central mode every directory gets the same shared storage.
+        It may be closed by a later config reload; use_storage to keep it open while using it.
+        """
+        return self._get_storage(target_dir, lease=False)
+
+    @contextmanager
+    def use_storage(self, target_dir: str) -> Iterator[Optional["RAGStorage"]]:
+        """get_storage, leased for the with block so it is not closed while in use."""
+        storage = self._get_storage(target_dir, lease=True)
+        try:
+            yield storage
+        finally:
+            self._release(storage)
+
+    def _get_storage(self, target_dir: str, lease: bool) -> Optional["RAGStorage"]:
+        config = self.get_config()
+        target_dir = os.path.abspath(target_dir)
+        db_path = storage_path(target_dir, config)
+
+        with self._lock:
+            storage = self._cached_storage(db_path, lease)
+            if storage is not None or not os.path.exists(db_path):
+                return storage
+            opening = self._opening.setdefault(db_path, threading.Lock())
+
+        # Loading chromadb and the index takes seconds on a cold start
+        with opening:
+            with self._lock:
+                # Opened while we waited for the database
+                storage = self._cached_storage(db_path, lease)
+                if storage is not None:
+                    return storage
+            from .storage import RAGStorage
+            storage = RAGStorage(target_dir, config)
+            storage.initialize()
+            with self._lock:
+                if self._loaded is not None and self._loaded[0] is config:
+                    # initialize() may have created chroma.sqlite3, record what is on disk now
+                    self._storages[db_path] = (storage, _db_signature(storage.db_path))
+                    if lease:
+                        self._acquire(storage)
+                    return storage
+                if lease:
+                    # The config was reloaded meanwhile: still serve this call with the settings it
+                    # started with, but keep the storage from later ones and close it on release
+                    self._acquire(storage)
+                    self._retire(storage)
+                    return storage
+            storage.close()
+        return self._get_storage(target_dir, lease)
+
+    def _cached_storage(self, db_path: str, lease: bool) -> Optional["RAGStorage"]:
+        """The open storage of db_path, unless its database was removed or rebuilt since; call with the lock held."""
+        cached = self._storages.get(db_path)
+        if cached is None:
+            return None
+        storage, cached_signature = cached
+        if cached_signature != _db_signature(db_path):
+            logger.info(f"Database {db_path} was removed or rebuilt, dropping handle")
+            self._drop(db_path)
+            return None
+        if lease:
+            self._acquire(storage)
+        return storage
+
+    def _acquire(self, handle):
+        if handle is not None:
+            with self._lock:
+                self._users[id(handle)] = self._users.get(id(handle), 0) + 1
+
+    def _release(self, handle):
+        if handle is None:
+            return
+        with self._lock:
+            users = self._users.pop(id(handle)) - 1
+            if users > 0:
+                self._users[id(handle)] = users
+                return
+            retired = self._retired.pop(id(handle), None)
+        if retired is not None:
+            retired.close()
+
+    def _retire(self, handle):
+        """Close handle, or once its last user releases it if it is in use."""
+        if self._users.get(id(handle)):
+            detach = getattr(handle, "detach", None)
+            if detach is not None:
+                # New storages of the same database must not share its Chroma system
+                detach()
+            self._retired[id(handle)] = handle
+        else:
+            handle.close()
+
+    def invalidate(self, target_dir: str):
+        with self._lock:
+            self._drop(storage_path(os.path.abspath(target_dir), self.get_config()))
+
+    def close(self):
+        """Close everything, including handles still in use; only for shutdown."""
+        with self._lock:
+            self._close_all()
+            for handle in self._retired.values():
+                handle.close()
+            self._retired.clear()
+
+    def _drop(self, db_path: str):
+        cached = self._storages.pop(db_path, None)
+        if cached is not None:
+            self._retire(cached[0])
+
+    def _close_all(self):
+        for db_path in list(self._storages):
+            self._drop(db_path)
+        if self._query_embedding_fn is not None:
+            self._retire(self._query_embedding_fn)
+            self._query_embedding_fn = None
@@ -1,116 +1,740 @@
 import os
 import json
+import asyncio
 import time
-from typing import Optional
+import heapq
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from contextlib import ExitStack, asynccontextmanager, nullcontext
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Tuple
 from mcp.server.fastmcp import FastMCP
-from .config import load_config, AppConfig
-from .storage import RAGStorage
+from .config import AppConfig, storage_path
+from .registry import StorageRegistry
 from .state import StateManager
-from .utils import read_file_content
+from .utils import read_file_range
+from .lexical import tokenize
+from .filters import DirectoryFilter, SearchFilters
+from .postprocess import attach_context, select_matches
+from .metrics import Trace, metrics
 
 from .logger import logger
 
-def get_config() -> AppConfig:
+if TYPE_CHECKING:
+    # Storages are opened, and chromadb imported, on the first search rather than at startup
+    from .storage import RAGStorage
+    from .watcher import DirectoryWatcher
+
+_registry: Optional[StorageRegistry] = None
+
+def get_registry() -> StorageRegistry:
+    """Return the storage registry that lives as long as the server process."""
+    global _registry
     # Try to find config
     # 1. Env var
     # 2. Current dir
     config_path = os.environ.get("RAG_MCP_CONFIG", "config.yaml")
-    return load_config(config_path)
+    if _registry is None or _registry.config_path != config_path:
+        if _registry is not None:
+            _registry.close()
+        _registry = StorageRegistry(config_path)
+    return _registry
 
-def search_rag_impl(keyword: str, dir_path: Optional[str] = None) -> str:
-    start_time = time.time()
-    config = get_config()
-    
-    dirs_to_search = []
+def get_config() -> AppConfig:
+    return get_registry().get_config()
 
-    # Check if we are in single-directory serve mode
-    current_serve_dir = os.environ.get("RAG_MCP_SERVE_DIR")
-
-    if current_serve_dir:
-        # If serving a specific directory, we only search that one by default
-        # In serve mode, we ignore dir_path parameter as requested
-        dirs_to_search.append(current_serve_dir)
-    elif dir_path:
-        dirs_to_search.append(dir_path)
-    else:
-        dirs_to_search = StateManager.load_state()
-        
-    if not dirs_to_search:
-        return json.dumps({
-            "code": 500,
-            "message": "No directories indexed or specified.",
-            "data": None
-        }, ensure_ascii=False)
-        
-    all_matches = []
-    total_files = 0
-    total_chunks = 0
-    
-    for d in dirs_to_search:
-        if not os.path.exists(os.path.join(d, ".muxue_rag")):
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_workers = 0
+
+def get_search_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Return the thread pool used to search directories concurrently."""
+    global _search_executor, _search_executor_workers
+    if _search_executor is None or _search_executor_workers != max_workers:
+        if _search_executor is not None:
+            _search_executor.shutdown(wait=False)
+        _search_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        _search_executor_workers = max_workers
+    return _search_executor
+
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+
+# Searches still running after their request stopped waiting, by directory (the index path in central
+# mode). Such a directory is skipped until its search finishes, so a hung index holds at most one
+# worker of the shared pool instead of one per request
+_abandoned: Dict[str, int] = {}
+_abandoned_lock = threading.Lock()
+
+def _abandon(futures: Dict[Future, str]):
+    """Track the searches of futures that are still running when their request gives up on them."""
+    def finished(d: str):
+        with _abandoned_lock:
+            if _abandoned[d] > 1:
+                _abandoned[d] -= 1
+            else:
+                del _abandoned[d]
+
+    for future, d in futures.items():
+        if future.done():
             continue
-            
-        try:
-            storage = RAGStorage(d, config)
-            results = storage.search(keyword, n_results=5)
-            
-            # results is a dict: {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+        with _abandoned_lock:
+            _abandoned[d] = _abandoned.get(d, 0) + 1
+        # Called at once if the search finished meanwhile
+        future.add_done_callback(lambda _, d=d: finished(d))
+
+# Candidates fetched per requested result when filters could not all be put in the where clause
+_FILTERED_OVERFETCH = 10
+
+class _TopK:
+    """Keeps the n best matches pushed so far, lower key first."""
+    def __init__(self, n: int):
+        self.n = n
+        # Max-heap on key, stored as (-key, seq, match) so the worst kept match is at the top
+        self._heap = []
+        self._seq = 0
+
+    def push(self, key: float, match: dict):
+        self._seq += 1
+        item = (-key, self._seq, match)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def sorted(self) -> List[dict]:
+        return [item[2] for item in sorted(self._heap, key=lambda x: (-x[0], x[1]))]
+
+def _search_directory(registry: StorageRegistry, d: str, keywords: List[str], query_embeddings: Optional[List[List[float]]], n_results: int, use_lexical: bool, filters: Optional[SearchFilters] = None) -> List[Dict[str, List[dict]]]:
+    """Run the vector and/or keyword search of one directory, returning matches per ranking for each keyword."""
+    with ExitStack() as stack:
+        with metrics.span("search.open_storage"):
+            storage = stack.enter_context(registry.use_storage(d))
+        if storage is None:
+            return [{} for _ in keywords]
+        scope = _resolve_scope(storage, [d], filters, whole_index=not storage.central)
+        if scope is None:
+            return [{} for _ in keywords]
+        return _rank_matches(storage, keywords, query_embeddings, n_results, use_lexical, *scope)
+
+def _search_central(registry: StorageRegistry, dirs: List[str], keywords: List[str], query_embeddings: Optional[List[List[float]]], n_results: int, use_lexical: bool, filters: Optional[SearchFilters], whole_index: bool) -> List[Dict[str, List[dict]]]:
+    """Search several directories of the central index with one query per ranking."""
+    with ExitStack() as stack:
+        with metrics.span("search.open_storage"):
+            storage = stack.enter_context(registry.use_storage(dirs[0]))
+        if storage is None:
+            return [{} for _ in keywords]
+        scope = _resolve_scope(storage, dirs, filters, whole_index)
+        if scope is None:
+            return [{} for _ in keywords]
+        return _rank_matches(storage, keywords, query_embeddings, n_results, use_lexical, *scope)
+
+_Scope = Tuple[Optional[dict], Optional[Callable[[str], bool]], Optional[Callable[[str], bool]]]
+
+def _resolve_scope(storage: "RAGStorage", dirs: List[str], filters: Optional[SearchFilters], whole_index: bool) -> Optional[_Scope]:
+    """
+    Build the Chroma where clause and keyword path filter that restrict a search to dirs and filters,
+    and the path filter vector results still need when the where clause could not hold every condition.
+    whole_index means dirs are all the index holds, so they need no condition of their own.
+    Returns None when no file can match.
+    """
+    dirs = [os.path.abspath(d) for d in dirs]
+    dir_filters: Dict[str, DirectoryFilter] = {}
+    if filters is not None and not filters.is_empty():
+        with metrics.span("search.resolve_filters"):
+            for d in dirs:
+                dir_filter = DirectoryFilter(filters, d, storage.manifest)
+                if dir_filter.matches_nothing:
+                    continue
+                dir_filters[d] = dir_filter
+        if not dir_filters:
+            return None
+        dirs = list(dir_filters)
+
+    if not storage.central:
+        dir_filter = dir_filters.get(dirs[0])
+        if dir_filter is None:
+            return None, None, None
+        return dir_filter.where, dir_filter.accepts, None if dir_filter.complete else dir_filter.accepts
+    if whole_index and not dir_filters:
+        return None, None, None
+
+    # Directories without filters share one root_dir condition, the others each get their own
+    clauses = []
+    plain = [d for d in dirs if d not in dir_filters or dir_filters[d].where is None]
+    if len(plain) == 1:
+        clauses.append({"root_dir": plain[0]})
+    elif plain:
+        clauses.append({"root_dir": {"$in": plain}})
+    for d, dir_filter in dir_filters.items():
+        if dir_filter.where is not None:
+            clauses.append({"$and": [{"root_dir": d}, dir_filter.where]})
+    where = clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+    def accepts(file_path: str) -> bool:
+        for d in dirs:
+            if file_path.startswith(d + os.sep):
+                dir_filter = dir_filters.get(d)
+                return dir_filter is None or dir_filter.accepts(file_path)
+        return False
+    complete = all(dir_filter.complete for dir_filter in dir_filters.values())
+    return where, accepts, None if complete else accepts
+
+def _rank_matches(storage: "RAGStorage", keywords: List[str], query_embeddings: Optional[List[List[float]]], n_results: int, use_lexical: bool,
+                  where: Optional[dict], path_filter: Optional[Callable[[str], bool]],
+                  vector_filter: Optional[Callable[[str], bool]] = None) -> List[Dict[str, List[dict]]]:
+    """
+    Run the vector and/or keyword queries of keywords against one storage, returning matches per ranking
+    for each keyword. All keywords share one vector query and one chunk fetch per ranking.
+    """
+    rankings = [{} for _ in keywords]
+    if query_embeddings is not None:
+        # Conditions missing from where are checked on a deeper candidate list
+        fetch = n_results if vector_filter is None else n_results * _FILTERED_OVERFETCH
+        results = storage.search_batch(keywords, n_results=fetch, query_embeddings=query_embeddings, where=where)
+
+        # results is a dict: {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}, one inner list per keyword
+        for q, keyword_rankings in enumerate(rankings):
+            matches = []
             if results and results['documents']:
-                docs = results['documents'][0]
-                metas = results['metadatas'][0]
-                dists = results['distances'][0] if 'distances' in results else [0]*len(docs)
-                
+                docs = results['documents'][q]
+                metas = results['metadatas'][q]
+                dists = results['distances'][q] if 'distances' in results else [0]*len(docs)
+
                 for i, doc in enumerate(docs):
                     meta = metas[i]
                     dist = dists[i]
-                    
-                    all_matches.append({
+                    if vector_filter is not None and not vector_filter(meta.get("file_path", "")):
+                        continue
+                    if len(matches) == n_results:
+                        break
+
+                    matches.append({
+                        "id": results['ids'][q][i],
                         "content": doc,
                         "match_degree": "high" if dist < 0.5 else "medium", # heuristic
                         "file_path": meta.get("file_path"),
+                        "chunk_index": meta.get("chunk_index"),
+                        "total_chunks": meta.get("total_chunks"),
                         "score": dist
                     })
+            keyword_rankings["vector"] = matches
+
+    if use_lexical:
+        results = storage.lexical_search_batch(keywords, n_results=n_results, path_filter=path_filter)
+        for q, (keyword, keyword_rankings) in enumerate(zip(keywords, rankings)):
+            query_terms = len(set(tokenize(keyword)))
+            keyword_rankings["lexical"] = [
+                {
+                    "id": doc_id,
+                    "content": doc,
+                    # Every query term appears in the chunk
+                    "match_degree": "high" if matched == query_terms else "medium",
+                    "file_path": meta.get("file_path"),
+                    "chunk_index": meta.get("chunk_index"),
+                    "total_chunks": meta.get("total_chunks"),
+                    # Negated so that, like distances, lower is better
+                    "score": -score
+                }
+                for doc_id, doc, meta, score, matched in zip(
+                    results['ids'][q], results['documents'][q], results['metadatas'][q],
+                    results['scores'][q], results['matched_terms'][q]
+                )
+            ]
+    return rankings
+
+def _fuse_rankings(rankings: List[List[dict]], k: int, n_results: int) -> List[dict]:
+    """Reciprocal rank fusion: a match scores sum(1 / (k + rank)) over the rankings it appears in."""
+    fused: Dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            entry = fused.get(match['id'])
+            if entry is None:
+                entry = fused[match['id']] = dict(match, score=0.0)
+            elif match['match_degree'] == "high":
+                entry['match_degree'] = "high"
+            entry['score'] += 1.0 / (k + rank)
+    return heapq.nlargest(n_results, fused.values(), key=lambda m: m['score'])
+
+class _SearchRequest:
+    """
+    State of one search_rag or search_rag_batch call, shared by the sync and async entry points, which
+    differ only in how they embed the queries and wait for the directory searches. A batch runs all its
+    keywords through each directory search together and answers with the results of each keyword.
+    """
+    def __init__(self, registry: StorageRegistry, keywords: List[str], dir_path: Optional[str], n_results: Optional[int],
+                 mode: Optional[str], filters: Optional[SearchFilters], start_time: float,
+                 max_per_file: Optional[int] = None, context_chunks: Optional[int] = None, batch: bool = False):
+        self.registry = registry
+        self.keywords = keywords
+        self.batch = batch
+        self.filters = filters
+        self.start_time = start_time
+        self.search_config = registry.get_config().search
+        self.n_results = max(1, n_results or self.search_config.n_results)
+        self.mode = mode or self.search_config.mode
+        self.max_per_file = max(0, self.search_config.max_per_file if max_per_file is None else max_per_file)
+        self.context_chunks = max(0, self.search_config.context_chunks if context_chunks is None else context_chunks)
+        self.dropped = {"duplicates": 0, "collapsed": 0}
+        self.query_embeddings = None
+        self.cache_hits: Optional[List[bool]] = None
+        self.embedding_error = None
+        self.timed_out_dirs: List[str] = []
+        # Error of each directory whose search raised
+        self.failed_dirs: Dict[str, str] = {}
+        # Number of directory searches submitted, one for a central index
+        self.searched = 0
+        # Set when the request can be answered without searching
+        self.response: Optional[str] = None
+
+        if batch and not keywords:
+            self.response = json.dumps({
+                "code": 500,
+                "message": "queries 不能为空",
+                "data": None
+            }, ensure_ascii=False)
+            return
+        if batch and len(keywords) > self.search_config.max_batch_queries:
+            self.response = json.dumps({
+                "code": 500,
+                "message": f"queries 数量 {len(keywords)} 超过上限 {self.search_config.max_batch_queries}",
+                "data": None
+            }, ensure_ascii=False)
+            return
+
+        if self.mode not in SEARCH_MODES:
+            self.response = json.dumps({
+                "code": 500,
+                "message": f"未知的检索模式: {self.mode}，可选值: {', '.join(SEARCH_MODES)}",
+                "data": None
+            }, ensure_ascii=False)
+            return
+
+        self.dirs_to_search = []
+
+        # Check if we are in single-directory serve mode
+        current_serve_dir = os.environ.get("RAG_MCP_SERVE_DIR")
+
+        if current_serve_dir:
+            # If serving a specific directory, we only search that one by default
+            # In serve mode, we ignore dir_path parameter as requested
+            self.dirs_to_search.append(current_serve_dir)
+        elif dir_path:
+            self.dirs_to_search.append(dir_path)
+        else:
+            self.dirs_to_search = StateManager.load_state()
+        # Every registered directory, which is all a central index contains
+        self.whole_index = not current_serve_dir and not dir_path
+
+        if not self.dirs_to_search:
+            self.response = json.dumps({
+                "code": 500,
+                "message": "No directories indexed or specified.",
+                "data": None
+            }, ensure_ascii=False)
+
+    @property
+    def needs_embedding(self) -> bool:
+        return self.mode != "lexical"
+
+    def embedding_failed(self, e: Exception) -> Optional[str]:
+        """Handle a failed query embedding; returns the error response if the search can't go on."""
+        logger.error(f"Error embedding query: {e}")
+        if self.mode == "vector":
+            return json.dumps({
+                "code": 500,
+                "message": f"检索失败: {str(e)}",
+                "data": None
+            }, ensure_ascii=False)
+        # Keyword matches don't need the embedding server
+        logger.warning("Falling back to keyword-only search")
+        self.mode = "lexical"
+        self.embedding_error = str(e)
+        return None
+
+    def submit(self, executor: ThreadPoolExecutor) -> Dict[Future, str]:
+        """Start one search per directory, returning their futures."""
+        # Fusion needs deeper rankings than the final result count to find overlaps, and so does
+        # skipping duplicates and collapsing files without returning fewer results
+        deep = self.mode == "hybrid" or self.search_config.dedup or self.max_per_file > 0
+        self.depth = max(self.n_results, self.search_config.fusion_candidates) if deep else self.n_results
+        # Keep only the best matches of each ranking of each keyword while results stream in
+        self.top = [{"vector": _TopK(self.depth), "lexical": _TopK(self.depth)} for _ in self.keywords]
+        # Each search runs in a copy of this context, so its spans land in the request's trace
+        if self.registry.get_config().storage.mode == "central":
+            # All directories share one index, so a single query per ranking covers them
+            index_path = storage_path("", self.registry.get_config())
+            if not self._skip_busy([index_path]):
+                return {}
+            self.searched = 1
+            return {
+                executor.submit(
+                    contextvars.copy_context().run, _search_central, self.registry, self.dirs_to_search, self.keywords,
+                    self.query_embeddings, self.depth, self.mode != "vector", self.filters, self.whole_index
+                ): index_path
+            }
+        dirs = self._skip_busy(self.dirs_to_search)
+        self.searched = len(dirs)
+        return {
+            executor.submit(
+                contextvars.copy_context().run, _search_directory, self.registry, d, self.keywords,
+                self.query_embeddings, self.depth, self.mode != "vector", self.filters
+            ): d
+            for d in dirs
+        }
+
+    def _skip_busy(self, dirs: List[str]) -> List[str]:
+        """Leave out directories whose search timed out earlier and is still running; they count as timed out."""
+        with _abandoned_lock:
+            busy = [d for d in dirs if d in _abandoned]
+        if busy:
+            logger.warning(f"Skipping directories still busy with a timed out search: {', '.join(busy)}")
+            self.timed_out_dirs.extend(busy)
+        return [d for d in dirs if d not in busy]
+
+    def add_result(self, d: str, future: Future):
+        try:
+            for top, rankings in zip(self.top, future.result()):
+                for ranking, matches in rankings.items():
+                    for match in matches:
+                        # Where to fetch neighbouring chunks from
+                        match['source'] = d
+                        top[ranking].push(match['score'], match)
         except Exception as e:
             logger.error(f"Error searching in {d}: {e}")
-            
-    # Sort by score (lower distance is better)
-    all_matches.sort(key=lambda x: x['score'])
-    
-    # Format response
-    match_content = []
-    file_info = []
-    
-    for m in all_matches:
-        match_content.append({
-            "content": m['content'],
-            "match_degree": m['match_degree']
-        })
-        file_info.append({
-            "file_path": m['file_path']
-        })
-        
-    stats = {
-        "cost_time": round(time.time() - start_time, 3),
-        "match_file_count": len(set(m['file_path'] for m in all_matches)),
-        "match_chunk_count": len(all_matches)
-    }
-    
-    if not all_matches:
+            self.failed_dirs[d] = str(e)
+
+    def timed_out(self, dirs: List[str]):
+        # A slow or corrupt index must not hold up the whole response
+        self.timed_out_dirs.extend(dirs)
+        logger.warning(f"Search timed out after {self.search_config.dir_timeout}s in: {', '.join(dirs)}")
+
+    def _attach_context(self, matches: List[dict]):
+        # One batched lookup per index: per directory, or a single one in central mode
+        with ExitStack() as stack:
+            storages: Dict[str, Optional["RAGStorage"]] = {}
+            by_storage: Dict[int, Tuple["RAGStorage", List[dict]]] = {}
+            for match in matches:
+                if match['source'] not in storages:
+                    storages[match['source']] = stack.enter_context(self.registry.use_storage(match['source']))
+                storage = storages[match['source']]
+                if storage is not None:
+                    by_storage.setdefault(id(storage), (storage, []))[1].append(match)
+            for storage, storage_matches in by_storage.values():
+                try:
+                    attach_context(storage.collection, storage_matches, self.context_chunks)
+                except Exception as e:
+                    logger.error(f"Error fetching neighbouring chunks from {storage.db_path}: {e}")
+
+    def _select(self) -> List[List[dict]]:
+        """The final matches of each keyword, in the order of keywords."""
+        # Shared by all keywords: a chunk is returned once, for the first keyword that finds it
+        seen: Set[str] = set()
+        selected = []
+        for top in self.top:
+            if self.mode == "hybrid":
+                rankings = [top["vector"].sorted(), top["lexical"].sorted()]
+                ranked = _fuse_rankings(rankings, self.search_config.rrf_k, sum(len(r) for r in rankings))
+            else:
+                # Sort by score (lower is better)
+                ranked = top[self.mode].sorted()
+            matches, dropped = select_matches(ranked, self.n_results, self.search_config.dedup, self.max_per_file, seen)
+            for reason, count in dropped.items():
+                self.dropped[reason] += count
+            selected.append(matches)
+        return selected
+
+    @staticmethod
+    def _format(matches: List[dict]) -> Tuple[List[dict], List[dict]]:
+        match_content = []
+        file_info = []
+
+        for m in matches:
+            item = {
+                "content": m['content'],
+                "match_degree": m['match_degree']
+            }
+            if 'context' in m:
+                item["context"] = m['context']
+            match_content.append(item)
+            file_info.append({
+                "file_path": m['file_path']
+            })
+        return match_content, file_info
+
+    def respond(self, trace: Optional[Trace] = None) -> str:
+        if self.failed_dirs and len(self.failed_dirs) == self.searched:
+            # An empty result would read as "nothing matched"
+            return json.dumps({
+                "code": 500,
+                "message": "检索失败: " + "; ".join(f"{d}: {error}" for d, error in self.failed_dirs.items()),
+                "data": None
+            }, ensure_ascii=False)
+        with metrics.span("search.merge"):
+            selected = self._select()
+        all_matches = [m for matches in selected for m in matches]
+        if self.context_chunks and all_matches:
+            self._attach_context(all_matches)
+
+        stats = {
+            "cost_time": round(time.time() - self.start_time, 3),
+            "match_file_count": len(set(m['file_path'] for m in all_matches)),
+            "match_chunk_count": len(all_matches),
+            "mode": self.mode
+        }
+        if self.cache_hits is not None:
+            if self.batch:
+                stats["query_cache"] = dict(self.registry.query_cache_stats(), hit_queries=sum(self.cache_hits))
+            else:
+                stats["query_cache"] = dict(self.registry.query_cache_stats(), hit=self.cache_hits[0])
+        if self.embedding_error:
+            stats["embedding_error"] = self.embedding_error
+        if self.timed_out_dirs:
+            stats["timed_out_dirs"] = self.timed_out_dirs
+        if self.failed_dirs:
+            stats["failed_dirs"] = self.failed_dirs
+        if self.dropped["duplicates"]:
+            stats["duplicates_removed"] = self.dropped["duplicates"]
+        if self.dropped["collapsed"]:
+            stats["collapsed"] = self.dropped["collapsed"]
+        if trace is not None:
+            # Times summed over all directories, so parallel stages can add up to more than cost_time
+            stats["breakdown"] = trace.breakdown()
+
+        if not all_matches:
+            message = "未检索到与关键词相关的内容"
+            if self.failed_dirs:
+                message += "（以下目录检索失败: " + ", ".join(self.failed_dirs) + "）"
+            if self.timed_out_dirs:
+                message += "（以下目录检索超时: " + ", ".join(self.timed_out_dirs) + "）"
+            return json.dumps({
+                "code": 200,
+                "message": message,
+                "data": None
+            }, ensure_ascii=False)
+
+        with metrics.span("search.serialize"):
+            if self.batch:
+                results = []
+                for keyword, matches in zip(self.keywords, selected):
+                    match_content, file_info = self._format(matches)
+                    results.append({"keyword": keyword, "match_content": match_content, "file_info": file_info})
+                data = {"results": results, "stats": stats}
+            else:
+                match_content, file_info = self._format(all_matches)
+                data = {"match_content": match_content, "file_info": file_info, "stats": stats}
+            return json.dumps({
+                "code": 200,
+                "message": "检索成功",
+                "data": data
+            }, ensure_ascii=False)
+
+def _start_search(keywords: List[str], dir_path: Optional[str], n_results: Optional[int], mode: Optional[str],
+                  filters: Optional[SearchFilters], max_per_file: Optional[int] = None, context_chunks: Optional[int] = None,
+                  batch: bool = False):
+    """Load the config and resolve the request; returns it with a trace scope if breakdowns are on."""
+    start_time = time.time()
+    config_start = time.perf_counter()
+    registry = get_registry()
+    config = registry.get_config()
+    request = _SearchRequest(registry, keywords, dir_path, n_results, mode, filters, start_time, max_per_file, context_chunks, batch)
+    config_time = time.perf_counter() - config_start
+    if metrics.enabled:
+        metrics.observe("search.config", config_time)
+
+    scope = metrics.trace() if config.metrics.breakdown else None
+    if scope is not None:
+        scope.trace.spans.append(("search.config", config_time))
+    return request, scope
+
+def search_rag_impl(keyword: str, dir_path: Optional[str] = None, n_results: Optional[int] = None, mode: Optional[str] = None,
+                    filters: Optional[SearchFilters] = None, max_per_file: Optional[int] = None, context_chunks: Optional[int] = None) -> str:
+    request, scope = _start_search([keyword], dir_path, n_results, mode, filters, max_per_file, context_chunks)
+    if request.response is not None:
+        return request.response
+    with scope or nullcontext() as trace, metrics.span("search.total"):
+        return _run_search(request, trace)
+
+def search_rag_batch_impl(queries: List[str], dir_path: Optional[str] = None, n_results: Optional[int] = None, mode: Optional[str] = None,
+                          filters: Optional[SearchFilters] = None, max_per_file: Optional[int] = None, context_chunks: Optional[int] = None) -> str:
+    """
+    Search several queries at once: they are embedded in one request and every index is queried once
+    for all of them. n_results applies to each query; a chunk is only returned for the first query finding it.
+    """
+    request, scope = _start_search(queries, dir_path, n_results, mode, filters, max_per_file, context_chunks, batch=True)
+    if request.response is not None:
+        return request.response
+    with scope or nullcontext() as trace, metrics.span("search.total"):
+        return _run_search(request, trace)
+
+def _run_search(request: _SearchRequest, trace: Optional[Trace]) -> str:
+    if request.needs_embedding:
+        try:
+            # Embed the queries once and reuse the vectors for every directory
+            with metrics.span("search.embed_query"):
+                request.query_embeddings, request.cache_hits = request.registry.embed_queries(request.keywords, request.dirs_to_search)
+        except Exception as e:
+            error = request.embedding_failed(e)
+            if error is not None:
+                return error
+
+    futures = request.submit(get_search_executor(request.search_config.max_workers))
+    with metrics.span("search.wait_directories"):
+        try:
+            for future in as_completed(futures, timeout=request.search_config.dir_timeout):
+                request.add_result(futures[future], future)
+        except FuturesTimeoutError:
+            pending = [f for f in futures if not f.done()]
+            for future in pending:
+                # Only stops searches still queued in the pool
+                future.cancel()
+            _abandon({future: futures[future] for future in pending})
+            request.timed_out([futures[f] for f in pending])
+    return request.respond(trace)
+
+_request_limiter: Optional[asyncio.Semaphore] = None
+_request_limit = 0
+
+def get_request_limiter(limit: int) -> asyncio.Semaphore:
+    """Return the semaphore bounding how many tool calls run at once."""
+    global _request_limiter, _request_limit
+    if _request_limiter is None or _request_limit != limit:
+        _request_limiter = asyncio.Semaphore(max(1, limit))
+        _request_limit = limit
+    return _request_limiter
+
+async def search_rag_async(keyword: str, dir_path: Optional[str] = None, n_results: Optional[int] = None, mode: Optional[str] = None,
+                           filters: Optional[SearchFilters] = None, max_per_file: Optional[int] = None, context_chunks: Optional[int] = None) -> str:
+    """
+    search_rag for the event loop: the query is embedded with the async client and blocking
+    Chroma/SQLite work runs in the search pool, so concurrent calls overlap instead of queueing.
+    Cancelling the call cancels directory searches that have not started yet.
+    """
+    return await _search_async([keyword], dir_path, n_results, mode, filters, max_per_file, context_chunks)
+
+async def search_rag_batch_async(queries: List[str], dir_path: Optional[str] = None, n_results: Optional[int] = None, mode: Optional[str] = None,
+                                 filters: Optional[SearchFilters] = None, max_per_file: Optional[int] = None, context_chunks: Optional[int] = None) -> str:
+    """search_rag_batch_impl for the event loop; the whole batch counts as one request against the limit."""
+    return await _search_async(queries, dir_path, n_results, mode, filters, max_per_file, context_chunks, batch=True)
+
+async def _search_async(keywords: List[str], dir_path: Optional[str], n_results: Optional[int], mode: Optional[str],
+                        filters: Optional[SearchFilters], max_per_file: Optional[int], context_chunks: Optional[int], batch: bool = False) -> str:
+    limiter = get_request_limiter(get_config().server.max_concurrent_requests)
+    with metrics.span("server.queue_wait"):
+        await limiter.acquire()
+    try:
+        # Reloading a changed config or the list of indexed directories reads files
+        request, scope = await asyncio.to_thread(_start_search, keywords, dir_path, n_results, mode, filters, max_per_file, context_chunks, batch)
+        if request.response is not None:
+            return request.response
+        with scope or nullcontext() as trace, metrics.span("search.total"):
+            return await _run_search_async(request, trace)
+    finally:
+        limiter.release()
+
+async def _run_search_async(request: _SearchRequest, trace: Optional[Trace]) -> str:
+    if request.needs_embedding:
+        try:
+            with metrics.span("search.embed_query"):
+                request.query_embeddings, request.cache_hits = await request.registry.embed_queries_async(request.keywords, request.dirs_to_search)
+        except Exception as e:
+            error = request.embedding_failed(e)
+            if error is not None:
+                return error
+
+    futures = request.submit(get_search_executor(request.search_config.max_workers))
+    waiters = {asyncio.wrap_future(future): (future, d) for future, d in futures.items()}
+    done, pending = set(), set()
+    try:
+        # Empty when every directory was skipped
+        if waiters:
+            with metrics.span("search.wait_directories"):
+                done, pending = await asyncio.wait(waiters, timeout=request.search_config.dir_timeout)
+    finally:
+        # On timeout or cancellation of the whole call, drop searches still queued in the pool
+        for waiter in waiters:
+            waiter.cancel()
+        _abandon(futures)
+    for waiter in done:
+        future, d = waiters[waiter]
+        request.add_result(d, future)
+    if pending:
+        request.timed_out([waiters[waiter][1] for waiter in pending])
+    # Context expansion reads Chroma and may open storages; serializing a large response is CPU work
+    return await asyncio.to_thread(request.respond, trace)
+
+def _parse_filters(path_prefix: Optional[str], extensions: Optional[List[str]],
+                   modified_after: Optional[str], exclude: Optional[List[str]]) -> Tuple[Optional[SearchFilters], Optional[str]]:
+    """Build SearchFilters from tool arguments; returns the error response instead if they are invalid."""
+    try:
+        return SearchFilters.from_args(path_prefix, extensions, modified_after, exclude), None
+    except ValueError as e:
+        return None, json.dumps({
+            "code": 500,
+            "message": f"过滤条件无效: {str(e)}",
+            "data": None
+        }, ensure_ascii=False)
+
+def read_raw_file_impl(file_path: str, offset: int = 0, length: Optional[int] = None) -> str:
+    if offset < 0:
+        return json.dumps({
+            "code": 500,
+            "message": f"offset 不能为负数: {offset}",
+            "data": None
+        }, ensure_ascii=False)
+
+    if not os.path.exists(file_path):
+        return json.dumps({
+            "code": 500,
+            "message": "文件不存在，请检查路径是否正确",
+            "data": None
+        }, ensure_ascii=False)
+
+    # Check if text file?
+    # Requirement says: "If non-text, return error"
+    # We can use our is_text_file util, but it's in utils.
+    from .utils import is_text_file
+    if not is_text_file(file_path):
+         return json.dumps({
+            "code": 500,
+            "message": "无法读取非纯文本文件",
+            "data": None
+        }, ensure_ascii=False)
+
+    try:
+        stats = os.stat(file_path)
+        max_read_bytes = get_config().server.max_read_bytes
+        # A missing, zero or negative length reads a whole page
+        length = min(length, max_read_bytes) if length and length > 0 else max_read_bytes
+        content, start_offset, next_offset = read_file_range(file_path, offset, length)
+        has_more = next_offset < stats.st_size
+
         return json.dumps({
             "code": 200,
-            "message": "未检索到与关键词相关的内容",
+            "message": "读取成功",
+            "data": {
+                "raw_content": content,
+                # Moved forward past the rest of a character when offset lands inside one
+                "offset": start_offset,
+                "next_offset": next_offset if has_more else None,
+                "has_more": has_more
+            },
+            "file_info": {
+                "file_path": file_path,
+                "file_size": stats.st_size,
+                "modify_time": stats.st_mtime
+            }
+        }, ensure_ascii=False)
+    except PermissionError:
+        return json.dumps({
+            "code": 500,
+            "message": "无文件读取权限，请检查权限设置",
+            "data": None
+        }, ensure_ascii=False)
+    except Exception as e:
+        return json.dumps({
+            "code": 500,
+            "message": f"读取失败: {str(e)}",
             "data": None
         }, ensure_ascii=False)
-        
-    return json.dumps({
-        "code": 200,
-        "message": "检索成功",
-        "data": {
-            "match_content": match_content,
-            "file_info": file_info,
-            "stats": stats
-        }
-    }, ensure_ascii=False)
 
 def create_mcp_server() -> FastMCP:
     """创建并配置MCP服务器，根据环境动态注册工具"""
@@ -118,85 +742,237 @@ def create_mcp_server() -> FastMCP:
     serve_dir = os.environ.get("RAG_MCP_SERVE_DIR")
 
     # Initialize FastMCP
-    mcp = FastMCP("rag-mcp")
+    mcp = FastMCP("rag-mcp", lifespan=_lifespan)
 
     if serve_dir:
         @mcp.tool()
-        def search_rag(keyword: str) -> str:
+        async def search_rag(
+            keyword: str,
+            n_results: Optional[int] = None,
+            mode: Optional[str] = None,
+            path_prefix: Optional[str] = None,
+            extensions: Optional[List[str]] = None,
+            modified_after: Optional[str] = None,
+            exclude: Optional[List[str]] = None,
+            max_per_file: Optional[int] = None,
+            context_chunks: Optional[int] = None
+        ) -> str:
             """
             Search for keyword in RAG database.
             Args:
                 keyword: Search query.
+                n_results: Optional number of top matches to return.
+                mode: Optional retrieval mode: hybrid (keyword + semantic), vector (semantic only) or lexical (keyword only, fastest).
+                path_prefix: Optional file or subdirectory to search in, absolute or relative to the indexed directory.
+                extensions: Optional file extensions to search, e.g. [".py", "md"].
+                modified_after: Optional unix timestamp or ISO date; only files modified since then are searched.
+                exclude: Optional files, subdirectories or glob patterns (e.g. "tests/*") to leave out.
+                max_per_file: Optional maximum matches returned from one file, 0 for no limit.
+                context_chunks: Optional number of neighbouring chunks to return before and after each match.
+            """
+            filters, error = _parse_filters(path_prefix, extensions, modified_after, exclude)
+            if error is not None:
+                return error
+            return await search_rag_async(keyword, None, n_results, mode, filters, max_per_file, context_chunks)
+
+        @mcp.tool()
+        async def search_rag_batch(
+            queries: List[str],
+            n_results: Optional[int] = None,
+            mode: Optional[str] = None,
+            path_prefix: Optional[str] = None,
+            extensions: Optional[List[str]] = None,
+            modified_after: Optional[str] = None,
+            exclude: Optional[List[str]] = None,
+            max_per_file: Optional[int] = None,
+            context_chunks: Optional[int] = None
+        ) -> str:
+            """
+            Search for several related queries at once, about as fast as a single search_rag call.
+            Results are grouped per query; a chunk found by several queries is only returned for the first.
+            Args:
+                queries: Search queries.
+                n_results: Optional number of top matches to return for each query.
+                mode: Optional retrieval mode: hybrid (keyword + semantic), vector (semantic only) or lexical (keyword only, fastest).
+                path_prefix: Optional file or subdirectory to search in, absolute or relative to the indexed directory.
+                extensions: Optional file extensions to search, e.g. [".py", "md"].
+                modified_after: Optional unix timestamp or ISO date; only files modified since then are searched.
+                exclude: Optional files, subdirectories or glob patterns (e.g. "tests/*") to leave out.
+                max_per_file: Optional maximum matches returned from one file for each query, 0 for no limit.
+                context_chunks: Optional number of neighbouring chunks to return before and after each match.
             """
-            return search_rag_impl(keyword, None)
+            filters, error = _parse_filters(path_prefix, extensions, modified_after, exclude)
+            if error is not None:
+                return error
+            return await search_rag_batch_async(queries, None, n_results, mode, filters, max_per_file, context_chunks)
     else:
         @mcp.tool()
-        def search_rag(keyword: str, dir_path: Optional[str] = None) -> str:
+        async def search_rag(
+            keyword: str,
+            dir_path: Optional[str] = None,
+            n_results: Optional[int] = None,
+            mode: Optional[str] = None,
+            path_prefix: Optional[str] = None,
+            extensions: Optional[List[str]] = None,
+            modified_after: Optional[str] = None,
+            exclude: Optional[List[str]] = None,
+            max_per_file: Optional[int] = None,
+            context_chunks: Optional[int] = None
+        ) -> str:
             """
             Search for keyword in RAG database.
             Args:
                 keyword: Search query.
                 dir_path: Optional directory to search in. If None, searches all indexed directories.
+                n_results: Optional number of top matches to return across all directories.
+                mode: Optional retrieval mode: hybrid (keyword + semantic), vector (semantic only) or lexical (keyword only, fastest).
+                path_prefix: Optional file or subdirectory to search in, absolute or relative to each indexed directory.
+                extensions: Optional file extensions to search, e.g. [".py", "md"].
+                modified_after: Optional unix timestamp or ISO date; only files modified since then are searched.
+                exclude: Optional files, subdirectories or glob patterns (e.g. "tests/*") to leave out.
+                max_per_file: Optional maximum matches returned from one file, 0 for no limit.
+                context_chunks: Optional number of neighbouring chunks to return before and after each match.
+            """
+            filters, error = _parse_filters(path_prefix, extensions, modified_after, exclude)
+            if error is not None:
+                return error
+            return await search_rag_async(keyword, dir_path, n_results, mode, filters, max_per_file, context_chunks)
+
+        @mcp.tool()
+        async def search_rag_batch(
+            queries: List[str],
+            dir_path: Optional[str] = None,
+            n_results: Optional[int] = None,
+            mode: Optional[str] = None,
+            path_prefix: Optional[str] = None,
+            extensions: Optional[List[str]] = None,
+            modified_after: Optional[str] = None,
+            exclude: Optional[List[str]] = None,
+            max_per_file: Optional[int] = None,
+            context_chunks: Optional[int] = None
+        ) -> str:
+            """
+            Search for several related queries at once, about as fast as a single search_rag call.
+            Results are grouped per query; a chunk found by several queries is only returned for the first.
+            Args:
+                queries: Search queries.
+                dir_path: Optional directory to search in. If None, searches all indexed directories.
+                n_results: Optional number of top matches to return for each query, across all directories.
+                mode: Optional retrieval mode: hybrid (keyword + semantic), vector (semantic only) or lexical (keyword only, fastest).
+                path_prefix: Optional file or subdirectory to search in, absolute or relative to each indexed directory.
+                extensions: Optional file extensions to search, e.g. [".py", "md"].
+                modified_after: Optional unix timestamp or ISO date; only files modified since then are searched.
+                exclude: Optional files, subdirectories or glob patterns (e.g. "tests/*") to leave out.
+                max_per_file: Optional maximum matches returned from one file for each query, 0 for no limit.
+                context_chunks: Optional number of neighbouring chunks to return before and after each match.
             """
-            return search_rag_impl(keyword, dir_path)
+            filters, error = _parse_filters(path_prefix, extensions, modified_after, exclude)
+            if error is not None:
+                return error
+            return await search_rag_batch_async(queries, dir_path, n_results, mode, filters, max_per_file, context_chunks)
 
     @mcp.tool()
-    def read_raw_file(file_path: str) -> str:
+    async def read_raw_file(file_path: str, offset: int = 0, length: Optional[int] = None) -> str:
         """
-        Read raw content of a file.
+        Read raw content of a file, a page at a time for large files.
         Args:
             file_path: Absolute path to the file.
+            offset: Byte offset to start reading from. Use next_offset from the previous page to continue.
+            length: Optional number of bytes to read, capped by the server's maximum response size.
         """
-        if not os.path.exists(file_path):
+        limiter = get_request_limiter(get_config().server.max_concurrent_requests)
+        async with limiter:
+            # File I/O runs off the event loop
+            return await asyncio.to_thread(read_raw_file_impl, file_path, offset, length)
+
+    if get_config().metrics.enabled:
+        @mcp.tool()
+        def get_metrics(format: str = "json") -> str:
+            """
+            Timing histograms of each indexing and search stage, and counters, since the server started.
+            Args:
+                format: json, or prometheus for the Prometheus text exposition format.
+            """
+            if format == "prometheus":
+                data = metrics.to_prometheus()
+            else:
+                data = metrics.to_json()
             return json.dumps({
-                "code": 500,
-                "message": "文件不存在，请检查路径是否正确",
-                "data": None
+                "code": 200,
+                "message": "获取成功",
+                "data": data
             }, ensure_ascii=False)
 
-        # Check if text file?
-        # Requirement says: "If non-text, return error"
-        # We can use our is_text_file util, but it's in utils.
-        from .utils import is_text_file
-        if not is_text_file(file_path):
-             return json.dumps({
-                "code": 500,
-                "message": "无法读取非纯文本文件",
-                "data": None
-            }, ensure_ascii=False)
+    return mcp
 
-        try:
-            content = read_file_content(file_path)
-            stats = os.stat(file_path)
+@asynccontextmanager
+async def _lifespan(server: FastMCP):
+    """Runs for as long as the server does, starting before the first message is read."""
+    if get_config().server.prewarm:
+        # In a background thread, so the handshake is answered while chromadb loads
+        start_prewarm()
+    yield
 
-            return json.dumps({
-                "code": 200,
-                "message": "读取成功",
-                "data": {
-                    "raw_content": content
-                },
-                "file_info": {
-                    "file_path": file_path,
-                    "file_size": stats.st_size,
-                    "modify_time": stats.st_mtime
-                }
-            }, ensure_ascii=False)
-        except PermissionError:
-            return json.dumps({
-                "code": 500,
-                "message": "无文件读取权限，请检查权限设置",
-                "data": None
-            }, ensure_ascii=False)
+def _served_dirs() -> List[str]:
+    serve_dir = os.environ.get("RAG_MCP_SERVE_DIR")
+    return [serve_dir] if serve_dir else StateManager.load_state()
+
+_prewarm_thread: Optional[threading.Thread] = None
+
+def prewarm():
+    """Open the indexes of the served directories, so the first search doesn't wait for chromadb to load."""
+    start = time.perf_counter()
+    registry = get_registry()
+    opened = 0
+    for d in _served_dirs():
+        try:
+            if registry.get_storage(d) is not None:
+                opened += 1
         except Exception as e:
-            return json.dumps({
-                "code": 500,
-                "message": f"读取失败: {str(e)}",
-                "data": None
-            }, ensure_ascii=False)
+            logger.warning(f"Could not pre-warm index of {d}: {e}")
+    logger.info(f"Pre-warmed {opened} indexes in {time.perf_counter() - start:.2f}s")
 
-    return mcp
+def start_prewarm():
+    """Run prewarm in a background thread, once per process."""
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+        _prewarm_thread.start()
+
+def start_watchers() -> List["DirectoryWatcher"]:
+    """Watch the served directories and keep their indexes up to date while the server runs."""
+    from .classify import IgnoreMatcher
+    from .indexer import Indexer
+    from .watcher import DirectoryWatcher
+
+    registry = get_registry()
+    watchers = []
+    for d in _served_dirs():
+        if registry.get_storage(d) is None:
+            logger.warning(f"Not watching {d}: no index found, run with --dir first")
+            continue
+
+        def index_paths(paths: List[str], d: str = d):
+            # Share the registry's open storage, so searches see updates immediately
+            with registry.use_storage(d) as storage:
+                Indexer(d, registry.get_config(), storage=storage).index_paths(paths)
+
+        def index_all(d: str = d):
+            with registry.use_storage(d) as storage:
+                Indexer(d, registry.get_config(), storage=storage).index()
+
+        config = registry.get_config()
+        # The same rules the indexer scans with, so ignored trees (node_modules, build output) are not watched
+        ignore = IgnoreMatcher(d, config.processing.ignore_patterns, config.processing.use_gitignore)
+        watcher = DirectoryWatcher(d, config.watch, index_paths=index_paths, index_all=index_all, ignore=ignore)
+        watcher.start()
+        watchers.append(watcher)
+    return watchers
 
 def start_server():
     """启动MCP服务器"""
     mcp = create_mcp_server()
+    if os.environ.get("RAG_MCP_WATCH"):
+        # Opening the indexes to watch would otherwise hold up the handshake
+        threading.Thread(target=start_watchers, name="start-watchers", daemon=True).start()
     mcp.run()
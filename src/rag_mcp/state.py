@@ -1,6 +1,6 @@
 import os
 import json
-from typing import List
+from typing import List, Optional
 
 STATE_FILE = os.path.expanduser("~/.rag_mcp/state.json")
 
@@ -24,6 +24,17 @@ class StateManager:
             dirs.append(abs_path)
             StateManager.save_state(dirs)
 
+    @staticmethod
+    def find_overlap(path: str, dirs: Optional[List[str]] = None) -> Optional[str]:
+        """A registered directory (or one of dirs) that contains path or lies inside it, other than path itself."""
+        abs_path = os.path.abspath(path)
+        for d in StateManager.load_state() if dirs is None else dirs:
+            if d == abs_path:
+                continue
+            if abs_path.startswith(d.rstrip(os.sep) + os.sep) or d.startswith(abs_path.rstrip(os.sep) + os.sep):
+                return d
+        return None
+
     @staticmethod
     def remove_directory(path: str):
         dirs = StateManager.load_state()
@@ -1,21 +1,80 @@
+import asyncio
 import os
 import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import chromadb
+from chromadb.api.shared_system_client import SharedSystemClient
 from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
 import httpx
-from typing import List, Optional
-from .config import AppConfig
+import numpy as np
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from .config import AppConfig, storage_path
+from .batching import AdaptiveBatcher
+from .cache import EmbeddingCache, SharedEmbeddingCache, content_hash
+from .manifest import Manifest
+from .lexical import LexicalIndex
+from .vectors import QuantizedVectorStore
+from .metrics import metrics
 
 from .logger import logger
 
+def _is_overload(error: Exception) -> bool:
+    """Whether an embedding error means the request was too large rather than broken."""
+    if isinstance(error, httpx.TimeoutException):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 413
+
 class RemoteEmbeddingFunction(EmbeddingFunction):
     def __init__(self, config: AppConfig):
         self.config = config
         self.url = f"{config.llm.base_url}/embeddings"
         self.model = config.model.name
+        self.max_concurrent_requests = max(1, config.llm.max_concurrent_requests)
+        # Bounds the requests in flight from every caller, e.g. several directories indexed at once
+        self._slots = threading.BoundedSemaphore(self.max_concurrent_requests)
+        self.batcher = AdaptiveBatcher.from_config(config.model)
+        self._client: Optional[httpx.Client] = None
+        self._client_lock = threading.Lock()
+        # httpx.AsyncClient is bound to the event loop it first ran on
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        # One pooled client per function, so batches reuse keep-alive connections
+        with self._client_lock:
+            if self._client is None or self._client.is_closed:
+                self._client = self._create_client()
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled client for the running event loop, used by the async MCP tools."""
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            if self._async_client is None or self._async_client.is_closed or self._async_loop is not loop:
+                self._async_client = httpx.AsyncClient(**self._client_options())
+                self._async_loop = loop
+            return self._async_client
+
+    def _client_options(self) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if self.config.llm.api_key:
+            headers["Authorization"] = f"Bearer {self.config.llm.api_key}"
+        return dict(
+            headers=headers,
+            timeout=self.config.llm.timeout,
+            limits=httpx.Limits(
+                max_connections=self.config.llm.max_connections,
+                max_keepalive_connections=self.config.llm.max_connections
+            )
+        )
+
+    def _create_client(self) -> httpx.Client:
+        return httpx.Client(**self._client_options())
 
     def __call__(self, input: Documents) -> Embeddings:
-        embeddings = []
         if not input:
             return []
 
@@ -24,69 +83,461 @@ class RemoteEmbeddingFunction(EmbeddingFunction):
                 "model": self.model,
                 "input": input
             }
-            headers = {"Content-Type": "application/json"}
-            if self.config.llm.api_key:
-                headers["Authorization"] = f"Bearer {self.config.llm.api_key}"
-
-            response = httpx.post(
-                self.url, 
-                json=payload, 
-                headers=headers, 
-                timeout=self.config.llm.timeout
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            data_list = sorted(data['data'], key=lambda x: x['index'])
-            return [item['embedding'] for item in data_list]
-            
+            with metrics.span("embed.slot_wait"):
+                self._slots.acquire()
+            try:
+                with metrics.span("embed.request"):
+                    response = self.client.post(self.url, json=payload)
+            finally:
+                self._slots.release()
+            return self._parse_response(response, input)
         except Exception as e:
             logger.error(f"Error getting embeddings: {e}")
             raise e
 
+    async def embed_async(self, input: Documents) -> Embeddings:
+        """Same as calling the function, without blocking the event loop while the server works."""
+        if not input:
+            return []
+
+        try:
+            payload = {
+                "model": self.model,
+                "input": input
+            }
+            with metrics.span("embed.request"):
+                response = await self.async_client.post(self.url, json=payload)
+            return self._parse_response(response, input)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting embeddings: {e}")
+            raise e
+
+    def _parse_response(self, response: httpx.Response, input: Documents) -> Embeddings:
+        metrics.inc("embed.requests")
+        metrics.inc("embed.texts", len(input))
+        response.raise_for_status()
+        data = response.json()
+
+        data_list = sorted(data['data'], key=lambda x: x['index'])
+        return [item['embedding'] for item in data_list]
+
+    def embed_batches(self, batches: List[Documents], embed=None) -> List[Embeddings]:
+        """
+        Embed several batches concurrently, at most max_concurrent_requests in flight.
+        Results are returned in the same order as batches.
+        """
+        embed = embed or self
+        if len(batches) <= 1 or self.max_concurrent_requests == 1:
+            return [embed(batch) for batch in batches]
+
+        workers = min(self.max_concurrent_requests, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+            return list(executor.map(embed, batches))
+
+    def embed_documents(self, documents: Documents) -> Embeddings:
+        """
+        Embed any number of documents, packed into token-bounded requests that are sent concurrently.
+        """
+        bounds = self.batcher.pack(list(documents))
+        results = self.embed_batches([documents[start:end] for start, end in bounds], self._embed_adaptive)
+        return [embedding for batch in results for embedding in batch]
+
+    def _embed_adaptive(self, batch: Documents) -> Embeddings:
+        try:
+            embeddings = self(batch)
+        except Exception as e:
+            if not _is_overload(e) or len(batch) == 1:
+                raise
+            # The request was too large for the server: shrink future batches and retry in halves
+            self.batcher.shrink()
+            logger.warning(f"Embedding batch of {len(batch)} rejected ({e}), retrying with smaller batches")
+            middle = len(batch) // 2
+            return self._embed_adaptive(batch[:middle]) + self._embed_adaptive(batch[middle:])
+        self.batcher.record_success()
+        return embeddings
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        async_client, loop = self._async_client, self._async_loop
+        self._async_client = self._async_loop = None
+        if async_client is not None and loop is not None and not loop.is_closed():
+            # aclose must run on the loop that owns the client's connections
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                loop.create_task(async_client.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(async_client.aclose(), loop)
+
+def _iter_chunks(collection, vectors: Optional[QuantizedVectorStore], batch_size: int) -> Iterator[Tuple[List[str], List[str], List[dict], Embeddings]]:
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        include = ['documents', 'metadatas'] + (['embeddings'] if vectors is None else [])
+        data = collection.get(include=include, limit=batch_size, offset=offset)
+        if vectors is None:
+            yield data['ids'], data['documents'], data['metadatas'], data['embeddings']
+            continue
+        stored = vectors.get(data['ids'])
+        # Skip chunks whose vector is missing, e.g. after a delete was interrupted
+        keep = [i for i, doc_id in enumerate(data['ids']) if doc_id in stored]
+        yield (
+            [data['ids'][i] for i in keep],
+            [data['documents'][i] for i in keep],
+            [data['metadatas'][i] for i in keep],
+            [stored[data['ids'][i]] for i in keep],
+        )
+
 class RAGStorage:
-    def __init__(self, target_dir: str, config: AppConfig):
+    def __init__(self, target_dir: str, config: AppConfig, embedding_fn: Optional[RemoteEmbeddingFunction] = None,
+                 shared_cache: Optional[SharedEmbeddingCache] = None):
+        """
+        embedding_fn and shared_cache let several storages indexed together use one embedding client,
+        and look up vectors the others have embedded before requesting them.
+        """
         self.target_dir = target_dir
-        self.db_path = os.path.join(target_dir, ".muxue_rag")
+        self.db_path = storage_path(target_dir, config)
+        # A central index holds several directories, told apart by the root_dir of each chunk
+        self.central = config.storage.mode == "central"
         self.config = config
-        self.embedding_fn = RemoteEmbeddingFunction(config)
+        self._owns_embedding_fn = embedding_fn is None
+        self.embedding_fn = embedding_fn or RemoteEmbeddingFunction(config)
+        self.shared_cache = shared_cache
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.manifest: Optional[Manifest] = None
+        self.lexical: Optional[LexicalIndex] = None
+        # Quantized vectors, when storage.quantization is not none
+        self.vectors: Optional[QuantizedVectorStore] = None
+        self.quantization = config.storage.quantization
         self.client = None
         self.collection = None
+        # The Chroma system behind client, stopped by close()
+        self._system = None
 
     def initialize(self):
         if not os.path.exists(self.db_path):
             os.makedirs(self.db_path, exist_ok=True)
             
         self.client = chromadb.PersistentClient(path=self.db_path)
-        self.collection = self.client.get_or_create_collection(
-            name="rag_collection",
-            embedding_function=self.embedding_fn
-        )
+        self._system = SharedSystemClient._identifier_to_system.get(self.db_path)
+        if self.manifest is None:
+            self.manifest = Manifest(os.path.join(self.db_path, "manifest.sqlite3"))
+        stored = self.manifest.get_meta("vector_store")
+        if stored is None:
+            # Indexes written before quantization existed keep their vectors in Chroma
+            names = {collection.name for collection in self.client.list_collections()}
+            stored = "none" if "rag_collection" in names else self.config.storage.quantization
+            self.manifest.set_meta("vector_store", stored)
+        if stored != self.config.storage.quantization:
+            logger.warning(f"Index {self.db_path} stores {stored} vectors, the config asks for {self.config.storage.quantization}; the next index run converts it")
+        # Searches use what is on disk until convert_vectors() switches it
+        self._open_vectors(stored)
+        if self.lexical is None:
+            self.lexical = LexicalIndex(os.path.join(self.db_path, "lexical.sqlite3"))
+        if self.config.cache.embedding_cache and self.embedding_cache is None:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(self.db_path, "embedding_cache.sqlite3"),
+                self.config.cache.embedding_cache_max_mb * 1024 * 1024
+            )
+
+    def _open_vectors(self, quantization: str):
+        if quantization == "none":
+            self.vectors = None
+            name = "rag_collection"
+        else:
+            self.vectors = QuantizedVectorStore(
+                os.path.join(self.db_path, f"vectors_{quantization}"), quantization, keep_full=self.config.storage.rerank
+            )
+            # Documents and metadata only; each chunk gets a 1-d placeholder vector
+            name = "rag_documents"
+        self.collection = self.client.get_or_create_collection(name=name, embedding_function=self.embedding_fn)
+        self.quantization = quantization
+
+    def convert_vectors(self, batch_size: int = 500):
+        """
+        Move every chunk to the vector store selected by storage.quantization, copying the stored
+        embeddings instead of requesting them again.
+        """
+        if not self.client:
+            self.initialize()
+        target = self.config.storage.quantization
+        if self.quantization == target:
+            return
+        old_collection, old_vectors, old_quantization = self.collection, self.vectors, self.quantization
+        logger.info(f"Converting {old_collection.count()} chunks from {old_quantization} to {target} vectors")
+        self._open_vectors(target)
+        # float16 and int8 share the documents collection, so only the vectors move
+        same_collection = old_collection.name == self.collection.name
+        for ids, documents, metadatas, embeddings in _iter_chunks(old_collection, old_vectors, batch_size):
+            if same_collection:
+                self.vectors.add(ids, embeddings)
+            else:
+                self._write(documents, metadatas, ids, embeddings)
+
+        if not same_collection:
+            self.client.delete_collection(old_collection.name)
+        if old_vectors is not None:
+            old_vectors.close()
+            shutil.rmtree(old_vectors.path, ignore_errors=True)
+        self.manifest.set_meta("vector_store", target)
 
-    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str]):
+    def iter_chunks(self, batch_size: int = 500) -> Iterator[Tuple[List[str], List[str], List[dict], Embeddings]]:
+        """Yield (ids, documents, metadatas, embeddings) batches of every stored chunk."""
+        if not self.client:
+            self.initialize()
+        return _iter_chunks(self.collection, self.vectors, batch_size)
+
+    def embed(self, texts: List[str]) -> Embeddings:
+        """
+        Embed texts, reusing cached vectors for content that was embedded before.
+        """
+        if not self.client:
+            self.initialize()
+        if self.embedding_cache is None:
+            return self.embedding_fn.embed_documents(texts)
+
+        model = self.embedding_fn.model
+        with metrics.span("storage.embedding_cache_get"):
+            hashes = [content_hash(text) for text in texts]
+            cached = self.embedding_cache.get_many(model, hashes)
+
+        # Embed each missing content once, even if it repeats within texts
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        # Content that storages indexed alongside this one have embedded, or are embedding now
+        waiting: Dict[str, Future] = {}
+        if missing and self.shared_cache is not None:
+            with metrics.span("storage.embedding_cache_get"):
+                shared, waiting, claimed = self.shared_cache.claim(model, list(missing))
+            if shared:
+                self.embedding_cache.put_many(model, list(shared.items()))
+                cached.update(shared)
+            missing = {h: missing[h] for h in claimed}
+        embedded = len(missing)
+        if missing:
+            cached.update(self._embed_missing(model, missing))
+            logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        if waiting:
+            failed: Dict[str, str] = {}
+            with metrics.span("storage.embedding_wait"):
+                for h, future in waiting.items():
+                    try:
+                        cached[h] = future.result()
+                    except Exception:
+                        # Whoever claimed it failed; try it here
+                        failed[h] = texts[hashes.index(h)]
+            if failed:
+                cached.update(self._embed_missing(model, failed, claimed=False))
+                embedded += len(failed)
+            self.embedding_cache.put_many(model, [(h, cached[h]) for h in waiting])
+        metrics.inc("embedding_cache.hits", len(texts) - embedded)
+        metrics.inc("embedding_cache.misses", embedded)
+
+        return [cached[h] for h in hashes]
+
+    def _embed_missing(self, model: str, missing: Dict[str, str], claimed: bool = True) -> Dict[str, np.ndarray]:
+        """Embed texts by content hash and cache them; claimed hashes are also handed to the shared cache."""
+        try:
+            with metrics.span("storage.embed"):
+                new_embeddings = self.embedding_fn.embed_documents(list(missing.values()))
+        except Exception as e:
+            if claimed and self.shared_cache is not None:
+                # Storages waiting for these embed them themselves
+                self.shared_cache.release(model, list(missing), e)
+            raise
+        # Chroma rejects a mix of lists and arrays, and cache hits are float32 arrays
+        fresh = [(h, np.asarray(e, dtype=np.float32)) for h, e in zip(missing.keys(), new_embeddings)]
+        with metrics.span("storage.embedding_cache_put"):
+            if claimed and self.shared_cache is not None:
+                self.shared_cache.publish(model, fresh)
+            self.embedding_cache.put_many(model, fresh)
+        return dict(fresh)
+
+    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str], embeddings: Optional[Embeddings] = None):
+        """Embed and write chunks; pass embeddings to copy chunks that were embedded elsewhere."""
         if not self.client:
             self.initialize()
             
-        batch_size = 100
-        for i in range(0, len(documents), batch_size):
-            end = min(i + batch_size, len(documents))
-            self.collection.add(
-                documents=documents[i:end],
-                metadatas=metadatas[i:end],
-                ids=ids[i:end]
-            )
+        if embeddings is None:
+            embeddings = self.embed(documents)
+        self._write(documents, metadatas, ids, embeddings)
+        with metrics.span("storage.lexical_add"):
+            self.lexical.add(ids, documents, [meta.get("file_path", "") for meta in metadatas])
+
+    def _write(self, documents: List[str], metadatas: List[dict], ids: List[str], embeddings: Embeddings):
+        batch_size = self.config.model.max_batch_size
+        for start in range(0, len(documents), batch_size):
+            end = min(start + batch_size, len(documents))
+            # Ids are deterministic, so upsert keeps a re-run after an interruption idempotent
+            with metrics.span("storage.upsert"):
+                if self.vectors is not None:
+                    self.vectors.add(ids[start:end], embeddings[start:end])
+                self.collection.upsert(
+                    documents=documents[start:end],
+                    embeddings=embeddings[start:end] if self.vectors is None else np.zeros((end - start, 1), dtype=np.float32),
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+
+    def delete_documents(self, ids: List[str]):
+        """Remove chunks from both the vector and the keyword index."""
+        if not self.client:
+            self.initialize()
+        with metrics.span("storage.delete"):
+            self.collection.delete(ids=ids)
+            self.lexical.delete(ids)
+            if self.vectors is not None:
+                self.vectors.delete(ids)
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """The ids among `ids` whose chunks were fully written: present in the collection and the keyword index."""
+        if not self.client:
+            self.initialize()
+        found: List[str] = []
+        batch_size = self.config.model.max_batch_size
+        for start in range(0, len(ids), batch_size):
+            found += self.collection.get(ids=ids[start:start + batch_size], include=[])['ids']
+        return self.lexical.existing(found)
 
-    def search(self, query: str, n_results: int = 5):
+    def update_metadatas(self, metadatas: List[dict], ids: List[str]):
+        """Replace the metadata of existing chunks without re-embedding them."""
         if not self.client:
             self.initialize()
+
+        batch_size = self.config.model.max_batch_size
+        for start in range(0, len(ids), batch_size):
+            end = min(start + batch_size, len(ids))
+            self.collection.update(ids=ids[start:end], metadatas=metadatas[start:end])
+
+    def search(self, query: str, n_results: int = 5, query_embedding: Optional[List[float]] = None, where: Optional[dict] = None):
+        return self.search_batch([query], n_results, [query_embedding] if query_embedding is not None else None, where)
+
+    def search_batch(self, queries: List[str], n_results: int = 5, query_embeddings: Optional[Embeddings] = None, where: Optional[dict] = None):
+        """
+        Nearest chunks for several queries in one collection.query call; results hold one list per query,
+        in the order of queries.
+        """
+        if not self.client:
+            self.initialize()
+        if query_embeddings is None:
+            query_embeddings = self.embed(queries)
             
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results
-        )
+        if self.vectors is not None:
+            return self._quantized_search(query_embeddings, n_results, where)
+        # where is applied by Chroma during the nearest-neighbour search, not to its results
+        with metrics.span("storage.vector_query"):
+            results = self.collection.query(
+                query_embeddings=list(query_embeddings),
+                n_results=n_results,
+                where=where
+            )
+        return results
+
+    def _fetch(self, ids: List[str]) -> Dict[str, Tuple[str, dict]]:
+        """Documents and metadatas of ids, skipping chunks removed from the collection by a concurrent update."""
+        data = self.collection.get(ids=list(dict.fromkeys(ids)), include=['documents', 'metadatas'])
+        return {doc_id: (doc, meta) for doc_id, doc, meta in zip(data['ids'], data['documents'], data['metadatas'])}
+
+    def _quantized_search(self, query_embeddings: Embeddings, n_results: int, where: Optional[dict]) -> dict:
+        """Scan the quantized vectors, returning the same layout as collection.query."""
+        with metrics.span("storage.vector_query"):
+            # Chroma still evaluates where, against the metadata it holds
+            allowed = set(self.collection.get(where=where, include=[])['ids']) if where is not None else None
+            hits = self.vectors.search_batch(query_embeddings, n_results, allowed, self.config.storage.rerank_candidates)
+        results = {key: [[] for _ in hits] for key in ("ids", "documents", "metadatas", "distances")}
+        if not any(hits):
+            return results
+        with metrics.span("storage.vector_fetch"):
+            found = self._fetch([doc_id for query_hits in hits for doc_id, _ in query_hits])
+        for i, query_hits in enumerate(hits):
+            for doc_id, distance in query_hits:
+                if doc_id not in found:
+                    continue
+                doc, meta = found[doc_id]
+                results["ids"][i].append(doc_id)
+                results["documents"][i].append(doc)
+                results["metadatas"][i].append(meta)
+                results["distances"][i].append(distance)
         return results
 
+    def lexical_search(self, query: str, n_results: int = 5, path_filter: Optional[Callable[[str], bool]] = None) -> dict:
+        """
+        Keyword search with BM25, without embedding the query.
+        Returns Chroma-style results with `scores` (higher is better) and `matched_terms` instead of distances.
+        """
+        return self.lexical_search_batch([query], n_results, path_filter)
+
+    def lexical_search_batch(self, queries: List[str], n_results: int = 5, path_filter: Optional[Callable[[str], bool]] = None) -> dict:
+        """lexical_search for several queries, fetching the chunks of all of them with one collection.get."""
+        if not self.client:
+            self.initialize()
+        with metrics.span("storage.lexical_query"):
+            hits = [self.lexical.search(query, n_results, path_filter) for query in queries]
+        results = {key: [[] for _ in queries] for key in ("ids", "documents", "metadatas", "scores", "matched_terms")}
+        if not any(hits):
+            return results
+
+        with metrics.span("storage.lexical_fetch"):
+            found = self._fetch([hit.doc_id for query_hits in hits for hit in query_hits])
+        for i, query_hits in enumerate(hits):
+            for hit in query_hits:
+                if hit.doc_id not in found:
+                    continue
+                doc, meta = found[hit.doc_id]
+                results["ids"][i].append(hit.doc_id)
+                results["documents"][i].append(doc)
+                results["metadatas"][i].append(meta)
+                results["scores"][i].append(hit.score)
+                results["matched_terms"][i].append(hit.matched_terms)
+        return results
+
+    def close(self):
+        """
+        Release the underlying Chroma system so a rebuilt database is reopened from disk.
+        """
+        if self._owns_embedding_fn:
+            self.embedding_fn.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+            self.embedding_cache = None
+        if self.manifest is not None:
+            self.manifest.close()
+            self.manifest = None
+        if self.lexical is not None:
+            self.lexical.close()
+            self.lexical = None
+        if self.vectors is not None:
+            self.vectors.close()
+            self.vectors = None
+        if self.client is None:
+            return
+        # Chroma shares one system per persist directory; drop it or a new client would reuse stale handles
+        self.detach()
+        if self._system is not None:
+            try:
+                self._system.stop()
+            except Exception as e:
+                logger.warning(f"Error closing storage {self.db_path}: {e}")
+        self.client = None
+        self.collection = None
+        self._system = None
+
+    def detach(self):
+        """
+        Let the next client of db_path start its own Chroma system instead of sharing this storage's,
+        which keeps working until close().
+        """
+        if self._system is not None and SharedSystemClient._identifier_to_system.get(self.db_path) is self._system:
+            SharedSystemClient._identifier_to_system.pop(self.db_path, None)
+
     def clear(self):
+        self.close()
         if os.path.exists(self.db_path):
             shutil.rmtree(self.db_path)
             logger.info(f"Cleaned up {self.db_path}")
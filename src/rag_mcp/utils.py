@@ -1,54 +1,95 @@
+import codecs
 import os
 import mimetypes
+from typing import Iterator, Optional, Tuple
 
-def is_text_file(file_path: str) -> bool:
+# Decided by name alone, without opening the file
+BINARY_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg', '.ico', '.webp',
+    '.mp4', '.avi', '.mov', '.flv', '.mkv',
+    '.mp3', '.wav', '.flac', '.aac',
+    '.zip', '.rar', '.tar', '.gz', '.7z', '.bz2', '.xz', '.jar', '.whl',
+    '.exe', '.dll', '.so', '.dylib', '.o', '.a', '.class', '.sh', '.bat', '.apk',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.bin', '.pyc', '.woff', '.woff2', '.ttf', '.otf',
+    '.db', '.sqlite', '.sqlite3', '.npy', '.pkl', '.parquet'
+}
+
+TEXT_EXTENSIONS = {
+    '.txt', '.md', '.json', '.yaml', '.xml', '.csv', '.log', '.ini', '.conf', '.py', '.js', '.html', '.css'
+}
+
+# Bytes that make up text besides printable ones: tab, newline, form feed, carriage return, escape, backspace
+_TEXT_CONTROL = b'\t\n\f\r\x1b\x08'
+_CONTROL_BYTES = bytes(b for b in range(32) if b not in _TEXT_CONTROL) + b'\x7f'
+
+def extension_is_text(file_path: str) -> Optional[bool]:
+    """True or False if the extension decides whether file_path is text, None if its content has to."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in BINARY_EXTENSIONS:
+        return False
+    if ext in TEXT_EXTENSIONS:
+        return True
+    return None
+
+def sniff_text(file_path: str, sample_size: int = 4096) -> bool:
     """
-    Check if a file is a text file based on extension and content.
+    Whether the first sample_size bytes of a file look like UTF-8 text: no NUL byte, at most
+    one in ten bytes a control character, and valid UTF-8 (a character cut at the end is fine).
     """
-    # Skip hidden files/dirs (except if explicitly handled, but usually we skip .git etc)
-    if os.path.basename(file_path).startswith('.'):
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read(sample_size)
+    except OSError:
         return False
-        
-    # Extensions to skip
-    skip_exts = {
-        '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.svg',
-        '.mp4', '.avi', '.mov', '.flv', '.mkv',
-        '.mp3', '.wav', '.flac', '.aac',
-        '.zip', '.rar', '.tar', '.gz', '.7z',
-        '.exe', '.dll', '.sh', '.bat', '.apk',
-        '.pdf', '.docx', '.xlsx', '.bin', '.pyc'
-    }
-    
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext in skip_exts:
+    if b'\0' in data:
+        return False
+    if len(data) - len(data.translate(None, _CONTROL_BYTES)) > len(data) // 10:
         return False
-        
-    # Extensions to include
-    text_exts = {
-        '.txt', '.md', '.json', '.yaml', '.xml', '.csv', '.log', '.ini', '.conf', '.py', '.js', '.html', '.css'
-    }
-    
-    if ext in text_exts:
-        return True
-        
-    # Heuristic check for other files
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            f.read(1024)
-            return True
+        codecs.getincrementaldecoder('utf-8')().decode(data, final=False)
     except UnicodeDecodeError:
         return False
-    except Exception:
+    return True
+
+def is_text_file(file_path: str) -> bool:
+    """
+    Check if a file is a text file based on extension and content.
+    """
+    # Skip hidden files/dirs (except if explicitly handled, but usually we skip .git etc)
+    if os.path.basename(file_path).startswith('.'):
         return False
+    decided = extension_is_text(file_path)
+    if decided is not None:
+        return decided
+    return sniff_text(file_path)
 
 def read_file_content(file_path: str) -> str:
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
             return f.read()
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return ""
 
+def _find_split_point(text: str, current_pos: int, end: int) -> int:
+    """
+    Pick where a chunk ending near `end` should stop: a newline within 100 characters
+    after or before `end`, else a space within 50 characters after it, else `end` itself.
+    Only looks at text[current_pos:end + 100], so callers may pass a buffered window.
+    """
+    next_newline = text.find('\n', end, end + 100)
+    prev_newline = text.rfind('\n', max(current_pos, end - 99), end)
+    
+    if next_newline != -1:
+        return next_newline + 1
+    if prev_newline != -1:
+        return prev_newline + 1
+    # Try space
+    next_space = text.find(' ', end, end + 50)
+    if next_space != -1:
+        return next_space + 1
+    return end
+
 def chunk_text(text: str, chunk_count: int) -> list[str]:
     """
     Split text into approximately `chunk_count` parts, respecting boundaries.
@@ -63,66 +104,25 @@ def chunk_text(text: str, chunk_count: int) -> list[str]:
     target_size = total_len // chunk_count
     
     if target_size == 0:
-        return [c for c in text] # Very small text
+        return [text] # Very small text
         
     chunks = []
     current_pos = 0
     
-    # Simple recursive splitter logic simulation
-    # We want to find a split point near current_pos + target_size
-    
     for _ in range(chunk_count - 1):
         if current_pos >= total_len:
             break
             
-        search_start = current_pos + target_size
-        # Look for a good split point around search_start
-        # Priorities: \n\n, \n, space
-        
-        split_point = -1
-        
-        # Search window: +/- 20% of target size? Or just look forward/backward
-        # Let's look forward for the nearest newline
-        
-        # Try to find \n in the next chunk
-        # We want to split roughly at `current_pos + target_size`
-        
-        candidate = min(current_pos + target_size, total_len)
+        # Split roughly at `current_pos + target_size`, backing off to a nearby boundary
+        end = min(current_pos + target_size, total_len)
         
         # If we are at the end, just take the rest
-        if candidate == total_len:
+        if end == total_len:
             chunks.append(text[current_pos:])
             current_pos = total_len
             break
             
-        # Look for \n around candidate
-        # Search range: [candidate - target_size/2, candidate + target_size/2]
-        # But we must advance.
-        
-        # Let's just find the nearest newline after candidate, or before if it's too far.
-        # Simple approach: Find last \n before candidate + margin?
-        
-        # Let's use a simpler approach:
-        # Just split at `target_size` but back off to nearest newline.
-        
-        end = min(current_pos + target_size, total_len)
-        
-        # Try to extend to next newline if it's close
-        next_newline = text.find('\n', end)
-        prev_newline = text.rfind('\n', current_pos, end)
-        
-        if next_newline != -1 and next_newline - end < 100:
-             split_point = next_newline + 1
-        elif prev_newline != -1 and end - prev_newline < 100:
-             split_point = prev_newline + 1
-        else:
-            # Try space
-            next_space = text.find(' ', end)
-            if next_space != -1 and next_space - end < 50:
-                split_point = next_space + 1
-            else:
-                split_point = end
-                
+        split_point = _find_split_point(text, current_pos, end)
         chunks.append(text[current_pos:split_point])
         current_pos = split_point
         
@@ -131,3 +131,75 @@ def chunk_text(text: str, chunk_count: int) -> list[str]:
         chunks.append(text[current_pos:])
         
     return chunks
+
+def iter_file_chunks(file_path: str, chunk_count: int, block_size: int = 1 << 20) -> Iterator[str]:
+    """
+    Stream a file as chunks with the same boundary rules as `chunk_text`, holding
+    roughly one chunk in memory instead of the whole file.
+    The target chunk size is derived from the file size in bytes, which matches the
+    character count for ASCII text and over-estimates it for multi-byte text.
+    """
+    total_len = os.path.getsize(file_path)
+    target_size = total_len // chunk_count if chunk_count > 1 else 0
+    if target_size == 0:
+        yield from chunk_text(read_file_content(file_path), chunk_count)
+        return
+
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        buf = ""
+        eof = False
+
+        def fill(size: int) -> str:
+            nonlocal eof
+            parts = [buf]
+            length = len(buf)
+            while length < size and not eof:
+                block = f.read(block_size)
+                if not block:
+                    eof = True
+                    break
+                parts.append(block)
+                length += len(block)
+            return "".join(parts)
+
+        for _ in range(chunk_count - 1):
+            # Enough lookahead for _find_split_point to see every boundary it considers
+            buf = fill(target_size + 100)
+            if not buf:
+                return
+            if eof and len(buf) <= target_size:
+                break
+            split_point = _find_split_point(buf, 0, target_size)
+            yield buf[:split_point]
+            buf = buf[split_point:]
+
+        # Last chunk
+        rest = buf + f.read()
+        if rest:
+            yield rest
+
+def read_file_range(file_path: str, offset: int, length: int) -> Tuple[str, int, int]:
+    """
+    Read up to `length` bytes of a UTF-8 file starting at byte `offset`, without loading the rest.
+    Both ends are moved to character boundaries. Returns the text, the offset it actually starts
+    at and the offset to continue from.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length + 3)
+
+    # Skip continuation bytes if offset landed inside a multi-byte character
+    start = 0
+    while start < min(3, len(data)) and (data[start] & 0xC0) == 0x80:
+        start += 1
+    end = min(len(data), start + length)
+    # Don't cut the last character in half
+    if end < len(data):
+        while end > start and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        if end == start:
+            # length is smaller than one character, return that character whole
+            end = start + 1
+            while end < len(data) and (data[end] & 0xC0) == 0x80:
+                end += 1
+    return data[start:end].decode('utf-8', errors='replace'), offset + start, offset + end
@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .logger import logger
+
+QUANTIZATIONS = ("float16", "int8")
+
+# Bytes of float32 temporaries per scan step; small enough to stay in L2 cache, which makes the
+# int8 scan several times faster than converting a whole array at once
+SCAN_BLOCK_BYTES = 1 << 20
+
+class QuantizedVectorStore:
+    """
+    Chunk embeddings in memory-mapped files, searched by a vectorized NumPy scan instead of an HNSW graph.
+    Vectors are stored as float16, or as int8 with one scale per vector, so a scan reads 2-4x less memory.
+    With keep_full a float32 copy is kept in a separate file, from which only the best candidates of
+    the scan are read to rerank them exactly. Distances are squared L2, the same as Chroma's default.
+    """
+    def __init__(self, path: str, kind: str, keep_full: bool = True, initial_capacity: int = 1024):
+        if kind not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {kind!r}, expected one of {', '.join(QUANTIZATIONS)}")
+        self.path = path
+        self.kind = kind
+        self.keep_full = keep_full
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "rows.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (id TEXT PRIMARY KEY, row INTEGER NOT NULL UNIQUE) WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("kind", kind) != kind:
+            raise ValueError(f"Vector store {path} holds {meta['kind']} vectors, not {kind}")
+        if keep_full and meta.get("keep_full") == "0":
+            # Exact vectors that were never written can't be recovered
+            logger.warning(f"Vector store {path} was built without full-precision vectors, reranking is off until it is rebuilt")
+            self.keep_full = False
+        self.dim: Optional[int] = int(meta["dim"]) if "dim" in meta else None
+        self._capacity = int(meta.get("capacity", 0))
+        self._initial_capacity = initial_capacity
+
+        self._rows: Dict[str, int] = dict(self._conn.execute("SELECT id, row FROM rows").fetchall())
+        self._ids: List[Optional[str]] = [None] * self._capacity
+        for doc_id, row in self._rows.items():
+            self._ids[row] = doc_id
+        # Rows below the high-water mark are scanned; deleted ones are reused before it grows
+        self._end = max(self._rows.values(), default=-1) + 1
+        self._free = [row for row in range(self._end) if self._ids[row] is None]
+        self._valid = np.zeros(self._capacity, dtype=bool)
+        if self._rows:
+            self._valid[list(self._rows.values())] = True
+        self._open_files()
+
+    def _open_files(self):
+        self._codes = self._scales = self._norms = self._full = None
+        if self.dim is None or self._capacity == 0:
+            return
+        code_dtype = np.float16 if self.kind == "float16" else np.int8
+        self._codes = self._map("codes.bin", code_dtype, (self._capacity, self.dim))
+        # Squared norms of the exact vectors, for L2 distances from dot products
+        self._norms = self._map("norms.bin", np.float32, (self._capacity,))
+        if self.kind == "int8":
+            self._scales = self._map("scales.bin", np.float32, (self._capacity,))
+        if self.keep_full:
+            self._full = self._map("full.bin", np.float32, (self._capacity, self.dim))
+
+    def _map(self, name: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+        path = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'ab') as f:
+            if f.tell() < size:
+                # Sparse on most filesystems, so unused capacity costs no disk
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _grow(self, needed: int):
+        capacity = max(self._capacity, self._initial_capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        self._capacity = capacity
+        self._ids.extend([None] * (capacity - len(self._ids)))
+        self._valid = np.concatenate([self._valid, np.zeros(capacity - len(self._valid), dtype=bool)])
+        # Searches still holding the old maps keep working: the files only grow
+        self._open_files()
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('capacity', ?)", (str(capacity),))
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, ids: Sequence[str], embeddings) -> None:
+        """Store embeddings under ids, replacing the vectors of ids already present."""
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self._conn:
+                    self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                        ("kind", self.kind), ("dim", str(self.dim)), ("keep_full", "1" if self.keep_full else "0")
+                    ])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self.dim})")
+
+            rows = []
+            new_rows = []
+            for doc_id in ids:
+                row = self._rows.get(doc_id)
+                if row is None:
+                    row = self._free.pop() if self._free else self._end
+                    self._end = max(self._end, row + 1)
+                    self._rows[doc_id] = row
+                    new_rows.append((doc_id, row))
+                rows.append(row)
+            self._grow(self._end)
+            for doc_id, row in new_rows:
+                self._ids[row] = doc_id
+
+            index = np.asarray(rows)
+            self._norms[index] = np.einsum('ij,ij->i', vectors, vectors)
+            if self.kind == "float16":
+                self._codes[index] = vectors.astype(np.float16)
+            else:
+                scales = np.abs(vectors).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                self._codes[index] = np.rint(vectors / scales[:, None]).astype(np.int8)
+                self._scales[index] = scales
+            if self._full is not None:
+                self._full[index] = vectors
+            self._flush()
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO rows (id, row) VALUES (?, ?)", new_rows)
+            self._valid[index] = True
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            removed = [(doc_id, self._rows.pop(doc_id)) for doc_id in ids if doc_id in self._rows]
+            if not removed:
+                return
+            for doc_id, row in removed:
+                self._ids[row] = None
+                self._valid[row] = False
+                self._free.append(row)
+            with self._conn:
+                self._conn.executemany("DELETE FROM rows WHERE id = ?", [(doc_id,) for doc_id, _ in removed])
+
+    def get(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of ids: exact if keep_full, otherwise dequantized."""
+        with self._lock:
+            found = [(doc_id, self._rows[doc_id]) for doc_id in ids if doc_id in self._rows]
+            if not found:
+                return {}
+            index = np.asarray([row for _, row in found])
+            if self._full is not None:
+                vectors = np.array(self._full[index])
+            else:
+                vectors = self._dequantize(self._codes, self._scales, index)
+        return {doc_id: vector for (doc_id, _), vector in zip(found, vectors)}
+
+    @staticmethod
+    def _dequantize(codes: np.ndarray, scales: Optional[np.ndarray], index) -> np.ndarray:
+        vectors = codes[index].astype(np.float32)
+        if scales is not None:
+            vectors *= scales[index][:, None]
+        return vectors
+
+    def search(self, query, n_results: int, allowed: Optional[Set[str]] = None, rerank_candidates: int = 4) -> List[Tuple[str, float]]:
+        """
+        Return the n_results nearest (id, squared L2 distance) pairs, nearest first.
+        allowed restricts the search to those ids. The quantized scan keeps n_results * rerank_candidates
+        candidates, which are then ranked by their exact vectors when those are kept.
+        """
+        return self.search_batch([query], n_results, allowed, rerank_candidates)[0]
+
+    def search_batch(self, queries, n_results: int, allowed: Optional[Set[str]] = None, rerank_candidates: int = 4) -> List[List[Tuple[str, float]]]:
+        """search for several queries in one pass over the vectors: each block is scanned once for all of them."""
+        with self._lock:
+            # Snapshot under the lock; writes after this only touch rows outside it or set valid flags
+            end = self._end
+            if end == 0 or self.dim is None:
+                return [[] for _ in queries]
+            codes, scales, norms, full, dim = self._codes, self._scales, self._norms, self._full, self.dim
+            mask = self._valid[:end].copy()
+            if allowed is not None:
+                allowed_rows = np.zeros(end, dtype=bool)
+                rows = [self._rows[doc_id] for doc_id in allowed if doc_id in self._rows]
+                allowed_rows[[row for row in rows if row < end]] = True
+                mask &= allowed_rows
+            ids = self._ids[:end]
+
+        q = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        distances = np.empty((len(q), end), dtype=np.float32)
+        block = max(64, SCAN_BLOCK_BYTES // (4 * dim))
+        for start in range(0, end, block):
+            stop = min(start + block, end)
+            dots = q @ codes[start:stop].astype(np.float32).T
+            if scales is not None:
+                dots *= scales[start:stop]
+            # |x - q|^2 = |x|^2 - 2 x.q + |q|^2; |q|^2 is the same for every row and added back below
+            distances[:, start:stop] = norms[start:stop] - 2 * dots
+        distances[:, ~mask] = np.inf
+
+        available = int(mask.sum())
+        keep = min(available, n_results * max(1, rerank_candidates) if full is not None else n_results)
+        if keep == 0:
+            return [[] for _ in queries]
+        results = []
+        for query, row in zip(q, distances):
+            candidates = np.argpartition(row, keep - 1)[:keep]
+            if full is not None:
+                candidates = np.sort(candidates)
+                diff = full[candidates] - query
+                exact = np.einsum('ij,ij->i', diff, diff)
+                order = np.argsort(exact)[:n_results]
+                results.append([(ids[candidates[i]], float(exact[i])) for i in order])
+                continue
+            q_norm = float(query @ query)
+            order = np.argsort(row[candidates])[:n_results]
+            results.append([(ids[candidates[i]], max(0.0, float(row[candidates[i]]) + q_norm)) for i in order])
+        return results
+
+    def _flush(self):
+        for mapped in (self._codes, self._scales, self._norms, self._full):
+            if mapped is not None:
+                mapped.flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._codes = self._scales = self._norms = self._full = None
+            self._conn.close()
@@ -0,0 +1,258 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from .config import WatchConfig
+from .classify import IGNORE_FILES, IgnoreMatcher
+
+from .logger import logger
+
+# Returned by a backend when events were lost and the whole tree must be rescanned
+RESCAN = "<rescan>"
+
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+def _iter_dirs(root: str, ignore: Optional[IgnoreMatcher] = None):
+    """
+    Yield (path, rules) of root and every non-hidden directory below it, where rules are the
+    ignore rules in effect inside path. Directories that ignore excludes are not entered, as in indexing.
+    """
+    stack = [(root, ignore.rules_for(root) if ignore else ())]
+    while stack:
+        path, rules = stack.pop()
+        yield path, rules
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if not entry.is_dir(follow_symlinks=False) or entry.name.startswith('.'):
+                        continue
+                    if ignore is None:
+                        stack.append((entry.path, ()))
+                    elif not ignore.match(entry.path, True, rules):
+                        stack.append((entry.path, ignore.child_rules(entry.path, rules)))
+        except OSError:
+            pass
+
+class InotifyBackend:
+    """Linux inotify through libc, watching every non-hidden, non-ignored directory of the tree."""
+    def __init__(self, root: str, ignore: Optional[IgnoreMatcher] = None):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, str] = {}
+        self.ignore = ignore
+        try:
+            for path, _ in _iter_dirs(root, ignore):
+                self._add_watch(path)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            # The directory vanished before we could watch it
+            return
+        self._watches[wd] = path
+
+    def poll(self, timeout: float) -> List[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                changed.append(RESCAN)
+                continue
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            parent = self._watches.get(wd)
+            if parent is None or not name:
+                continue
+            name = os.fsdecode(name)
+            # Hidden files are never indexed, but ignore files change what is
+            if name.startswith('.') and name not in IGNORE_FILES:
+                continue
+            path = os.path.join(parent, name)
+            is_dir = bool(mask & _IN_ISDIR)
+            if self.ignore is not None:
+                if name in IGNORE_FILES:
+                    # Directories may have stopped being ignored; watching one twice is harmless
+                    self.ignore.clear()
+                    for sub_dir, _ in _iter_dirs(parent, self.ignore):
+                        self._add_watch(sub_dir)
+                elif self.ignore.match(path, is_dir, self.ignore.rules_for(parent)):
+                    continue
+            if is_dir and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # Watch the new subtree; files already inside it are picked up by indexing the directory
+                for sub_dir, _ in _iter_dirs(path, self.ignore):
+                    self._add_watch(sub_dir)
+            changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingBackend:
+    """Portable fallback that rescans the tree every `interval` seconds and diffs file stats."""
+    def __init__(self, root: str, interval: float, ignore: Optional[IgnoreMatcher] = None):
+        self.root = root
+        self.interval = interval
+        self.ignore = ignore
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot = {}
+        if self.ignore is not None:
+            # Ignore files may have changed since the last scan
+            self.ignore.clear()
+        for path, rules in _iter_dirs(self.root, self.ignore):
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        # Hidden and ignored files are never indexed, but ignore files change what is
+                        if entry.name not in IGNORE_FILES and (
+                            entry.name.startswith('.') or (self.ignore is not None and self.ignore.match(entry.path, False, rules))
+                        ):
+                            continue
+                        st = entry.stat()
+                        snapshot[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+            except OSError:
+                pass
+        return snapshot
+
+    def poll(self, timeout: float) -> List[str]:
+        wait = self._next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            return []
+        snapshot = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        changed += [path for path in self._snapshot if path not in snapshot]
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class DirectoryWatcher:
+    """
+    Watches one indexed directory and re-indexes changed files in a background thread.
+    Events are coalesced per path and a path is only indexed once it has been quiet for
+    `debounce` seconds, so a burst of writes (checkout, build) costs one update per file.
+    Paths that ignore excludes (the indexer's ignore rules) are neither watched nor reported.
+    """
+    def __init__(self, target_dir: str, config: WatchConfig, index_paths, index_all, ignore: Optional[IgnoreMatcher] = None):
+        self.target_dir = os.path.abspath(target_dir)
+        self.config = config
+        self.ignore = ignore
+        # Callbacks, so the watcher doesn't need to know how storages are opened
+        self.index_paths = index_paths
+        self.index_all = index_all
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _create_backend(self):
+        if self.config.backend in ("auto", "inotify"):
+            try:
+                return InotifyBackend(self.target_dir, self.ignore)
+            except OSError as e:
+                if self.config.backend == "inotify":
+                    raise
+                logger.warning(f"inotify unavailable for {self.target_dir} ({e}), falling back to polling")
+        return PollingBackend(self.target_dir, self.config.poll_interval, self.ignore)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"watch-{os.path.basename(self.target_dir)}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            backend = self._create_backend()
+        except Exception as e:
+            logger.error(f"Cannot watch {self.target_dir}: {e}")
+            return
+        logger.info(f"Watching {self.target_dir} for changes ({type(backend).__name__})")
+
+        # Catch up on changes made while nobody was watching
+        self._safe(self.index_all)
+
+        pending: Dict[str, float] = {}
+        rescan = False
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                for path in backend.poll(timeout=min(self.config.debounce, 1.0)):
+                    if path == RESCAN:
+                        rescan = True
+                    else:
+                        pending[path] = now
+
+                now = time.monotonic()
+                quiet = not pending or now - max(pending.values()) >= self.config.debounce
+                if rescan and quiet:
+                    logger.info(f"Watch events were lost for {self.target_dir}, re-indexing the whole directory")
+                    rescan = False
+                    pending.clear()
+                    self._safe(self.index_all)
+                    continue
+
+                due: Set[str] = {path for path, seen in pending.items() if now - seen >= self.config.debounce}
+                if due:
+                    for path in due:
+                        del pending[path]
+                    self._safe(self.index_paths, sorted(due))
+        finally:
+            backend.close()
+
+    def _safe(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(f"Error updating index for {self.target_dir}: {e}")
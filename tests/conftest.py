@@ -0,0 +1,63 @@
+import hashlib
+import os
+from typing import List
+
+import pytest
+
+# Chroma reports usage over the network unless told not to
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from rag_mcp.config import AppConfig
+from rag_mcp.storage import RAGStorage, RemoteEmbeddingFunction
+
+class FakeEmbeddingFunction(RemoteEmbeddingFunction):
+    """Deterministic vectors derived from each text, recording every text it is asked to embed."""
+    def __init__(self, config: AppConfig):
+        super().__init__(config)
+        self.texts: List[str] = []
+
+    def __call__(self, input):
+        self.texts.extend(input)
+        return [[b / 255.0 for b in hashlib.sha256(text.encode('utf-8')).digest()[:16]] for text in input]
+
+@pytest.fixture
+def config() -> AppConfig:
+    config = AppConfig()
+    config.processing.chunk_strategy = "fixed"
+    config.processing.chunk_size = 200
+    config.processing.chunk_overlap = 0
+    config.processing.workers = 1
+    # Every file is streamed in parts of 4 chunks, and every part is flushed on its own
+    config.processing.stream_threshold_mb = 0
+    config.model.max_batch_size = 4
+    config.llm.max_concurrent_requests = 1
+    # Reusing chunks must come from the index itself, not from cached vectors
+    config.cache.embedding_cache = False
+    return config
+
+@pytest.fixture
+def open_storage(config: AppConfig):
+    """Open a directory's storage as a new process would; all of them are closed after the test."""
+    storages: List[RAGStorage] = []
+
+    def open_storage(target_dir: str) -> RAGStorage:
+        storage = RAGStorage(str(target_dir), config, embedding_fn=FakeEmbeddingFunction(config))
+        storage.initialize()
+        storages.append(storage)
+        return storage
+
+    yield open_storage
+    for storage in storages:
+        storage.close()
+
+def write_text(path, lines: int, tag: str):
+    """A file of `lines` distinct lines, about one 200-character chunk per 4 lines."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(f"{tag} line {i} " + "x" * 30 + "\n" for i in range(lines)))
+
+def stored_ids(storage: RAGStorage) -> set:
+    return set(storage.collection.get(include=[])['ids'])
+
+def manifest_ids(storage: RAGStorage) -> set:
+    return {doc_id for record in storage.manifest.load().values() for doc_id in record.chunk_ids}
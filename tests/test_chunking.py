@@ -0,0 +1,81 @@
+import pytest
+
+from rag_mcp.chunking import (
+    CODE_SEPARATORS, MARKDOWN_SEPARATORS, TEXT_SEPARATORS, FixedSizeChunker, StructureAwareChunker, get_chunker
+)
+
+def _prose(words: int) -> str:
+    """Distinct words, ten to a line, so every chunk occurs once in the text."""
+    return "".join(f"word{i}" + ("\n" if i % 10 == 9 else " ") for i in range(words))
+
+def _spans(text: str, chunks):
+    """(start, end) of each chunk in text, in order."""
+    spans = []
+    start = 0
+    for chunk in chunks:
+        start = text.index(chunk, start)
+        spans.append((start, start + len(chunk)))
+        start += 1
+    return spans
+
+@pytest.mark.parametrize("file_path, separators", [
+    ("notes.md", MARKDOWN_SEPARATORS),
+    ("main.py", CODE_SEPARATORS),
+    ("notes.txt", TEXT_SEPARATORS),
+])
+def test_structure_strategy_picks_separators_by_extension(config, file_path, separators):
+    config.processing.chunk_strategy = "structure"
+    chunker = get_chunker(config.processing, file_path)
+    assert isinstance(chunker, StructureAwareChunker)
+    assert chunker.separators == separators
+
+def test_markdown_chunks_start_at_headings():
+    sections = [f"{'#' * (1 + i % 3)} Section {i}\n\n" + f"Paragraph {i} " + "text " * 12 + "\n" for i in range(12)]
+    text = "".join(sections)
+    chunks = StructureAwareChunker(200, 0, "notes.md").split(text)
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    for chunk in chunks:
+        assert len(chunk) <= 200
+        assert chunk.startswith("#")
+
+def test_code_chunks_start_at_definitions():
+    definitions = [
+        f"class Handler{i}:\n    pass\n" if i % 3 == 0 else f"def handle_{i}(request):\n    return request.value + {i}\n"
+        for i in range(20)
+    ]
+    text = "\n".join(definitions)
+    chunks = StructureAwareChunker(200, 0, "main.py").split(text)
+    assert len(chunks) > 1
+    assert "".join(chunks) == text
+    for chunk in chunks:
+        assert len(chunk) <= 200
+        assert chunk.startswith(("class ", "def "))
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(200, 0), (200, 50), (120, 30)])
+def test_chunks_stay_within_size_and_overlap(chunk_size, chunk_overlap):
+    text = _prose(400)
+    chunks = StructureAwareChunker(chunk_size, chunk_overlap, "notes.md").split(text)
+    spans = _spans(text, chunks)
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert end - start <= chunk_size
+        # Consecutive chunks leave no gap, share at most chunk_overlap characters and advance by
+        # at least half a chunk
+        assert 0 <= end - next_start <= chunk_overlap
+        assert next_start - start >= chunk_size // 2 - chunk_overlap
+        if chunk_overlap:
+            assert end > next_start
+
+def test_overlap_is_capped_below_half_a_chunk():
+    chunker = FixedSizeChunker(100, 80)
+    assert chunker.chunk_overlap == 49
+    chunks = chunker.split(_prose(200))
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+def test_streamed_blocks_chunk_like_the_whole_text():
+    text = "".join(f"## Part {i}\n\n" + _prose(30) for i in range(10))
+    chunker = StructureAwareChunker(200, 40, "notes.md")
+    blocks = [text[i:i + 37] for i in range(0, len(text), 37)]
+    assert list(chunker.iter_chunks(blocks)) == chunker.split(text)
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from rag_mcp import classify
+from rag_mcp.classify import FileClassifier
+from rag_mcp.manifest import Manifest
+from rag_mcp.utils import sniff_text
+
+@pytest.mark.parametrize("data, is_text", [
+    (b"plain text\nwith lines\n", True),
+    ("中文内容\n".encode("utf-8") * 100, True),
+    # Tabs, newlines and form feeds are not control characters for sniffing
+    (b"a\tb\r\n\f" * 100, True),
+    (b"text with a \0 byte", False),
+    (b"latin-1 caf\xe9 is not utf-8", False),
+    # More than one in ten bytes a control character
+    (b"\x01\x02abcdefgh" * 100, False),
+])
+def test_sniff_text(tmp_path, data, is_text):
+    path = tmp_path / "sample"
+    path.write_bytes(data)
+    assert sniff_text(str(path)) is is_text
+
+def test_sniff_text_accepts_a_character_cut_at_the_end_of_the_sample(tmp_path):
+    path = tmp_path / "sample"
+    # The sample ends after the first byte of a three-byte character
+    path.write_bytes(b"x" * 4095 + "中".encode("utf-8"))
+    assert sniff_text(str(path))
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    yield manifest
+    manifest.close()
+
+@pytest.fixture
+def sniffed(monkeypatch):
+    """Paths sniffed by FileClassifier, in order."""
+    paths = []
+
+    def counting_sniff(path):
+        paths.append(path)
+        return sniff_text(path)
+
+    monkeypatch.setattr(classify, "sniff_text", counting_sniff)
+    return paths
+
+def _walk(root, config, manifest):
+    classifier = FileClassifier(str(root), config.processing, manifest)
+    found = sorted(path for path, _ in classifier.walk(str(root)))
+    classifier.save(complete=True)
+    return found
+
+def test_file_types_are_reused_while_size_and_mtime_are_unchanged(tmp_path, config, manifest, sniffed):
+    root = tmp_path / "docs"
+    root.mkdir()
+    (root / "notes").write_text("plain text\n", encoding="utf-8")
+    (root / "blob").write_bytes(b"\0\1\2\3")
+    # Decided by extension, never sniffed
+    (root / "readme.md").write_text("# title\n", encoding="utf-8")
+    expected = [str(root / "notes"), str(root / "readme.md")]
+
+    assert _walk(root, config, manifest) == expected
+    assert sorted(sniffed) == [str(root / "blob"), str(root / "notes")]
+    assert set(manifest.load_file_types(str(root))) == {str(root / "blob"), str(root / "notes")}
+
+    sniffed.clear()
+    assert _walk(root, config, manifest) == expected
+    assert sniffed == []
+
+    # A changed size or mtime is sniffed again, and the new decision replaces the cached one
+    (root / "notes").write_bytes(b"now \0 binary")
+    st = os.stat(root / "blob")
+    os.utime(root / "blob", ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert _walk(root, config, manifest) == [str(root / "readme.md")]
+    assert sorted(sniffed) == [str(root / "blob"), str(root / "notes")]
+    assert manifest.load_file_types(str(root))[str(root / "notes")][2] is False
+
+def test_complete_walk_drops_file_types_of_deleted_files(tmp_path, config, manifest, sniffed):
+    root = tmp_path / "docs"
+    root.mkdir()
+    (root / "notes").write_text("plain text\n", encoding="utf-8")
+    (root / "old").write_text("plain text\n", encoding="utf-8")
+    _walk(root, config, manifest)
+    os.remove(root / "old")
+    _walk(root, config, manifest)
+    assert set(manifest.load_file_types(str(root))) == {str(root / "notes")}
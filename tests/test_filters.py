@@ -0,0 +1,66 @@
+import os
+
+from conftest import write_text
+from rag_mcp import server
+from rag_mcp.filters import MAX_WHERE_PATHS, DirectoryFilter, SearchFilters, directory_fields
+from rag_mcp.indexer import Indexer
+from rag_mcp.manifest import FileRecord
+
+def _index(tmp_path, config, open_storage):
+    write_text(tmp_path / "top.txt", 4, "top")
+    write_text(tmp_path / "src" / "app.py", 4, "app")
+    write_text(tmp_path / "src" / "lib" / "util.py", 4, "util")
+    write_text(tmp_path / "tests" / "test_app.py", 4, "test")
+    storage = open_storage(tmp_path)
+    Indexer(tmp_path, config, storage=storage).index()
+    return storage
+
+def _vector_search(storage, target_dir, **filters):
+    """Files of the vector matches of a search under filters, as the server runs it."""
+    scope = server._resolve_scope(storage, [str(target_dir)], SearchFilters.from_args(**filters), whole_index=True)
+    if scope is None:
+        return set()
+    query_embeddings = storage.embedding_fn(["line"])
+    rankings = server._rank_matches(storage, ["line"], query_embeddings, 50, False, *scope)
+    return {os.path.relpath(match["file_path"], target_dir) for match in rankings[0]["vector"]}
+
+def test_directory_fields():
+    assert directory_fields("/r/a/b/c.txt", "/r") == {"dir_1": "a", "dir_2": "a/b"}
+    assert directory_fields("/r/c.txt", "/r") == {}
+    assert directory_fields("/other/c.txt", "/r") == {}
+
+def test_subtree_filters_use_one_condition_per_directory(tmp_path, config, open_storage):
+    storage = _index(tmp_path, config, open_storage)
+
+    dir_filter = DirectoryFilter(SearchFilters.from_args(path_prefix="src/lib"), str(tmp_path), storage.manifest)
+    assert dir_filter.where == {"dir_2": "src/lib"}
+    assert _vector_search(storage, tmp_path, path_prefix="src") == {"src/app.py", "src/lib/util.py"}
+    assert _vector_search(storage, tmp_path, path_prefix="src/app.py") == {"src/app.py"}
+    # Top-level files have no dir_1 and must survive the exclusion
+    assert _vector_search(storage, tmp_path, exclude=["tests"]) == {"top.txt", "src/app.py", "src/lib/util.py"}
+    assert _vector_search(storage, tmp_path, exclude=["*.py"]) == {"top.txt"}
+    assert _vector_search(storage, tmp_path, path_prefix="src", exclude=["src/lib"]) == {"src/app.py"}
+
+def test_long_file_lists_stay_out_of_where(tmp_path, config, open_storage):
+    write_text(tmp_path / "src" / "gen" / "g0.py", 4, "generated")
+    storage = _index(tmp_path, config, open_storage)
+    # Far more files than SQLite accepts variables in one statement
+    storage.manifest.update({
+        str(tmp_path / "src" / "gen" / f"g{i}.py"): FileRecord(1, 1, i, None, [])
+        for i in range(1, 40000)
+    })
+    assert "src/gen/g0.py" in _vector_search(storage, tmp_path)
+
+    dir_filter = DirectoryFilter(SearchFilters.from_args(exclude=["g*.py"]), str(tmp_path), storage.manifest)
+    assert not dir_filter.complete and dir_filter.where is None
+    assert not dir_filter.accepts(str(tmp_path / "src" / "gen" / "g7.py"))
+    assert _vector_search(storage, tmp_path, exclude=["g*.py", "tests"]) == {"top.txt", "src/app.py", "src/lib/util.py"}
+
+def test_indexes_without_directory_fields_list_files(tmp_path, config, open_storage):
+    storage = _index(tmp_path, config, open_storage)
+    storage.manifest.set_meta("metadata_version", "3")
+
+    dir_filter = DirectoryFilter(SearchFilters.from_args(path_prefix="src"), str(tmp_path), storage.manifest)
+    assert dir_filter.where == {"file_path": {"$in": [str(tmp_path / "src" / "app.py"), str(tmp_path / "src" / "lib" / "util.py")]}}
+    assert len(dir_filter.where["file_path"]["$in"]) <= MAX_WHERE_PATHS
+    assert DirectoryFilter(SearchFilters.from_args(path_prefix="docs"), str(tmp_path), storage.manifest).matches_nothing
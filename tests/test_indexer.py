@@ -0,0 +1,157 @@
+import os
+import shutil
+
+import pytest
+
+from conftest import manifest_ids, stored_ids, write_text
+from rag_mcp.indexer import Indexer
+
+@pytest.mark.parametrize("stream_threshold_mb", [0, 16])
+def test_invalid_utf8_after_the_sniffed_start_is_indexed_once(tmp_path, config, open_storage, stream_threshold_mb):
+    config.processing.stream_threshold_mb = stream_threshold_mb
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"valid line\n" * 1000 + b"bad \xff\xfe bytes\n")
+    storage = open_storage(tmp_path)
+    indexer = Indexer(tmp_path, config, storage=storage)
+    indexer.index()
+    assert storage.manifest.get(str(path)) is not None
+    documents = storage.collection.get(include=["documents"])["documents"]
+    assert any("bad \ufffd\ufffd bytes" in document for document in documents)
+
+    storage.embedding_fn.texts.clear()
+    indexer.index()
+    assert indexer.stats["files_indexed"] == 0
+    assert storage.embedding_fn.texts == []
+    _assert_consistent(storage)
+
+class Interrupted(BaseException):
+    """Stands in for the process being killed: nothing in the indexer catches it."""
+
+def _interrupt_after(storage, writes: int):
+    """Let `writes` calls of add_documents through, then abort the run inside the next one."""
+    add_documents = storage.add_documents
+    calls = []
+
+    def interrupted(*args, **kwargs):
+        calls.append(None)
+        if len(calls) > writes:
+            raise Interrupted()
+        return add_documents(*args, **kwargs)
+
+    storage.add_documents = interrupted
+
+def _index_interrupted(target_dir, config, open_storage, writes: int = 2):
+    """Index `target_dir` until the run is interrupted mid-file; returns the closed storage."""
+    storage = open_storage(target_dir)
+    _interrupt_after(storage, writes)
+    with pytest.raises(Interrupted):
+        Indexer(target_dir, config, storage=storage).index()
+    storage.close()
+    return storage
+
+def _assert_consistent(storage):
+    """Every stored chunk belongs to a recorded file and is in the keyword index, and nothing is left journaled."""
+    ids = stored_ids(storage)
+    assert ids == manifest_ids(storage)
+    assert storage.lexical.existing(list(ids)) == ids
+    assert storage.manifest.load_pending(storage.target_dir) == {}
+
+def test_unchanged_files_are_not_embedded_again(tmp_path, config, open_storage):
+    write_text(tmp_path / "a.txt", 20, "a")
+    write_text(tmp_path / "b.txt", 20, "b")
+    Indexer(tmp_path, config, storage=open_storage(tmp_path)).index()
+
+    storage = open_storage(tmp_path)
+    indexer = Indexer(tmp_path, config, storage=storage)
+    indexer.index()
+    assert storage.embedding_fn.texts == []
+    assert indexer.stats["files_scanned"] == 2 and indexer.stats["files_indexed"] == 0
+    _assert_consistent(storage)
+
+def test_deleted_file_is_removed(tmp_path, config, open_storage):
+    write_text(tmp_path / "a.txt", 20, "a")
+    write_text(tmp_path / "b.txt", 20, "b")
+    storage = open_storage(tmp_path)
+    indexer = Indexer(tmp_path, config, storage=storage)
+    indexer.index()
+    b_ids = set(storage.manifest.get(str(tmp_path / "b.txt")).chunk_ids)
+
+    os.remove(tmp_path / "b.txt")
+    indexer.index()
+    assert indexer.stats["files_removed"] == 1
+    assert set(storage.manifest.load()) == {str(tmp_path / "a.txt")}
+    assert not b_ids & stored_ids(storage)
+    assert storage.lexical.existing(list(b_ids)) == set()
+    _assert_consistent(storage)
+
+def test_index_paths_removes_deleted_directory(tmp_path, config, open_storage):
+    write_text(tmp_path / "a.txt", 8, "a")
+    write_text(tmp_path / "sub" / "b.txt", 8, "b")
+    write_text(tmp_path / "sub" / "deep" / "c.txt", 8, "c")
+    storage = open_storage(tmp_path)
+    indexer = Indexer(tmp_path, config, storage=storage)
+    indexer.index()
+
+    shutil.rmtree(tmp_path / "sub")
+    # What a watcher reports for a removed directory
+    indexer.index_paths([str(tmp_path / "sub")])
+    assert set(storage.manifest.load()) == {str(tmp_path / "a.txt")}
+    _assert_consistent(storage)
+
+def test_resume_after_interrupt_does_not_embed_again(tmp_path, config, open_storage):
+    big = str(tmp_path / "big.txt")
+    write_text(big, 80, "big")
+    storage = open_storage(tmp_path)
+    _interrupt_after(storage, 2)
+    with pytest.raises(Interrupted):
+        Indexer(tmp_path, config, storage=storage).index()
+
+    # Two parts were written, the third was journaled but never stored
+    written = stored_ids(storage)
+    pending = storage.manifest.load_pending(str(tmp_path))
+    assert len(written) == 8
+    assert storage.manifest.get(big) is None
+    assert written < set(pending[big].chunk_ids)
+    storage.close()
+
+    storage = open_storage(tmp_path)
+    indexer = Indexer(tmp_path, config, storage=storage)
+    indexer.index()
+    chunk_ids = set(storage.manifest.get(big).chunk_ids)
+    assert written < chunk_ids
+    assert len(storage.embedding_fn.texts) == len(chunk_ids) - len(written)
+    assert indexer.stats["files_indexed"] == 1
+    _assert_consistent(storage)
+
+def test_resume_after_interrupted_file_changed(tmp_path, config, open_storage):
+    big = str(tmp_path / "big.txt")
+    write_text(big, 80, "old")
+    _index_interrupted(tmp_path, config, open_storage)
+
+    write_text(big, 40, "new")
+    storage = open_storage(tmp_path)
+    Indexer(tmp_path, config, storage=storage).index()
+    documents = storage.collection.get(include=["documents"])["documents"]
+    assert documents and not any("old line" in document for document in documents)
+    _assert_consistent(storage)
+
+def test_resume_after_interrupted_file_deleted(tmp_path, config, open_storage):
+    write_text(tmp_path / "a.txt", 8, "a")
+    write_text(tmp_path / "big.txt", 80, "big")
+    _index_interrupted(tmp_path, config, open_storage, writes=3)
+
+    os.remove(tmp_path / "big.txt")
+    storage = open_storage(tmp_path)
+    Indexer(tmp_path, config, storage=storage).index()
+    assert set(storage.manifest.load()) == {str(tmp_path / "a.txt")}
+    _assert_consistent(storage)
+
+def test_index_paths_resumes_interrupted_file(tmp_path, config, open_storage):
+    big = str(tmp_path / "big.txt")
+    write_text(big, 80, "big")
+    _index_interrupted(tmp_path, config, open_storage)
+
+    storage = open_storage(tmp_path)
+    Indexer(tmp_path, config, storage=storage).index_paths([big])
+    assert storage.manifest.get(big) is not None
+    _assert_consistent(storage)
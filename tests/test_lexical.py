@@ -0,0 +1,64 @@
+import math
+from collections import Counter
+
+import pytest
+
+from rag_mcp.lexical import BM25_B, BM25_K1, LexicalIndex, tokenize
+
+DOCS = {
+    "a": "连接池配置 pool size",
+    "b": "数据库连接超时 connection timeout",
+    "c": "配置文件的路径 config path",
+    "d": "日志级别配置 log level",
+    "e": "连接 连接 连接 retry",
+}
+# Unrelated chunks, so that no query term is in more than half of the corpus
+DOCS.update({f"filler{i}": f"unrelated filler text {i}" for i in range(10)})
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add(list(DOCS), list(DOCS.values()), [f"/root/{doc_id}.md" for doc_id in DOCS])
+    yield index
+    index.close()
+
+def _bm25(query, docs):
+    """Plain BM25 over every chunk that matches any query term."""
+    counts = {doc_id: Counter(tokenize(doc)) for doc_id, doc in docs.items()}
+    avg_length = sum(sum(c.values()) for c in counts.values()) / len(counts)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(1 for c in counts.values() if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+        for doc_id, c in counts.items():
+            if term in c:
+                norm = c[term] + BM25_K1 * (1 - BM25_B + BM25_B * sum(c.values()) / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * c[term] * (BM25_K1 + 1) / norm
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+@pytest.mark.parametrize("query", ["连接池", "配置 timeout", "connection retry"])
+def test_ranking_matches_bm25(index, query):
+    hits = index.search(query, 10)
+    expected = _bm25(query, DOCS)
+    assert [hit.doc_id for hit in hits] == [doc_id for doc_id, _ in expected]
+    assert [hit.score for hit in hits] == pytest.approx([score for _, score in expected])
+
+def test_path_filter_streams_past_rejected_chunks(index):
+    hits = index.search("连接", 2, lambda path: not path.endswith("/e.md"))
+    assert [hit.doc_id for hit in hits] == [doc_id for doc_id, _ in _bm25("连接", DOCS) if doc_id != "e"][:2]
+
+def test_common_terms_only_rank_chunks_with_rarer_terms(tmp_path):
+    docs = {f"doc{i}": f"的 数据 item{i}" for i in range(20)}
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add(list(docs), list(docs.values()), ["/root/a.md"] * len(docs))
+    try:
+        hits = index.search("数据 item7", 5)
+        assert [hit.doc_id for hit in hits] == ["doc7"]
+        # Scored on every term, not just the rare one
+        assert hits[0].matched_terms == len(set(tokenize("数据 item7")))
+        # With only common terms the whole corpus is ranked
+        assert len(index.search("数据", 5)) == 5
+    finally:
+        index.close()
@@ -0,0 +1,23 @@
+from rag_mcp.postprocess import select_matches
+
+def _match(file_path: str, content: str) -> dict:
+    return {"file_path": file_path, "content": content}
+
+def test_duplicates_are_dropped_across_files():
+    matches = [_match("a", "same  text"), _match("b", "same text"), _match("c", "other")]
+    kept, dropped = select_matches(matches, 10)
+    assert [m["file_path"] for m in kept] == ["a", "c"]
+    assert dropped == {"duplicates": 1, "collapsed": 0}
+
+def test_collapsed_match_does_not_hide_its_duplicates():
+    matches = [_match("a", "x"), _match("a", "dup"), _match("b", "dup")]
+    kept, dropped = select_matches(matches, 10, max_per_file=1)
+    assert [(m["file_path"], m["content"]) for m in kept] == [("a", "x"), ("b", "dup")]
+    assert dropped == {"duplicates": 0, "collapsed": 1}
+
+def test_seen_is_shared_between_selections():
+    seen = set()
+    select_matches([_match("a", "x")], 10, seen=seen)
+    kept, dropped = select_matches([_match("b", "x"), _match("b", "y")], 10, seen=seen)
+    assert [m["content"] for m in kept] == ["y"]
+    assert dropped["duplicates"] == 1
@@ -0,0 +1,37 @@
+import numpy as np
+
+from conftest import FakeEmbeddingFunction, write_text
+from rag_mcp import storage as storage_module
+from rag_mcp.indexer import Indexer
+from rag_mcp.registry import StorageRegistry
+
+def test_query_embeddings_outlive_the_process(tmp_path, config, open_storage, monkeypatch):
+    target_dir = tmp_path / "docs"
+    write_text(target_dir / "a.txt", 4, "alpha")
+    storage = open_storage(target_dir)
+    Indexer(target_dir, config, storage=storage).index()
+    storage.close()
+    monkeypatch.setattr(storage_module, "RemoteEmbeddingFunction", FakeEmbeddingFunction)
+    dirs = [str(target_dir)]
+
+    registry = StorageRegistry(str(tmp_path / "config.yaml"))
+    try:
+        embeddings, hits = registry.embed_queries(["alpha", "beta"], dirs)
+        assert hits == [False, False]
+        assert registry._query_embedding_fn.texts == ["alpha", "beta"]
+        # Now from the in-process cache
+        cached, hits = registry.embed_queries(["alpha"], dirs)
+        assert hits == [True] and cached[0] is embeddings[0]
+    finally:
+        registry.close()
+
+    # A restarted server finds them in the index's embedding cache
+    registry = StorageRegistry(str(tmp_path / "config.yaml"))
+    try:
+        restarted, hits = registry.embed_queries(["beta", "gamma"], dirs)
+        assert hits == [True, False]
+        assert registry._query_embedding_fn.texts == ["gamma"]
+        # Stored as float32
+        assert np.allclose(restarted[0], embeddings[1])
+    finally:
+        registry.close()
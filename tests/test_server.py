@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import write_text
+from rag_mcp import server
+from rag_mcp.indexer import Indexer
+from rag_mcp.storage import RAGStorage
+
+@pytest.fixture
+def serve(tmp_path, config, open_storage, monkeypatch):
+    """Index directories of tmp_path and point the server at them, searching by keyword only."""
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text("search:\n  mode: lexical\n", encoding="utf-8")
+    monkeypatch.setenv("RAG_MCP_CONFIG", str(config_path))
+    monkeypatch.delenv("RAG_MCP_SERVE_DIR", raising=False)
+    monkeypatch.setattr(server, "_registry", None)
+
+    def serve(*names: str):
+        dirs = []
+        for name in names:
+            target_dir = tmp_path / name
+            write_text(target_dir / "a.txt", 8, "alpha")
+            storage = open_storage(target_dir)
+            Indexer(target_dir, config, storage=storage).index()
+            storage.close()
+            dirs.append(str(target_dir))
+        monkeypatch.setattr(server.StateManager, "load_state", staticmethod(lambda: list(dirs)))
+        return dirs
+
+    yield serve
+    server.get_registry().close()
+
+def _fail_in(monkeypatch, failing_dir: str):
+    rank_matches = server._rank_matches
+
+    def rank_or_fail(storage, *args):
+        if storage.target_dir == failing_dir:
+            raise RuntimeError("index is corrupt")
+        return rank_matches(storage, *args)
+
+    monkeypatch.setattr(server, "_rank_matches", rank_or_fail)
+
+def test_search_fails_when_every_directory_fails(serve, monkeypatch):
+    target_dir, = serve("docs")
+    _fail_in(monkeypatch, target_dir)
+    response = json.loads(server.search_rag_impl("alpha line"))
+    assert response["code"] == 500
+    assert "index is corrupt" in response["message"]
+
+def test_search_reports_failed_directories(serve, monkeypatch):
+    failing_dir, other_dir = serve("broken", "docs")
+    _fail_in(monkeypatch, failing_dir)
+    response = json.loads(server.search_rag_impl("alpha line"))
+    assert response["code"] == 200
+    assert response["data"]["stats"]["failed_dirs"] == {failing_dir: "index is corrupt"}
+    assert {info["file_path"] for info in response["data"]["file_info"]} == {os.path.join(other_dir, "a.txt")}
+
+def test_search_keeps_event_loop_responsive_while_storage_opens(serve, monkeypatch):
+    target_dir, = serve("docs")
+    monkeypatch.setenv("RAG_MCP_SERVE_DIR", target_dir)
+
+    # A cold index, opened by pre-warming when the search arrives
+    opening = threading.Event()
+    initialize = RAGStorage.initialize
+
+    def slow_initialize(self):
+        opening.set()
+        time.sleep(1.0)
+        initialize(self)
+
+    monkeypatch.setattr(RAGStorage, "initialize", slow_initialize)
+    registry = server.get_registry()
+    prewarm = threading.Thread(target=registry.get_storage, args=(target_dir,))
+    prewarm.start()
+    assert opening.wait(5)
+
+    async def search_and_measure():
+        gaps = []
+
+        async def tick():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - start)
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0.05)
+        response = await server.search_rag_async("alpha line")
+        ticker.cancel()
+        return response, max(gaps)
+
+    try:
+        response, worst_gap = asyncio.run(search_and_measure())
+    finally:
+        prewarm.join()
+    assert json.loads(response)["code"] == 200
+    assert worst_gap < 0.3
+
+def test_directory_with_hung_search_is_skipped_until_it_finishes(serve, tmp_path, monkeypatch):
+    hung_dir, other_dir = serve("hung", "docs")
+    (tmp_path / "config.yaml").write_text("search:\n  mode: lexical\n  dir_timeout: 0.3\n", encoding="utf-8")
+    release = threading.Event()
+    searched = []
+    rank_matches = server._rank_matches
+
+    def rank_or_hang(storage, *args):
+        searched.append(storage.target_dir)
+        if storage.target_dir == hung_dir:
+            release.wait(10)
+        return rank_matches(storage, *args)
+
+    monkeypatch.setattr(server, "_rank_matches", rank_or_hang)
+    try:
+        response = json.loads(server.search_rag_impl("alpha line"))
+        assert response["data"]["stats"]["timed_out_dirs"] == [hung_dir]
+
+        # Neither the sync nor the async tool starts another search in it
+        start = time.perf_counter()
+        responses = [json.loads(server.search_rag_impl("alpha line")), json.loads(asyncio.run(server.search_rag_async("alpha line")))]
+        assert time.perf_counter() - start < 0.3
+        for response in responses:
+            assert response["data"]["stats"]["timed_out_dirs"] == [hung_dir]
+        assert searched.count(hung_dir) == 1
+    finally:
+        release.set()
+
+    deadline = time.time() + 5
+    while server._abandoned and time.time() < deadline:
+        time.sleep(0.01)
+    response = json.loads(server.search_rag_impl("alpha line"))
+    assert "timed_out_dirs" not in response["data"]["stats"]
+    assert searched.count(hung_dir) == 2
+
+def test_read_raw_file_reports_the_offset_it_read_from(serve, tmp_path):
+    serve()
+    path = tmp_path / "cjk.txt"
+    path.write_text("中文字", encoding="utf-8")
+    # Byte 1 is inside 中, so reading starts at the next character
+    data = json.loads(server.read_raw_file_impl(str(path), 1, 3))["data"]
+    assert (data["raw_content"], data["offset"], data["next_offset"]) == ("文", 3, 6)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from rag_mcp.vectors import QuantizedVectorStore
+
+DIM = 32
+
+def _vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+def _exact(vectors: np.ndarray, ids, query: np.ndarray, n_results: int):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:n_results]
+    return [ids[i] for i in order], distances[order]
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    def open_store(kind: str, keep_full: bool = True, **kwargs) -> QuantizedVectorStore:
+        store = QuantizedVectorStore(str(tmp_path / "vectors"), kind, keep_full=keep_full, **kwargs)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_quantized_vectors_round_trip(open_store, kind):
+    vectors = _vectors(50)
+    ids = [f"c{i}" for i in range(50)]
+    store = open_store(kind, keep_full=False)
+    store.add(ids, vectors)
+    stored = store.get(ids)
+    # int8 keeps one scale per vector, so the error is at most half a step of max|x| / 127
+    tolerance = 1e-2 if kind == "float16" else np.abs(vectors).max() / 127
+    assert np.allclose(np.stack([stored[i] for i in ids]), vectors, atol=tolerance)
+    assert store._codes.dtype == (np.float16 if kind == "float16" else np.int8)
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_rerank_returns_the_exact_float32_ranking(open_store, kind):
+    vectors = _vectors(2000)
+    ids = [f"c{i}" for i in range(len(vectors))]
+    store = open_store(kind)
+    store.add(ids, vectors)
+    queries = _vectors(20, seed=1)
+    for query, hits in zip(queries, store.search_batch(queries, 10)):
+        expected_ids, expected_distances = _exact(vectors, ids, query, 10)
+        assert [doc_id for doc_id, _ in hits] == expected_ids
+        assert [distance for _, distance in hits] == pytest.approx(expected_distances, rel=1e-5)
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_quantized_scan_without_rerank_keeps_recall(open_store, kind):
+    vectors = _vectors(2000)
+    ids = [f"c{i}" for i in range(len(vectors))]
+    store = open_store(kind, keep_full=False)
+    store.add(ids, vectors)
+    queries = _vectors(20, seed=1)
+    found = 0
+    for query, hits in zip(queries, store.search_batch(queries, 10)):
+        distances = [distance for _, distance in hits]
+        assert distances == sorted(distances)
+        found += len({doc_id for doc_id, _ in hits} & set(_exact(vectors, ids, query, 10)[0]))
+    assert found / (10 * len(queries)) >= 0.9
+
+def test_allowed_restricts_the_search(open_store):
+    vectors = _vectors(100)
+    ids = [f"c{i}" for i in range(100)]
+    store = open_store("int8")
+    store.add(ids, vectors)
+    allowed = set(ids[::3])
+    hits = store.search(vectors[1], 5, allowed=allowed)
+    assert {doc_id for doc_id, _ in hits} <= allowed
+    assert [doc_id for doc_id, _ in hits] == _exact(vectors[::3], ids[::3], vectors[1], 5)[0]
+
+@pytest.mark.parametrize("kind", ["float16", "int8"])
+def test_ids_stay_aligned_after_delete_upsert_and_reopen(open_store, kind):
+    vectors = _vectors(40)
+    ids = [f"c{i}" for i in range(40)]
+    store = open_store(kind, initial_capacity=8)
+    store.add(ids[:30], vectors[:30])
+    store.delete(ids[:10])
+    # New ids reuse the deleted rows, existing ids keep theirs and get new vectors
+    store.add(ids[30:], vectors[30:])
+    updated = _vectors(5, seed=2)
+    store.add(ids[20:25], updated)
+    expected = dict(zip(ids[10:], vectors[10:]))
+    expected.update(zip(ids[20:25], updated))
+    rows = dict(store._rows)
+    assert sorted(rows.values()) == list(range(30))
+    store.close()
+
+    store = open_store(kind)
+    assert store._rows == rows
+    assert store.count() == len(expected) == 30
+    assert store.get(ids[:10]) == {}
+    stored = store.get(list(expected))
+    for doc_id, vector in expected.items():
+        assert np.array_equal(stored[doc_id], vector)
+        assert store.search(vector, 1)[0][0] == doc_id
+    table = dict(store._conn.execute("SELECT id, row FROM rows").fetchall())
+    assert table == rows
+    assert all(store._ids[row] == doc_id for doc_id, row in table.items())
+
+def test_reopening_with_another_quantization_fails(open_store):
+    store = open_store("int8")
+    store.add(["c0"], _vectors(1))
+    with pytest.raises(ValueError):
+        QuantizedVectorStore(store.path, "float16")
+
+def test_store_built_without_full_vectors_cannot_rerank(open_store):
+    store = open_store("float16", keep_full=False)
+    store.add(["c0"], _vectors(1))
+    store.close()
+    assert not open_store("float16", keep_full=True).keep_full
@@ -0,0 +1,35 @@
+import os
+
+from rag_mcp.classify import IgnoreMatcher
+from rag_mcp.watcher import PollingBackend, _iter_dirs
+
+def _write(path: str, text: str = "x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def _tree(root: str):
+    _write(os.path.join(root, "src", "app.py"))
+    _write(os.path.join(root, "node_modules", "pkg", "lib", "index.js"))
+    _write(os.path.join(root, "build", "out.txt"))
+    _write(os.path.join(root, "src", "app.lock"))
+    _write(os.path.join(root, ".gitignore"), "build/\n")
+
+def test_iter_dirs_skips_ignored_directories(tmp_path):
+    root = str(tmp_path)
+    _tree(root)
+    ignore = IgnoreMatcher(root, ["node_modules/", "*.lock"])
+    dirs = {os.path.relpath(path, root) for path, _ in _iter_dirs(root, ignore)}
+    assert dirs == {".", "src"}
+
+def test_polling_skips_ignored_files_and_sees_rule_changes(tmp_path):
+    root = str(tmp_path)
+    _tree(root)
+    backend = PollingBackend(root, 0, IgnoreMatcher(root, ["node_modules/", "*.lock"]))
+    assert {os.path.relpath(path, root) for path in backend._snapshot} == {".gitignore", os.path.join("src", "app.py")}
+
+    _write(os.path.join(root, "node_modules", "pkg", "other.js"))
+    _write(os.path.join(root, ".gitignore"), "")
+    changed = {os.path.relpath(path, root) for path in backend.poll(0)}
+    # build/ is no longer ignored; node_modules/ still is
+    assert changed == {".gitignore", os.path.join("build", "out.txt")}